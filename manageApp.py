@@ -48,6 +48,7 @@ import fileinput
 import re
 from scripts.process_dc_env import pythonGetEnv
 from scripts.sharedsettings import SharedSettings
+from scripts.dcsettings import getSettingsValue, getWorkspaceBaseDir
 # ==============================================================================
 """
 This script provides an administrative interface to a customers application set
@@ -62,24 +63,6 @@ __license__ = "GPL"
 __status__ = "Development"
 # ==============================================================================
 
-def getSettingsValue(theKey):
-    """Read the ~/.dcConfig/settings file."""
-    baseSettingsFile = expanduser("~") + "/.dcConfig/settings"
-    try:
-        with open(baseSettingsFile, 'r') as f:
-            lines = [line.rstrip('\n') for line in f]
-    except IOError as e:
-        return None
-
-    retValue = None
-    for aLine in lines:
-        if re.search("^"+theKey+"=", aLine):
-            retValue = aLine.split("=")[1].replace('"', '')
-            break
-
-    return retValue
-
-
 def getCommonSharedDir():
     """Get the common shard directory."""
     checkForDCInternal = getSettingsValue("dcInternal")
@@ -1256,23 +1239,13 @@ def getBaseDirectory(workspaceName=None):
               "development.")
         sys.exit(1)
 
-    if os.path.isfile(baseSettingsDir + "/baseDirectory"):
-        with open(baseSettingsDir + "/baseDirectory") as f:
-            lines = [line.rstrip('\n') for line in f]
-
-        if not workspaceName:
-            for item in lines:
-                if "CURRENT_WORKSPACE" in item:
-                    lineArray = item.split('=')
-                    workspaceName = '_' + lineArray[1] + '_BASE_CUSTOMER_DIR'
-
-                if workspaceName in item:
-                    anotherLineArray = item.split('=')
-                    if anotherLineArray[1][-1] == '/':
-                        developmentBaseDir = anotherLineArray[1]
-                    else:
-                        developmentBaseDir = anotherLineArray[1] + '/'
-                    return(developmentBaseDir)
+    if not workspaceName:
+        # the base directory of the current workspace
+        developmentBaseDir = getWorkspaceBaseDir()
+        if developmentBaseDir:
+            if developmentBaseDir[-1] != '/':
+                developmentBaseDir += '/'
+            return(developmentBaseDir)
 
     if os.path.isfile(baseSettingsDir + "/settings"):
         # get the base directory from the settings file
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Docstring for dcsettings.py. This module reads the KEY=VALUE files in ~/.dcConfig,
+the settings file and the baseDirectory file, for process_dc_env.py, manageApp.py
+and instanceinfo.py.
+
+Each file is read into a dict the first time a value is asked for and that dict
+is used after that, so it is read once for each process rather than once for
+each value.  A file that has changed since it was read (manageApp.py adding a
+workspace to baseDirectory for instance) is read again.
+"""
+
+import os
+from os.path import expanduser
+
+# ==============================================================================
+__version__ = "0.1"
+
+__copyright__ = "Copyright 2017, devops.center"
+__credits__ = ["Bob Lozano", "Gregg Jensen"]
+__license__ = ' \
+   # Copyright 2014-2017 devops.center llc                                    \
+   #                                                                          \
+   # Licensed under the Apache License, Version 2.0 (the "License");          \
+   # you may not use this file except in compliance with the License.         \
+   # You may obtain a copy of the License at                                  \
+   #                                                                          \
+   #   http://www.apache.org/licenses/LICENSE-2.0                             \
+   #                                                                          \
+   # Unless required by applicable law or agreed to in writing, software      \
+   # distributed under the License is distributed on an "AS IS" BASIS,        \
+   # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. \
+   # See the License for the specific language governing permissions and      \
+   # limitations under the License.                                           \
+   # '
+__status__ = "Development"
+
+SETTINGS_FILE = "~/.dcConfig/settings"
+
+BASE_DIRECTORY_FILE = "~/.dcConfig/baseDirectory"
+
+# the values read from each file along with the file's mtime and size when it was read
+configFiles = {}
+
+# ==============================================================================
+
+
+def parseConfigLine(aLine):
+    """Return the key and value on a KEY=VALUE line, or None for a blank line, a comment or a line without an =."""
+    aLine = aLine.strip()
+    if not aLine or aLine.startswith("#") or "=" not in aLine:
+        return None
+
+    key, value = aLine.split("=", 1)
+    key = key.strip()
+    if key.startswith("export "):
+        key = key[len("export "):].strip()
+
+    # only the = that separates the key is special, the value can have more of them in it
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in ("'", '"'):
+        value = value[1:-1]
+
+    return key, value
+
+
+def loadConfigFile(aPath):
+    """Return the values in a KEY=VALUE file as a dict, only reading the file again when it changes.
+
+    A file that isn't there has no values.  When a key is in the file more than once the first one is used.
+    """
+    aPath = expanduser(aPath)
+    try:
+        fileStat = os.stat(aPath)
+    except OSError:
+        return {}
+    fileVersion = (fileStat.st_mtime, fileStat.st_size)
+
+    cached = configFiles.get(aPath)
+    if cached is None or cached[0] != fileVersion:
+        values = {}
+        try:
+            with open(aPath) as configFile:
+                for aLine in configFile:
+                    keyValue = parseConfigLine(aLine)
+                    if keyValue and keyValue[0] not in values:
+                        values[keyValue[0]] = keyValue[1]
+        except IOError:
+            return {}
+        cached = (fileVersion, values)
+        configFiles[aPath] = cached
+
+    return cached[1]
+
+
+def getSettings():
+    """Return the values in the ~/.dcConfig/settings file."""
+    return loadConfigFile(SETTINGS_FILE)
+
+
+def getSettingsValue(theKey):
+    """Return the value of a key in the ~/.dcConfig/settings file, or None if it isn't there."""
+    return getSettings().get(theKey)
+
+
+def getBaseDirectorySettings():
+    """Return the values in the ~/.dcConfig/baseDirectory file."""
+    return loadConfigFile(BASE_DIRECTORY_FILE)
+
+
+def getWorkspaceBaseDir(workspaceName=None):
+    """Return the base directory for a workspace, or the current workspace if one isn't given, or None."""
+    baseDirectorySettings = getBaseDirectorySettings()
+    if not workspaceName:
+        workspaceName = baseDirectorySettings.get("CURRENT_WORKSPACE")
+        if not workspaceName:
+            return None
+
+    return baseDirectorySettings.get("_" + workspaceName + "_BASE_CUSTOMER_DIR")
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+Docstring for envcache.py. This module keeps the environment that process_dc_env.py
+resolves for a workspace, app and env so that the deployenv.sh, start-dc-containers.sh,
+paws, ... calls that follow each other don't all have to read the settings files,
+walk the base directory and source the generated env file with bash again.
+
+Each entry is one json file that holds the arguments it was resolved for, the
+mtime and size of each of the files and directories that went into it, the
+variables from the environment the env file used, the resolved environment and
+the output that process_dc_env.py prints for it.
+An entry is used only while none of those have changed, so there is no TTL:
+re-running deployenv.sh or manageApp.py makes it stale on its own.
+"""
+
+import os
+import sys
+import json
+import hashlib
+from os.path import expanduser
+
+# ==============================================================================
+__version__ = "0.1"
+
+__copyright__ = "Copyright 2017, devops.center"
+__credits__ = ["Bob Lozano", "Gregg Jensen"]
+__license__ = ' \
+   # Copyright 2014-2017 devops.center llc                                    \
+   #                                                                          \
+   # Licensed under the Apache License, Version 2.0 (the "License");          \
+   # you may not use this file except in compliance with the License.         \
+   # You may obtain a copy of the License at                                  \
+   #                                                                          \
+   #   http://www.apache.org/licenses/LICENSE-2.0                             \
+   #                                                                          \
+   # Unless required by applicable law or agreed to in writing, software      \
+   # distributed under the License is distributed on an "AS IS" BASIS,        \
+   # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. \
+   # See the License for the specific language governing permissions and      \
+   # limitations under the License.                                           \
+   # '
+__status__ = "Development"
+
+# bump this when the layout of an entry changes so the old entries are just ignored
+CACHE_FORMAT_VERSION = 5
+
+DEFAULT_CACHE_DIR = "~/.dcConfig/cache/dcenv"
+
+# ==============================================================================
+
+
+def getFileFingerprint(aPath):
+    """Return the mtime and size of a file or directory, or None if it isn't there."""
+    try:
+        fileStat = os.stat(aPath)
+    except OSError:
+        return None
+
+    return [fileStat.st_mtime, fileStat.st_size]
+
+
+def toNativeStrings(aDict):
+    """Return a dict with the unicode strings json gives back on python 2 turned into str."""
+    if sys.version_info[0] >= 3:
+        return aDict
+
+    return dict((key.encode('utf-8'), value if isinstance(value, str) else value.encode('utf-8'))
+                for key, value in aDict.items())
+
+
+class ResolvedEnvCache:
+
+    def __init__(self, cacheDir=None, refresh=False):
+        """Construct an instance of the ResolvedEnvCache class."""
+        self.cacheDir = expanduser(cacheDir or DEFAULT_CACHE_DIR)
+        # when refresh is set the entries are never read, but new ones are still written
+        self.refresh = refresh
+
+    def createKey(self, envList, generateEnvFiles=False):
+        """Return the key that identifies an entry: the arguments and where dcUTILS comes from."""
+        key = {"Args": sorted([k, v] for k, v in envList.items()), "GenerateEnvFiles": bool(generateEnvFiles),
+               "dcUTILS": os.getenv("dcUTILS") or ''}
+        if not key["dcUTILS"]:
+            # without dcUTILS in the environment it can come from the directory this is run from
+            key["WorkingDir"] = os.getcwd()
+
+        return key
+
+    def getEntryPath(self, key):
+        """Return the path of the file that holds the entry for the key."""
+        keyString = json.dumps(key, sort_keys=True)
+        return os.path.join(self.cacheDir, hashlib.sha1(keyString.encode('utf-8')).hexdigest() + ".json")
+
+    def read(self, key):
+        """Return the entry for the key with its EnvList and Output, or None if there isn't a usable entry."""
+        if self.refresh:
+            return None
+
+        try:
+            with open(self.getEntryPath(key)) as entryFile:
+                entry = json.load(entryFile)
+        except (IOError, ValueError):
+            return None
+
+        if entry.get("Version") != CACHE_FORMAT_VERSION or entry.get("Key") != json.loads(json.dumps(key)):
+            return None
+
+        # the entry is only good while everything it was resolved from is just as it was
+        for aPath, fingerprint in entry.get("Sources", {}).items():
+            if getFileFingerprint(aPath) != fingerprint:
+                return None
+
+        # as are the variables the env file used from the environment.  Nothing is cached when bash sourced it
+        # as it could have used anything there
+        environment = entry.get("Environment")
+        if not isinstance(environment, dict):
+            return None
+        for name, value in environment.items():
+            if os.environ.get(name) != value:
+                return None
+
+        entry["EnvList"] = toNativeStrings(entry["EnvList"])
+        if sys.version_info[0] < 3 and entry.get("Output") is not None:
+            entry["Output"] = entry["Output"].encode('utf-8')
+        return entry
+
+    def write(self, key, sourceFiles, envList, environment, output=None):
+        """Write the entry for the key, sourceFiles has the fingerprint of each file taken when it was read."""
+        # only needed when an entry is written, which isn't on the path that uses the cache
+        import tempfile
+
+        entry = {"Version": CACHE_FORMAT_VERSION, "Key": key, "Sources": sourceFiles, "EnvList": envList,
+                 "Environment": environment, "Output": output}
+
+        tmpPath = None
+        try:
+            if not os.path.isdir(self.cacheDir):
+                os.makedirs(self.cacheDir)
+            # written to a temporary file and moved into place so an entry that is only partly written is never read
+            fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir, prefix=".entry.")
+            with os.fdopen(fd, 'w') as entryFile:
+                json.dump(entry, entryFile)
+            os.rename(tmpPath, self.getEntryPath(key))
+        except (IOError, OSError) as e:
+            # not being able to cache isn't a reason to fail, it will just be resolved again next time
+            sys.stderr.write("WARNING: could not write the env cache in {}: {}\n".format(self.cacheDir, e))
+            if tmpPath and os.path.exists(tmpPath):
+                os.remove(tmpPath)
+
+    def clear(self):
+        """Remove all the entries in the cache directory."""
+        if not os.path.isdir(self.cacheDir):
+            return
+
+        for aFile in os.listdir(self.cacheDir):
+            if aFile.endswith(".json"):
+                os.remove(os.path.join(self.cacheDir, aFile))
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
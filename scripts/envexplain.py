@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Docstring for envexplain.py. This module explains where the values in a resolved
+environment come from and shows the differences between two of them, for
+process_dc_env.py --explain and --diff.
+
+An explanation lists each key with its resolved value, the env file layer that
+set it and the layers before that it overrode.  A key that isn't in any of the
+layers was put in by process_dc_env.py itself, from the arguments, the
+~/.dcConfig settings or the app's .dcDirMap.cnf.
+"""
+
+# ==============================================================================
+__version__ = "0.1"
+
+__copyright__ = "Copyright 2017, devops.center"
+__credits__ = ["Bob Lozano", "Gregg Jensen"]
+__license__ = ' \
+   # Copyright 2014-2017 devops.center llc                                    \
+   #                                                                          \
+   # Licensed under the Apache License, Version 2.0 (the "License");          \
+   # you may not use this file except in compliance with the License.         \
+   # You may obtain a copy of the License at                                  \
+   #                                                                          \
+   #   http://www.apache.org/licenses/LICENSE-2.0                             \
+   #                                                                          \
+   # Unless required by applicable law or agreed to in writing, software      \
+   # distributed under the License is distributed on an "AS IS" BASIS,        \
+   # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. \
+   # See the License for the specific language governing permissions and      \
+   # limitations under the License.                                           \
+   # '
+__status__ = "Development"
+
+# ==============================================================================
+
+
+def explainEnv(resolvedEnv, keyHistory):
+    """Return the lines explaining where each key in the resolved env got its value.
+
+    keyHistory is what envlayers.getKeyHistory returns for the layers of the env.
+    """
+    lines = []
+    for key in keyHistory:
+        settings = keyHistory[key]
+        if key in resolvedEnv:
+            lines.append("{}={}".format(key, resolvedEnv[key]))
+        else:
+            lines.append("{} is not in the resolved env, deployenv.sh needs to be run again".format(key))
+
+        # the layers are shown with the value as it is in the file, before any ${VAR} in it is expanded
+        lastName, lastValue = settings[-1]
+        lines.append("    set in {}: {}".format(lastName, lastValue))
+        for name, value in reversed(settings[:-1]):
+            lines.append("    overrides {}: {}".format(name, value))
+
+    for key in sorted(resolvedEnv):
+        if key not in keyHistory:
+            lines.append("{}={}".format(key, resolvedEnv[key]))
+            lines.append("    set by process_dc_env.py")
+
+    return lines
+
+
+def diffEnvs(firstName, firstEnv, secondName, secondEnv):
+    """Return the lines showing the keys only in one of two resolved envs and the ones with different values."""
+    lines = []
+    onlyInFirst = sorted(key for key in firstEnv if key not in secondEnv)
+    onlyInSecond = sorted(key for key in secondEnv if key not in firstEnv)
+    different = sorted(key for key in firstEnv if key in secondEnv and firstEnv[key] != secondEnv[key])
+
+    if onlyInFirst:
+        lines.append("only in {}:".format(firstName))
+        lines.extend("    {}={}".format(key, firstEnv[key]) for key in onlyInFirst)
+    if onlyInSecond:
+        lines.append("only in {}:".format(secondName))
+        lines.extend("    {}={}".format(key, secondEnv[key]) for key in onlyInSecond)
+    if different:
+        lines.append("different:")
+        for key in different:
+            lines.append("    {}".format(key))
+            lines.append("        {}: {}".format(firstName, firstEnv[key]))
+            lines.append("        {}: {}".format(secondName, secondEnv[key]))
+
+    if not lines:
+        lines.append("{} and {} are the same".format(firstName, secondName))
+
+    return lines
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
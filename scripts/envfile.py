@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+"""
+Docstring for envfile.py. This module reads the dcEnv .sh and .env files that
+deployenv.sh generates and works out what they set without starting bash.
+
+The files are lines of KEY=VALUE (with export in front in the .sh file), where the
+value can be in single or double quotes and can use ${VAR} or $VAR to refer to a
+variable set on an earlier line or in the environment.  These are evaluated the
+way bash would, in order.  Anything else bash could do with the line (command
+substitution, ${VAR:-default}, ~, more than one assignment on a line, ...) makes
+evaluateEnvFile raise a ValueError, and sourceEnvFile is there to have bash do it.
+"""
+
+import os
+import re
+import socket
+from collections import OrderedDict
+
+# ==============================================================================
+__version__ = "0.1"
+
+__copyright__ = "Copyright 2017, devops.center"
+__credits__ = ["Bob Lozano", "Gregg Jensen"]
+__license__ = ' \
+   # Copyright 2014-2017 devops.center llc                                    \
+   #                                                                          \
+   # Licensed under the Apache License, Version 2.0 (the "License");          \
+   # you may not use this file except in compliance with the License.         \
+   # You may obtain a copy of the License at                                  \
+   #                                                                          \
+   #   http://www.apache.org/licenses/LICENSE-2.0                             \
+   #                                                                          \
+   # Unless required by applicable law or agreed to in writing, software      \
+   # distributed under the License is distributed on an "AS IS" BASIS,        \
+   # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. \
+   # See the License for the specific language governing permissions and      \
+   # limitations under the License.                                           \
+   # '
+__status__ = "Development"
+
+# the start of an assignment, with or without the export in front of it
+ASSIGNMENT_PATTERN = re.compile(r"(export[ \t]+)?([A-Za-z_][A-Za-z0-9_]*)=")
+
+# a variable name after a $, either on its own or in braces
+NAME_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+# characters that mean something to bash when they aren't quoted, so the line isn't just an assignment
+UNQUOTED_SPECIAL_CHARS = "`;&|<>()"
+
+# the characters that a backslash escapes inside double quotes, before any other character it is kept
+DOUBLE_QUOTE_ESCAPES = "$`\"\\"
+
+# the variables bash sets in every shell without exporting them, so they aren't in the environment to look up.
+# HOSTNAME is worked out the same way bash does, the others can't be and make the file need bash
+BASH_SHELL_VARIABLES = ("HOSTNAME", "HOSTTYPE", "OSTYPE", "MACHTYPE", "BASH", "BASH_VERSION", "BASHPID", "PPID",
+                        "UID", "EUID", "GROUPS", "RANDOM", "SECONDS", "LINENO", "SHELLOPTS", "BASHOPTS", "IFS")
+
+# ==============================================================================
+
+
+class EnvFileEvaluator:
+
+    def __init__(self, text, environ=None):
+        """Construct an instance of the EnvFileEvaluator class."""
+        self.text = text
+        self.pos = 0
+        self.environ = os.environ if environ is None else environ
+        # the variables the file assigned, in the order they were first assigned
+        self.assigned = OrderedDict()
+        self.exported = set()
+        # the variables used from the environment, and their value there (None if they weren't set)
+        self.referenced = {}
+
+    def fail(self, message):
+        """Stop evaluating because of something bash would have to do."""
+        lineNumber = self.text.count("\n", 0, self.pos) + 1
+        raise ValueError("line {}: {}".format(lineNumber, message))
+
+    def peek(self, offset=0):
+        """Return the character at the current position plus the offset, or '' at the end."""
+        index = self.pos + offset
+        return self.text[index] if index < len(self.text) else ''
+
+    def lookup(self, name):
+        """Return the value of a variable, from the file if it was set there already and otherwise the environment."""
+        if name in self.assigned:
+            return self.assigned[name]
+
+        value = self.environ.get(name)
+        self.referenced[name] = value
+        if value is None and name in BASH_SHELL_VARIABLES:
+            if name != "HOSTNAME":
+                self.fail("${} is set by bash".format(name))
+            return socket.gethostname()
+        return value or ''
+
+    def readExpansion(self):
+        """Read the $NAME or ${NAME} at the current position and return its value."""
+        self.pos += 1
+        if self.peek() == "{":
+            aMatch = NAME_PATTERN.match(self.text, self.pos + 1)
+            if not aMatch or self.peek(aMatch.end() - self.pos) != "}":
+                self.fail("only ${NAME} is handled inside braces")
+            self.pos = aMatch.end() + 1
+            return self.lookup(aMatch.group(0))
+
+        aMatch = NAME_PATTERN.match(self.text, self.pos)
+        if aMatch:
+            self.pos = aMatch.end()
+            return self.lookup(aMatch.group(0))
+
+        nextChar = self.peek()
+        if nextChar == '' or nextChar in " \t\n\"/:@.,-=+%":
+            # a $ that isn't followed by a name is just a $
+            return "$"
+
+        self.fail("${} is not handled".format(nextChar))
+
+    def readSingleQuoted(self):
+        """Read a value in single quotes, nothing is expanded in them."""
+        end = self.text.find("'", self.pos + 1)
+        if end < 0:
+            self.fail("the single quote is not closed")
+        value = self.text[self.pos + 1:end]
+        self.pos = end + 1
+        return value
+
+    def readDoubleQuoted(self):
+        """Read a value in double quotes, expanding the variables in it."""
+        self.pos += 1
+        value = []
+        while True:
+            aChar = self.peek()
+            if aChar == '':
+                self.fail("the double quote is not closed")
+            elif aChar == '"':
+                self.pos += 1
+                return ''.join(value)
+            elif aChar == "\\":
+                nextChar = self.peek(1)
+                if nextChar == "\n":
+                    # a line continuation, both go away
+                    pass
+                elif nextChar in DOUBLE_QUOTE_ESCAPES and nextChar:
+                    value.append(nextChar)
+                else:
+                    value.append(aChar + nextChar)
+                self.pos += 2
+            elif aChar == "$":
+                value.append(self.readExpansion())
+            elif aChar == "`":
+                self.fail("command substitution is not handled")
+            else:
+                value.append(aChar)
+                self.pos += 1
+
+    def readValue(self):
+        """Read the value of an assignment up to the first space or end of line that isn't quoted."""
+        value = []
+        start = self.pos
+        while True:
+            aChar = self.peek()
+            if aChar == '' or aChar in " \t\n":
+                return ''.join(value)
+            elif aChar == "'":
+                value.append(self.readSingleQuoted())
+            elif aChar == '"':
+                value.append(self.readDoubleQuoted())
+            elif aChar == "\\":
+                nextChar = self.peek(1)
+                if nextChar != "\n":
+                    value.append(nextChar)
+                self.pos += 2
+            elif aChar == "$":
+                value.append(self.readExpansion())
+            elif aChar == "~" and (self.pos == start or self.peek(-1) == ":"):
+                self.fail("~ expansion is not handled")
+            elif aChar in UNQUOTED_SPECIAL_CHARS:
+                self.fail("{} is not handled outside of quotes".format(aChar))
+            else:
+                value.append(aChar)
+                self.pos += 1
+
+    def skipToNextLine(self):
+        """Skip the spaces and any comment after an assignment, anything else on the line can't be handled."""
+        while self.peek() in (" ", "\t"):
+            self.pos += 1
+        if self.peek() == "#":
+            end = self.text.find("\n", self.pos)
+            self.pos = len(self.text) if end < 0 else end
+        if self.peek() not in ("", "\n"):
+            self.fail("only one assignment is handled on a line")
+        self.pos += 1
+
+    def evaluate(self):
+        """Evaluate the whole file and return the variables it leaves in the environment, in the order set."""
+        while self.pos < len(self.text):
+            while self.peek() in (" ", "\t", "\n"):
+                self.pos += 1
+            if self.peek() == '':
+                break
+            if self.peek() == "#":
+                self.skipToNextLine()
+                continue
+
+            aMatch = ASSIGNMENT_PATTERN.match(self.text, self.pos)
+            if not aMatch:
+                self.fail("only KEY=VALUE lines are handled")
+            self.pos = aMatch.end()
+            name = aMatch.group(2)
+            self.assigned[name] = self.readValue()
+            if aMatch.group(1):
+                self.exported.add(name)
+            self.skipToNextLine()
+
+        # a variable set without export still ends up in the environment if it was already there
+        return OrderedDict((name, value) for name, value in self.assigned.items()
+                           if name in self.exported or name in self.environ)
+
+
+def evaluateEnvFile(aPath, environ=None):
+    """Return the variables a .sh or .env file puts in the environment and the environment variables it used.
+
+    Raises a ValueError if the file has something in it that needs bash to work out.
+    """
+    with open(aPath) as envFile:
+        evaluator = EnvFileEvaluator(envFile.read(), environ)
+
+    return evaluator.evaluate(), evaluator.referenced
+
+
+def sourceEnvFile(aPath):
+    """Return the whole environment after bash has sourced the file, for the files evaluateEnvFile can't handle."""
+    import subprocess
+
+    command = '/usr/bin/env bash -c "source ' + aPath + ' && env"'
+    output = subprocess.check_output(command, stderr=subprocess.STDOUT, shell=True)
+    if not isinstance(output, str):
+        output = output.decode('utf-8', 'replace')
+
+    retDict = {}
+    for aLine in output.split('\n'):
+        # the lines without an = are the rest of a value that had a newline in it
+        if '=' in aLine:
+            key, value = aLine.split('=', 1)
+            retDict[key] = value
+
+    return retDict
+
+
+def readEnvFileKeys(aPath):
+    """Return the keys in a KEY=VALUE file in the order they are in it, skipping blank lines and comments."""
+    retKeys = OrderedDict()
+    with open(aPath) as envFile:
+        for aLine in envFile:
+            aLine = aLine.strip()
+            if aLine and not aLine.startswith("#") and "=" in aLine:
+                key = aLine.split("=", 1)[0]
+                if key.startswith("export "):
+                    key = key[len("export "):].strip()
+                retKeys[key] = True
+
+    return list(retKeys)
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
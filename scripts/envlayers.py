@@ -0,0 +1,462 @@
+#!/usr/bin/env python
+"""
+Docstring for envlayers.py. This module puts together the env files that make up
+an app's environment the way deployenv.sh does.  For the docker type, in order:
+
+    $dcUTILS/environments/common.env
+    the BASE_CUSTOMER_DIR, CUSTOMER_APP_UTILS, CUSTOMER_APP_WEB and CUSTOMER_APP_ENV lines
+    app-utils/environments/common.env
+    app-utils/environments/<env>.env
+    app-utils/environments/personal.env (or personal_<run-as>.env), only for local
+
+and for the instance type:
+
+    $dcUTILS/environments/common.env
+    ~/.dcConfig/instance.env (the instance-*.env files put together)
+    app-utils/environments/common.env
+    app-utils/environments/<env>.env
+
+Each layer is a list of KEY=VALUE entries.  A value that starts with a quote
+goes on to the line with the quote that closes it, for the certificates and
+keys that are put in the env files; quotes anywhere else in a value are just
+part of it.  Merging the layers is what fixUpEnvFile.py does with the combined
+file: a key keeps the place it was first set in and the value it was last set
+to, and dcHOME goes first.
+
+The generated files are merged from where each entry is in its layer file rather
+than from the values, so the memory used depends on how many keys there are and
+not on how big the values are.  They are written to a temporary file next to
+them and moved into place, so a container or script reading one never sees it
+half written.
+
+A file is only written when what would be written is different from what is in
+it, so the containers and file watchers that use it don't see a change that
+isn't one.  A dependency file kept next to the outputs records a hash of each
+input and output, so when none of them have changed nothing is merged at all.
+"""
+
+import os
+import sys
+import glob
+import json
+import hashlib
+import tempfile
+from collections import OrderedDict, namedtuple
+
+# ==============================================================================
+__version__ = "0.1"
+
+__copyright__ = "Copyright 2017, devops.center"
+__credits__ = ["Bob Lozano", "Gregg Jensen"]
+__license__ = ' \
+   # Copyright 2014-2017 devops.center llc                                    \
+   #                                                                          \
+   # Licensed under the Apache License, Version 2.0 (the "License");          \
+   # you may not use this file except in compliance with the License.         \
+   # You may obtain a copy of the License at                                  \
+   #                                                                          \
+   #   http://www.apache.org/licenses/LICENSE-2.0                             \
+   #                                                                          \
+   # Unless required by applicable law or agreed to in writing, software      \
+   # distributed under the License is distributed on an "AS IS" BASIS,        \
+   # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. \
+   # See the License for the specific language governing permissions and      \
+   # limitations under the License.                                           \
+   # '
+__status__ = "Development"
+
+# the value deployenv.sh replaces with the app name when it is still there after merging
+DEFAULT_APP_NAME_KEY = "dcDEFAULT_APP_NAME"
+DEFAULT_APP_NAME_VALUE = "__DEFAULT__"
+
+# bump this when what is generated from the same inputs changes, so the outputs are all generated again
+DEPENDENCY_FORMAT_VERSION = 2
+
+# how much of a file is read at a time when it is copied or hashed
+COPY_CHUNK_SIZE = 65536
+
+# where the KEY=VALUE entry for a key is in its layer file, or the text of it when it isn't from a file
+LayerEntry = namedtuple("LayerEntry", ["path", "offset", "length", "text"])
+
+# ==============================================================================
+
+
+def warnSkippedLine(aPath, lineNumber):
+    """Say that a line without an = in it was left out."""
+    sys.stderr.write("WARNING: {} line {} is not KEY=VALUE, it is left out\n".format(aPath, lineNumber))
+
+
+def findQuoteState(text, quote):
+    """Return the quote that is still open at the end of the text, if any.
+
+    quote is the one the value started with.  The quotes in an env file value are kept as they are, so only that one
+    closes it, and a backslash only escapes the character after it in double quotes.
+    """
+    index = 0
+    while index < len(text):
+        aChar = text[index]
+        if aChar == "\\" and quote == '"':
+            index += 1
+        elif aChar == quote:
+            return None
+        index += 1
+
+    return quote
+
+
+def iterLayerEntries(layerFile, aPath):
+    """Yield the key, offset and length of each KEY=VALUE entry in an env file opened in binary, in order.
+
+    An entry is the line with the KEY= on it and, when the value starts with a quote that is not closed on that line,
+    the lines up to the one that closes it.  When the quote is never closed the value is just its line and the lines
+    after it are read again one at a time.  Comments, blank lines and lines without an = are skipped.
+    """
+    offset = 0
+    lineNumber = 0
+    # the key, offset, first line length, line number and length of an entry with a quoted value that isn't closed yet
+    openEntry = None
+    quote = None
+    layerFile.seek(0)
+    while True:
+        rawLine = layerFile.readline()
+        if not rawLine:
+            if openEntry is None:
+                return
+            key, offset, firstLength, lineNumber, length = openEntry
+            sys.stderr.write("WARNING: the quote in the value of {} on line {} of {} is not closed, it is read as one "
+                             "line\n".format(key, lineNumber, aPath))
+            yield key, offset, firstLength
+            offset += firstLength
+            layerFile.seek(offset)
+            openEntry = None
+            continue
+
+        lineNumber += 1
+        # latin-1 keeps one character for each byte, so the offsets and lengths are right whatever the encoding is
+        aLine = rawLine.decode('latin-1')
+        if openEntry is not None:
+            # still in the quoted value of the entry before
+            openEntry[4] += len(rawLine)
+            quote = findQuoteState(aLine, quote)
+            if quote is None:
+                yield openEntry[0], openEntry[1], openEntry[4]
+                openEntry = None
+        elif not aLine.strip() or aLine.lstrip().startswith("#"):
+            pass
+        elif "=" not in aLine:
+            warnSkippedLine(aPath, lineNumber)
+        else:
+            key, value = aLine.rstrip('\n').split("=", 1)
+            quote = None
+            if value[:1] in ("'", '"'):
+                quote = findQuoteState(value[1:], value[0])
+            if quote is None:
+                yield key, offset, len(rawLine)
+            else:
+                openEntry = [key, offset, len(rawLine), lineNumber, len(rawLine)]
+        offset += len(rawLine)
+
+
+def decodeText(data):
+    """Return what was read from an env file as a str."""
+    if isinstance(data, str):
+        return data
+    return data.decode('utf-8')
+
+
+def readLayerFile(aPath):
+    """Yield the KEY=VALUE pairs in an env file in order, a value that goes over more than one line has the newlines."""
+    with open(aPath, 'rb') as layerFile:
+        with open(aPath, 'rb') as valueFile:
+            for key, offset, length in iterLayerEntries(layerFile, aPath):
+                valueFile.seek(offset)
+                entryText = decodeText(valueFile.read(length))
+                if entryText.endswith('\n'):
+                    entryText = entryText[:-1]
+                yield tuple(entryText.split("=", 1))
+
+
+def getLayerFiles(dcUtilsDir, appUtilsDir, env, runAs=None):
+    """Return the name and path of each env file that goes into an env, in order, leaving out the ones not there.
+
+    The generated lines that go after the dcUtils common.env are not a file, they are given the path None.
+    Raises an IOError when a run-as is given and its personal_<run-as>.env isn't there, as deployenv.sh stops then.
+    """
+    envDir = os.path.join(appUtilsDir, "environments")
+    layerFiles = [("dcUtils common.env", os.path.join(dcUtilsDir, "environments", "common.env")),
+                  ("deployenv.sh", None),
+                  ("common.env", os.path.join(envDir, "common.env")),
+                  (env + ".env", os.path.join(envDir, env + ".env"))]
+
+    if env == "local":
+        if runAs:
+            personalFile = os.path.join(envDir, "personal_" + runAs + ".env")
+            if not os.path.isfile(personalFile):
+                raise IOError("the personal env file for --run-as " + runAs + " is not there: " + personalFile)
+            layerFiles.append((os.path.basename(personalFile), personalFile))
+        else:
+            layerFiles.append(("personal.env", os.path.join(envDir, "personal.env")))
+
+    # the dcUtils common.env is copied rather than appended so deployenv.sh needs it, the others are optional
+    return [(name, aPath) for name, aPath in layerFiles
+            if aPath is None or name == "dcUtils common.env" or os.path.isfile(aPath)]
+
+
+def getInstanceLayerFiles(dcUtilsDir, appUtilsDir, env, instanceEnvFile=None):
+    """Return the name and path of each env file that goes into an instance's env, in order, as getLayerFiles does."""
+    envDir = os.path.join(appUtilsDir, "environments")
+    layerFiles = [("dcUtils common.env", os.path.join(dcUtilsDir, "environments", "common.env")),
+                  ("instance.env", instanceEnvFile),
+                  ("common.env", os.path.join(envDir, "common.env")),
+                  (env + ".env", os.path.join(envDir, env + ".env"))]
+
+    return [(name, aPath) for name, aPath in layerFiles
+            if name == "dcUtils common.env" or (aPath and os.path.isfile(aPath))]
+
+
+def collectInstanceEnvFiles(dcConfigDir):
+    """Put the instance-*.env files in dcConfigDir together into its instance.env and return the path of it."""
+    def iterLines():
+        for aFile in sorted(glob.glob(os.path.join(dcConfigDir, "instance-*.env"))):
+            with open(aFile, 'rb') as instanceFile:
+                for aLine in instanceFile:
+                    yield aLine.rstrip(b'\n') + b'\n'
+
+    instanceEnvFile = os.path.join(dcConfigDir, "instance.env")
+    writeChunksIfChanged(instanceEnvFile, iterLines())
+    return instanceEnvFile
+
+
+def getGeneratedPairs(envList, env):
+    """Return the KEY=VALUE pairs deployenv.sh puts after the dcUtils common.env."""
+    return [("BASE_CUSTOMER_DIR", envList.get("BASE_CUSTOMER_DIR", '')),
+            ("CUSTOMER_APP_UTILS", envList.get("CUSTOMER_APP_UTILS", '')),
+            ("CUSTOMER_APP_WEB", envList.get("CUSTOMER_APP_WEB", '')),
+            ("CUSTOMER_APP_ENV", env)]
+
+
+def getLayers(layerFiles, envList, env):
+    """Return the name and KEY=VALUE pairs of each of the layerFiles, envList has what process_dc_env resolved."""
+    layers = []
+    for name, aPath in layerFiles:
+        if aPath is None:
+            pairs = getGeneratedPairs(envList, env)
+        else:
+            pairs = readLayerFile(aPath)
+        layers.append((name, pairs))
+
+    return layers
+
+
+def mergeLayers(layers, appName=None):
+    """Merge the layers into one OrderedDict the way fixUpEnvFile.py and deployenv.sh do, with dcHOME first."""
+    merged = OrderedDict()
+    for name, pairs in layers:
+        for key, value in pairs:
+            merged[key] = value
+
+    if "dcHOME" in merged:
+        dcHome = merged.pop("dcHOME")
+        merged = OrderedDict([("dcHOME", dcHome)] + list(merged.items()))
+
+    if appName and merged.get(DEFAULT_APP_NAME_KEY, '').startswith(DEFAULT_APP_NAME_VALUE):
+        merged[DEFAULT_APP_NAME_KEY] = appName + merged[DEFAULT_APP_NAME_KEY][len(DEFAULT_APP_NAME_VALUE):]
+
+    return merged
+
+
+def mergeLayerEntries(layerFiles, envList, env, appName=None):
+    """Return where the last entry for each key in the layerFiles is, merged as mergeLayers does, with dcHOME first.
+
+    This is an OrderedDict of a LayerEntry for each key, the values themselves are only read when they are copied.
+    """
+    merged = OrderedDict()
+    for name, aPath in layerFiles:
+        if aPath is None:
+            for key, value in getGeneratedPairs(envList, env):
+                merged[key] = LayerEntry(None, 0, 0, "{}={}\n".format(key, value))
+        else:
+            with open(aPath, 'rb') as layerFile:
+                for key, offset, length in iterLayerEntries(layerFile, aPath):
+                    merged[key] = LayerEntry(aPath, offset, length, None)
+
+    if "dcHOME" in merged:
+        dcHome = merged.pop("dcHOME")
+        merged = OrderedDict([("dcHOME", dcHome)] + list(merged.items()))
+
+    if appName and DEFAULT_APP_NAME_KEY in merged:
+        entryText = readEntryText(merged[DEFAULT_APP_NAME_KEY])
+        value = entryText.rstrip('\n').split("=", 1)[1]
+        if value.startswith(DEFAULT_APP_NAME_VALUE):
+            merged[DEFAULT_APP_NAME_KEY] = LayerEntry(None, 0, 0, "{}={}{}\n".format(
+                DEFAULT_APP_NAME_KEY, appName, value[len(DEFAULT_APP_NAME_VALUE):]))
+
+    return merged
+
+
+def readEntryText(entry):
+    """Return the KEY=VALUE text of one LayerEntry."""
+    if entry.path is None:
+        return entry.text
+    with open(entry.path, 'rb') as layerFile:
+        layerFile.seek(entry.offset)
+        return decodeText(layerFile.read(entry.length))
+
+
+def iterMergedChunks(merged, prefix=''):
+    """Yield the merged entries a chunk at a time, each with the prefix in front of it and a newline at the end."""
+    prefix = prefix.encode('utf-8')
+    layerFiles = {}
+    try:
+        for key, entry in merged.items():
+            yield prefix
+            if entry.path is None:
+                yield entry.text.encode('utf-8')
+                continue
+
+            if entry.path not in layerFiles:
+                layerFiles[entry.path] = open(entry.path, 'rb')
+            layerFile = layerFiles[entry.path]
+            layerFile.seek(entry.offset)
+            length = entry.length
+            lastChunk = b''
+            while length > 0:
+                lastChunk = layerFile.read(min(length, COPY_CHUNK_SIZE))
+                if not lastChunk:
+                    break
+                yield lastChunk
+                length -= len(lastChunk)
+
+            # the last entry in a file may not have a newline after it
+            if not lastChunk.endswith(b'\n'):
+                yield b'\n'
+    finally:
+        for layerFile in layerFiles.values():
+            layerFile.close()
+
+
+def getKeyHistory(layers):
+    """Return each key with the name of every layer that set it and the value it set, in the order they were set.
+
+    The last one is the value mergeLayers ends up with, the ones before it are what it overrode.
+    """
+    history = OrderedDict()
+    for name, pairs in layers:
+        for key, value in pairs:
+            history.setdefault(key, []).append((name, value))
+
+    return history
+
+
+def renderEnvText(merged):
+    """Return the merged env as the lines of the generated .env file, one KEY=VALUE on each."""
+    return ''.join("{}={}\n".format(key, value) for key, value in merged.items())
+
+
+def renderShText(merged):
+    """Return the merged env as the lines of the generated .sh file, an export in front of each KEY=VALUE."""
+    return ''.join("export {}={}\n".format(key, value) for key, value in merged.items())
+
+
+def writeChunksIfChanged(aPath, chunks, force=False):
+    """Write the chunks of bytes to a temporary file in the same directory and move it over aPath.
+
+    When aPath already has what was written in it the temporary file is removed instead, unless force is given.
+    Returns if aPath was written.  The file keeps the permissions it had, and a new one gets the ones the umask gives
+    rather than mkstemp's 0600.
+    """
+    try:
+        mode = os.stat(aPath).st_mode & 0o777
+    except OSError:
+        currentUmask = os.umask(0)
+        os.umask(currentUmask)
+        mode = 0o666 & ~currentUmask
+
+    fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(aPath)),
+                                   prefix="." + os.path.basename(aPath) + ".")
+    try:
+        written = hashlib.sha1()
+        with os.fdopen(fd, 'wb') as tmpFile:
+            for chunk in chunks:
+                written.update(chunk)
+                tmpFile.write(chunk)
+
+        if not force and hashFile(aPath) == written.hexdigest():
+            os.remove(tmpPath)
+            return False
+
+        os.chmod(tmpPath, mode)
+        os.rename(tmpPath, aPath)
+    except Exception:
+        os.remove(tmpPath)
+        raise
+
+    return True
+
+
+def hashText(text):
+    """Return the sha1 of the text."""
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    return hashlib.sha1(text).hexdigest()
+
+
+def hashFile(aPath):
+    """Return the sha1 of what is in a file, or None if it isn't there."""
+    fileHash = hashlib.sha1()
+    try:
+        with open(aPath, 'rb') as aFile:
+            for chunk in iter(lambda: aFile.read(COPY_CHUNK_SIZE), b''):
+                fileHash.update(chunk)
+    except IOError:
+        return None
+    return fileHash.hexdigest()
+
+
+def writeFileIfChanged(aPath, text, force=False):
+    """Write the text to aPath atomically unless it already has that text in it, and return if it was written."""
+    if not force and hashFile(aPath) == hashText(text):
+        return False
+
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    return writeChunksIfChanged(aPath, [text], force=True)
+
+
+def readDependencies(depsFile):
+    """Return what was recorded in a dependency file, or None if there isn't one that can be read."""
+    try:
+        with open(depsFile) as aFile:
+            deps = json.load(aFile)
+    except (IOError, ValueError):
+        return None
+
+    if deps.get("Version") != DEPENDENCY_FORMAT_VERSION:
+        return None
+    return deps
+
+
+def isUpToDate(depsFile, inputs, params, outputPaths):
+    """Return if the outputs were generated from the same inputs and params, and are still as they were written.
+
+    inputs has the hash of each input file, params has the rest of what the outputs are generated from.
+    """
+    deps = readDependencies(depsFile)
+    if deps is None:
+        return False
+
+    # the json comes back with unicode strings on python 2, so these are compared the same way
+    if deps.get("Inputs") != json.loads(json.dumps(inputs)) or deps.get("Params") != json.loads(json.dumps(params)):
+        return False
+
+    recordedOutputs = deps.get("Outputs", {})
+    return all(aPath in recordedOutputs and hashFile(aPath) == recordedOutputs[aPath] for aPath in outputPaths)
+
+
+def writeDependencies(depsFile, inputs, params, outputPaths):
+    """Record the hash of each input and output, and the params, that the outputs were generated from."""
+    deps = {"Version": DEPENDENCY_FORMAT_VERSION, "Inputs": inputs, "Params": params,
+            "Outputs": dict((aPath, hashFile(aPath)) for aPath in outputPaths)}
+    writeFileIfChanged(depsFile, json.dumps(deps, indent=4, sort_keys=True, separators=(",", ": ")) + "\n")
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
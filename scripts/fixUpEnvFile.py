@@ -36,13 +36,27 @@
 # ==============================================================================
 
 import sys
+import os
 import argparse
+import tempfile
 from collections import OrderedDict
+try:
+    import envlayers
+except ImportError:
+    from scripts import envlayers
 # ==============================================================================
 """
 this script is called by deployenv.sh as a helper script to read a file,
 remove duplicates and put the output into a second file.  Both files will be
 given by the deployenv.sh
+
+With --streaming the file is read twice rather than into memory: the first
+time to find where the last KEY=VALUE for each key is, and the second time to
+copy each of those to the output.  So the memory used depends on how many keys
+there are and not how big the values are, for the files that have certificates
+and the like in them.  In this mode a value that starts with a quote can go
+over more than one line, up to the line with the quote that closes it.  Quotes
+anywhere else in a value are just part of it.
 """
 __version__ = "0.1"
 
@@ -50,6 +64,9 @@ __copyright__ = "Copyright 2016, devops.center"
 __credits__ = ["Bob Lozano", "Gregg Jensen"]
 __license__ = "GPL"
 __status__ = "Development"
+
+# how much of a value is copied at a time when streaming
+COPY_CHUNK_SIZE = 65536
 # ==============================================================================
 
 
@@ -66,6 +83,11 @@ def checkArgs():
                         ' the calling program will expect the values to be' +
                         ' written to',
                         required=True)
+    parser.add_argument('-s', '--streaming', help='Read the input file ' +
+                        'twice rather than all into memory, and allow ' +
+                        'values in quotes that go over more than one line',
+                        action="store_true",
+                        required=False)
     args = parser.parse_args()
 
     # try to read the configuration to make sure it is there
@@ -80,31 +102,132 @@ def checkArgs():
         sys.exit(1)
 
     # if we get here then the
-    return (retInputFile, retOutputFile)
+    return (retInputFile, retOutputFile, args.streaming)
 
 
-def main(argv):
-    """Execute the script."""
-    (inputFile, outputFile) = checkArgs()
+def openOutputFile(outputFile, mode='w'):
+    """Open a temporary file next to the output file to write it into."""
+    fd, tmpPath = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(outputFile)),
+        prefix="." + os.path.basename(outputFile) + ".")
+    return os.fdopen(fd, mode), tmpPath
 
+
+def replaceOutputFile(tmpPath, outputFile):
+    """Move the written temporary file over the output file."""
+    # mkstemp makes the file only readable by its owner, so it is given the
+    # permissions the output file had or that the umask gives a new one
+    try:
+        mode = os.stat(outputFile).st_mode & 0o777
+    except OSError:
+        currentUmask = os.umask(0)
+        os.umask(currentUmask)
+        mode = 0o666 & ~currentUmask
+    os.chmod(tmpPath, mode)
+    os.rename(tmpPath, outputFile)
+
+
+def scanEntries(inputFile):
+    """Return where the last KEY=VALUE for each key is in the input file.
+
+    This is an OrderedDict of the keys in the order they are first in the
+    file, with the offset and length of the last entry for each.  The entries
+    are found the way generateEnvFiles.py finds them in the env files.
+    """
+    entries = OrderedDict()
+    with open(inputFile, 'rb') as envFile:
+        for key, offset, length in envlayers.iterLayerEntries(envFile,
+                                                              inputFile):
+            if key in entries:
+                # the last one wins, but the key keeps its first place
+                entries[key][0] = offset
+                entries[key][1] = length
+            else:
+                entries[key] = [offset, length]
+
+    return entries
+
+
+def copyEntry(envFile, outEnvFile, offset, length):
+    """Copy one entry from the input file to the output file."""
+    envFile.seek(offset)
+    lastChunk = b''
+    while length > 0:
+        lastChunk = envFile.read(min(length, COPY_CHUNK_SIZE))
+        if not lastChunk:
+            break
+        outEnvFile.write(lastChunk)
+        length -= len(lastChunk)
+
+    # the last entry in the file may not have a newline after it
+    if not lastChunk.endswith(b'\n'):
+        outEnvFile.write(b'\n')
+
+
+def streamEnvFile(inputFile, outputFile):
+    """Remove the duplicates reading the input file twice, not into memory."""
+    entries = scanEntries(inputFile)
+
+    outEnvFile, tmpPath = openOutputFile(outputFile, 'wb')
+    try:
+        with open(inputFile, 'rb') as envFile:
+            with outEnvFile:
+                # first write out the dcHOME so that it is at the top of the
+                # file
+                if "dcHOME" in entries:
+                    copyEntry(envFile, outEnvFile, *entries["dcHOME"])
+
+                for key, (offset, length) in entries.items():
+                    if key != "dcHOME":
+                        copyEntry(envFile, outEnvFile, offset, length)
+        replaceOutputFile(tmpPath, outputFile)
+    except Exception:
+        os.remove(tmpPath)
+        raise
+
+
+def fixUpEnvFile(inputFile, outputFile):
+    """Remove the duplicates reading the input file into memory."""
     envDict = OrderedDict()
 
     with open(inputFile) as envFile:
-        for line in envFile:
+        for lineNumber, line in enumerate(envFile, 1):
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            if "=" not in line:
+                envlayers.warnSkippedLine(inputFile, lineNumber)
+                continue
             (key, val) = line.rstrip('\n').split('=', 1)
             envDict[key] = val
 
-    with open(outputFile, 'w') as outEnvFile:
-        # first write out the dcHOME so that it is at the top of the file
-        strToWrite = '{}={}\n'.format("dcHOME", envDict["dcHOME"])
-        outEnvFile.write(strToWrite)
-
-        for item in envDict:
-            # make sure we skip the dcHOME since we already wrote it out
-            if item != "dcHOME":
-                strToWrite = '{}={}\n'.format(item, envDict[item])
+    outEnvFile, tmpPath = openOutputFile(outputFile)
+    try:
+        with outEnvFile:
+            # first write out the dcHOME so that it is at the top of the file
+            if "dcHOME" in envDict:
+                strToWrite = '{}={}\n'.format("dcHOME", envDict["dcHOME"])
                 outEnvFile.write(strToWrite)
 
+            for item in envDict:
+                # make sure we skip the dcHOME since we already wrote it out
+                if item != "dcHOME":
+                    strToWrite = '{}={}\n'.format(item, envDict[item])
+                    outEnvFile.write(strToWrite)
+        replaceOutputFile(tmpPath, outputFile)
+    except Exception:
+        os.remove(tmpPath)
+        raise
+
+
+def main(argv):
+    """Execute the script."""
+    (inputFile, outputFile, streaming) = checkArgs()
+
+    if streaming:
+        streamEnvFile(inputFile, outputFile)
+    else:
+        fixUpEnvFile(inputFile, outputFile)
+
 
 if __name__ == "__main__":
     main(sys.argv[1:])
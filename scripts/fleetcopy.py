@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+"""
+Docstring for fleetcopy.py. This script copies a file or directory to, or from,
+a set of instances at the same time, using the connect parts that InstanceInfo
+works out for each instance.  It is what pawscp -f uses.
+
+The arguments are given the same way as for pawscp, one of them is remote and
+has a colon in it:
+    fleetcopy.py ~/bundle.tgz :/tmp            copy to all the instances found
+    fleetcopy.py ~/bundle.tgz web1:/tmp        copy to just web1
+    fleetcopy.py :/var/log/syslog ~/logs       copy from all the instances found
+
+When copying from more than one instance each instance's copy goes into its own
+directory, named for the instance, under the local destination so they don't
+overwrite each other.
+
+rsync is used when it is installed, so only what has changed is sent and a copy
+that was stopped part way picks up from where it got to the next time.  If rsync
+isn't there, locally or on an instance, scp is used for that instance instead.
+When each instance is done the amount copied and how fast it went is written.
+"""
+
+import os
+import re
+import sys
+import argparse
+import time
+import subprocess
+from collections import namedtuple, OrderedDict
+from instanceinfo import parseRegionString, parseTagString
+from sshsessions import SSHSessionPool, createSSHCommand, startProcessTimer, runForEach, DEFAULT_CONTROL_PERSIST
+from fleetexec import getConnectPartsForInstances
+try:
+    from shlex import quote as shellQuote
+except ImportError:
+    from pipes import quote as shellQuote
+
+# ==============================================================================
+__version__ = "0.1"
+
+__copyright__ = "Copyright 2017, devops.center"
+__credits__ = ["Bob Lozano", "Gregg Jensen"]
+__license__ = ' \
+   # Copyright 2014-2017 devops.center llc                                    \
+   #                                                                          \
+   # Licensed under the Apache License, Version 2.0 (the "License");          \
+   # you may not use this file except in compliance with the License.         \
+   # You may obtain a copy of the License at                                  \
+   #                                                                          \
+   #   http://www.apache.org/licenses/LICENSE-2.0                             \
+   #                                                                          \
+   # Unless required by applicable law or agreed to in writing, software      \
+   # distributed under the License is distributed on an "AS IS" BASIS,        \
+   # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. \
+   # See the License for the specific language governing permissions and      \
+   # limitations under the License.                                           \
+   # '
+__status__ = "Development"
+
+# the number of instances that are copied to or from at the same time
+DEFAULT_MAX_PARALLEL = 16
+
+# the number of seconds ssh waits for the connection to a host to be made
+DEFAULT_CONNECT_TIMEOUT = 10
+
+# where rsync keeps what it has of a file that was stopped part way, so the next copy can pick up from there
+RSYNC_PARTIAL_DIR = ".rsync-partial"
+
+# what the shell on an instance says when rsync isn't installed there
+RSYNC_MISSING_PATTERNS = ["rsync: command not found", "rsync: not found", "rsync: No such file or directory"]
+
+# ==============================================================================
+
+CopyResult = namedtuple('CopyResult', 'InstanceName, ExitCode, Method, Bytes, Elapsed, Message')
+
+
+def splitCopyArgument(anArgument):
+    """Return the host and path of a copy argument, the host is None for a local path and '' for all the hosts."""
+    if ":" in anArgument:
+        host, path = anArgument.split(":", 1)
+        return host, path
+
+    return None, anArgument
+
+
+def findExecutable(name):
+    """Return the path of a program on the PATH, or None if it isn't there."""
+    for aDir in os.environ.get("PATH", "").split(os.pathsep):
+        aPath = os.path.join(aDir, name)
+        if os.path.isfile(aPath) and os.access(aPath, os.X_OK):
+            return aPath
+
+    return None
+
+
+def getLocalSize(aPath):
+    """Return the number of bytes in a local file, or in all the files under a directory."""
+    if os.path.isfile(aPath):
+        return os.path.getsize(aPath)
+
+    totalSize = 0
+    for dirPath, dirNames, fileNames in os.walk(aPath):
+        for fileName in fileNames:
+            try:
+                totalSize += os.path.getsize(os.path.join(dirPath, fileName))
+            except OSError:
+                pass
+
+    return totalSize
+
+
+def getRsyncBytes(output):
+    """Return the number of bytes rsync sent and received, from its --stats output."""
+    totalBytes = 0
+    for aMatch in re.finditer(r"Total bytes (?:sent|received): ([\d,.]+)", output):
+        totalBytes += int(re.sub(r"[,.]", "", aMatch.group(1)))
+
+    return totalBytes
+
+
+def formatBytes(numBytes):
+    """Return a number of bytes in a readable form."""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if numBytes < 1024:
+            return "{:.1f} {}".format(numBytes, unit) if unit != "B" else "{} B".format(numBytes)
+        numBytes = numBytes / 1024.0
+
+    return "{:.1f} TB".format(numBytes)
+
+
+def getLastLine(output):
+    """Return the last line of some output, which is the one that usually says why something failed."""
+    lines = [aLine.strip() for aLine in output.splitlines() if aLine.strip()]
+    return lines[-1] if lines else ''
+
+
+class FleetCopier:
+
+    def __init__(self, maxParallel=DEFAULT_MAX_PARALLEL, timeout=0, connectTimeout=DEFAULT_CONNECT_TIMEOUT,
+                 useRsync=True, sessionPool=None, quiet=False):
+        """Construct an instance of the FleetCopier class."""
+        self.maxParallel = maxParallel if maxParallel and maxParallel > 0 else 1
+        # a timeout of 0 lets the copy take as long as it takes
+        self.timeout = timeout
+        self.connectTimeout = connectTimeout
+        self.useRsync = useRsync and findExecutable("rsync") is not None
+        self.sessionPool = sessionPool
+        self.quiet = quiet
+
+    def getSSHOptions(self, instanceName, connectParts):
+        """Return the ssh options for an instance, using its shared session if there is a pool and it is up."""
+        if self.sessionPool and self.sessionPool.warm(instanceName, connectParts):
+            return self.sessionPool.getSSHOptions(connectParts)
+
+        return []
+
+    def createRsyncCommand(self, connectParts, sshOptions, source, destination):
+        """Return the rsync command line that copies between the local side and an instance."""
+        # the ssh that rsync runs is the same one used for commands, without the destination on the end
+        sshCommand = createSSHCommand(connectParts, None, self.connectTimeout, sshOptions)[:-1]
+        return ["rsync", "-az", "--partial", "--partial-dir=" + RSYNC_PARTIAL_DIR, "--stats",
+                "-e", " ".join(shellQuote(aPart) for aPart in sshCommand), source, destination]
+
+    def createSCPCommand(self, connectParts, sshOptions, source, destination):
+        """Return the scp command line that copies between the local side and an instance."""
+        # scp takes the same options as ssh, other than the port
+        sshCommand = createSSHCommand(connectParts, None, self.connectTimeout, sshOptions)[1:-1]
+        portIndex = sshCommand.index("-p")
+        sshCommand[portIndex] = "-P"
+        return ["scp", "-q", "-r"] + sshCommand + [source, destination]
+
+    def runCopy(self, copyCommand):
+        """Run a copy command and return its exit code, its output and if it ran out of time."""
+        devNull = open(os.devnull, 'r')
+        try:
+            # its own process group so that the ProxyCommand is stopped along with it
+            process = subprocess.Popen(copyCommand, stdin=devNull, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       preexec_fn=os.setsid)
+        except OSError as e:
+            return None, "could not run {}: {}".format(copyCommand[0], e), False
+        finally:
+            devNull.close()
+
+        timedOut = []
+        timer = None
+        if self.timeout and self.timeout > 0:
+            timer = startProcessTimer(process, self.timeout, timedOut)
+        try:
+            output = process.communicate()[0].decode('utf-8', 'replace')
+        finally:
+            if timer:
+                timer.cancel()
+
+        return process.returncode, output, bool(timedOut)
+
+    def copyOne(self, instanceName, connectParts, localPath, remotePath, toInstance):
+        """Copy between the local path and the remote path on one instance and return how it went."""
+        remote = (connectParts.get("DestLogin") or "ubuntu") + "@" + connectParts["DestHost"] + ":" + remotePath
+        source, destination = (localPath, remote) if toInstance else (remote, localPath)
+        sshOptions = self.getSSHOptions(instanceName, connectParts)
+
+        startTime = time.time()
+        method = None
+        if self.useRsync:
+            method = "rsync"
+            exitCode, output, timedOut = self.runCopy(self.createRsyncCommand(connectParts, sshOptions, source,
+                                                                              destination))
+            if exitCode != 0 and not timedOut and any(aPattern in output for aPattern in RSYNC_MISSING_PATTERNS):
+                # rsync isn't on the instance so fall back to scp for this one
+                method = None
+                startTime = time.time()
+
+        if method is None:
+            method = "scp"
+            exitCode, output, timedOut = self.runCopy(self.createSCPCommand(connectParts, sshOptions, source,
+                                                                            destination))
+
+        elapsed = time.time() - startTime
+        if timedOut:
+            return CopyResult(InstanceName=instanceName, ExitCode=None, Method=method, Bytes=0, Elapsed=elapsed,
+                              Message="timed out after {} seconds".format(self.timeout))
+        if exitCode != 0:
+            return CopyResult(InstanceName=instanceName, ExitCode=exitCode, Method=method, Bytes=0, Elapsed=elapsed,
+                              Message=getLastLine(output))
+
+        numBytes = getRsyncBytes(output) if method == "rsync" else getLocalSize(localPath)
+        return CopyResult(InstanceName=instanceName, ExitCode=0, Method=method, Bytes=numBytes, Elapsed=elapsed,
+                          Message='')
+
+    def copy(self, connectPartsByName, localPath, remotePath, toInstance):
+        """Copy to, or from, each of the instances and return the results in the same order as the instances."""
+        instances = list(connectPartsByName.items())
+        perInstanceDirs = not toInstance and len(instances) > 1
+
+        def copyInstance(anInstance):
+            instanceName, connectParts = anInstance
+            instanceLocalPath = localPath
+            if perInstanceDirs:
+                # each instance's copy goes into its own directory so they don't overwrite each other
+                instanceLocalPath = os.path.join(localPath, instanceName)
+                if not os.path.isdir(instanceLocalPath):
+                    os.makedirs(instanceLocalPath)
+                instanceLocalPath += os.sep
+
+            aResult = self.copyOne(instanceName, connectParts, instanceLocalPath, remotePath, toInstance)
+            if not self.quiet or aResult.ExitCode != 0:
+                sys.stdout.write(formatResult(aResult) + "\n")
+                sys.stdout.flush()
+            return aResult
+
+        return runForEach(copyInstance, instances, self.maxParallel)
+
+
+def formatResult(aResult):
+    """Return the line that says how the copy went for one instance."""
+    if aResult.ExitCode != 0:
+        return "{}: FAILED ({}) {}".format(aResult.InstanceName, aResult.Method, aResult.Message)
+
+    rate = aResult.Bytes / aResult.Elapsed if aResult.Elapsed > 0 else 0
+    return "{}: {} in {:.1f}s ({}/s) with {}".format(aResult.InstanceName, formatBytes(aResult.Bytes),
+                                                    aResult.Elapsed, formatBytes(int(rate)), aResult.Method)
+
+
+def formatSummary(results, elapsed):
+    """Return the lines that summarize the copy across all the instances."""
+    failed = [aResult for aResult in results if aResult.ExitCode != 0]
+    totalBytes = sum(aResult.Bytes for aResult in results)
+    retLines = ["Summary: {} hosts, {} succeeded, {} failed, {} in {:.1f}s".format(
+        len(results), len(results) - len(failed), len(failed), formatBytes(totalBytes), elapsed)]
+    for aResult in failed:
+        retLines.append("    {}: {}".format(aResult.InstanceName, aResult.Message))
+
+    return retLines
+
+
+def checkArgs():
+    """Check the command line arguments."""
+    parser = argparse.ArgumentParser(
+        description=('This script copies a file or directory to, or from, a set of instances at the same time. '
+                     'One of source or destination is remote, written as host:path, or :path for all the '
+                     'instances found.'))
+    parser.add_argument('-o', '--organization', help='The organization (customer name) that the instances are for',
+                        required=False)
+    parser.add_argument('-r', '--regions', help='A list of regions separated by a space to look for the instances in',
+                        required=False)
+    parser.add_argument('-t', '--tags', help='A list of key=value pairs separated by a space (no space before or after '
+                                             'the equal sign).  This will be used to filter the instances',
+                        required=False)
+    parser.add_argument('-kd', '--keysDirectory', help='This is the path to where the key resides on your system ',
+                        required=False)
+    parser.add_argument('-sd', '--sharedDirectory', help='This is the path to the shared drive on the system this is '
+                                                         'running on.',
+                        required=False)
+    parser.add_argument('-mp', '--maxParallel', help='The maximum number of instances to copy to or from at the same '
+                                                     'time. DEFAULT: ' + str(DEFAULT_MAX_PARALLEL),
+                        type=int, default=DEFAULT_MAX_PARALLEL,
+                        required=False)
+    parser.add_argument('--timeout', help='The number of seconds a copy can take before it is stopped. DEFAULT: 0, '
+                                          'the copy is not stopped',
+                        type=int, default=0,
+                        required=False)
+    parser.add_argument('--connectTimeout', help='The number of seconds to wait for the ssh connection to a host. '
+                                                 'DEFAULT: ' + str(DEFAULT_CONNECT_TIMEOUT),
+                        type=int, default=DEFAULT_CONNECT_TIMEOUT,
+                        required=False)
+    parser.add_argument('--noRsync', help='Always use scp, even when rsync is available.',
+                        action="store_true",
+                        required=False)
+    parser.add_argument('--noSessions', help='Make a new ssh connection to each host rather than using (and starting '
+                                             'if needed) the shared ssh session for it.',
+                        action="store_true",
+                        required=False)
+    parser.add_argument('--persist', help='The number of seconds a shared ssh session stays open after it was last '
+                                          'used. DEFAULT: ' + str(DEFAULT_CONTROL_PERSIST),
+                        type=int, default=DEFAULT_CONTROL_PERSIST,
+                        required=False)
+    parser.add_argument('--noDaemon', help='Do not ask the inventory daemon (instanceinfod.py) for the instances even '
+                                           'if it is running.',
+                        action="store_true",
+                        required=False)
+    parser.add_argument('-q', '--quiet', help='Only write the instances that failed and the summary.',
+                        action="store_true",
+                        required=False)
+    parser.add_argument('--test', help='Show what would be copied to or from where without copying it.',
+                        action="store_true",
+                        required=False)
+    parser.add_argument('source', help='The file or directory to copy')
+    parser.add_argument('destination', help='Where to copy it to')
+    args = parser.parse_args()
+
+    sourceHost, sourcePath = splitCopyArgument(args.source)
+    destinationHost, destinationPath = splitCopyArgument(args.destination)
+    if (sourceHost is None) == (destinationHost is None):
+        print("ERROR: one, and only one, of the source and destination has to be on the instances (host:path or "
+              ":path)")
+        sys.exit(1)
+
+    return (args.organization, parseRegionString(args.regions), parseTagString(args.tags), args.keysDirectory,
+            args.sharedDirectory, args.maxParallel, args.timeout, args.connectTimeout, not args.noRsync,
+            not args.noSessions, args.persist, not args.noDaemon, args.quiet, args.test,
+            sourceHost, sourcePath, destinationHost, destinationPath)
+
+
+def main(argv):
+    """Main code goes here."""
+    (organization, regions, tagList, keysDir, sharedDir, maxParallel, timeout, connectTimeout, useRsync,
+     useSessions, persist, useDaemon, quiet, testOnly, sourceHost, sourcePath, destinationHost,
+     destinationPath) = checkArgs()
+
+    toInstance = destinationHost is not None
+    host, remotePath, localPath = (destinationHost, destinationPath, sourcePath) if toInstance else \
+        (sourceHost, sourcePath, destinationPath)
+    localPath = os.path.expanduser(localPath)
+
+    connectPartsByName = getConnectPartsForInstances(organization, regions, keysDir, sharedDir, tagList, useDaemon)
+    if host:
+        # a host was given so just that one instance is copied to or from
+        connectPartsByName = OrderedDict((aName, connectPartsByName[aName]) for aName in connectPartsByName
+                                         if aName == host)
+
+    if not connectPartsByName:
+        print("No instances were found to copy to or from.")
+        sys.exit(1)
+
+    if testOnly:
+        # they just want to see what would happen
+        for instanceName in connectPartsByName:
+            if toInstance:
+                print("would copy: {} => {}:{}".format(localPath, instanceName, remotePath))
+            else:
+                print("would copy: {}:{} => {}".format(instanceName, remotePath, localPath))
+        return
+
+    sessionPool = SSHSessionPool(persist=persist, connectTimeout=connectTimeout) if useSessions else None
+    fleetCopier = FleetCopier(maxParallel=maxParallel, timeout=timeout, connectTimeout=connectTimeout,
+                              useRsync=useRsync, sessionPool=sessionPool, quiet=quiet)
+    startTime = time.time()
+    results = fleetCopier.copy(connectPartsByName, localPath, remotePath, toInstance)
+
+    sys.stderr.write("\n" + "\n".join(formatSummary(results, time.time() - startTime)) + "\n")
+    if any(aResult.ExitCode != 0 for aResult in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+Docstring for fleetexec.py. This script runs a command on a set of instances at
+the same time over ssh, using the connect parts that InstanceInfo works out for
+each instance (the destination host, port, login and key, and the jump server to
+go through if there is one).  It is what paws uses to run a command on more than
+one host, in place of pdsh.
+
+The output of each host is written as it comes in with the instance name in
+front of each line, like pdsh does:
+    web1: the first line of output from web1
+    db1: the first line of output from db1
+
+Unless --noSessions is given, the command goes over the shared ssh session for
+each host (see sshsessions.py), which is started the first time and then reused
+by the commands and copies that follow until it has not been used for a while.
+
+Once all the hosts have finished a summary of how each host did is written to
+stderr, and the exit code is 0 only if the command worked on every host.
+"""
+
+import os
+import sys
+import argparse
+import json
+import time
+import subprocess
+import threading
+from collections import namedtuple, OrderedDict
+from multiprocessing.pool import ThreadPool
+from instanceinfo import InstanceInfo, createDaemonRequest, sendDaemonRequest, parseRegionString, parseTagString
+from sshsessions import SSHSessionPool, createSSHCommand, startProcessTimer, DEFAULT_CONTROL_PERSIST
+
+# ==============================================================================
+__version__ = "0.1"
+
+__copyright__ = "Copyright 2017, devops.center"
+__credits__ = ["Bob Lozano", "Gregg Jensen"]
+__license__ = ' \
+   # Copyright 2014-2017 devops.center llc                                    \
+   #                                                                          \
+   # Licensed under the Apache License, Version 2.0 (the "License");          \
+   # you may not use this file except in compliance with the License.         \
+   # You may obtain a copy of the License at                                  \
+   #                                                                          \
+   #   http://www.apache.org/licenses/LICENSE-2.0                             \
+   #                                                                          \
+   # Unless required by applicable law or agreed to in writing, software      \
+   # distributed under the License is distributed on an "AS IS" BASIS,        \
+   # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. \
+   # See the License for the specific language governing permissions and      \
+   # limitations under the License.                                           \
+   # '
+__status__ = "Development"
+
+# the number of hosts the command is run on at the same time, the same as the pdsh default fanout
+DEFAULT_MAX_PARALLEL = 32
+
+# the number of seconds the command can run on a host before it is stopped, paws used pdsh -u 30
+DEFAULT_TIMEOUT = 30
+
+# the number of seconds ssh waits for the connection to a host to be made
+DEFAULT_CONNECT_TIMEOUT = 10
+
+# ssh exits with this when it couldn't connect or log in, rather than the command failing
+SSH_ERROR_EXIT_CODE = 255
+
+# ==============================================================================
+
+HostResult = namedtuple('HostResult', 'InstanceName, ExitCode, TimedOut, Elapsed')
+
+
+def getConnectPartsForInstances(organization, regions, keysDir, sharedDir, tagList, useDaemon=True):
+    """Return the connect parts for each instance found, keyed by instance name and sorted by it."""
+    connectParts = None
+    if useDaemon:
+        response = sendDaemonRequest(createDaemonRequest(organization, regions, keysDir, sharedDir, tagList, "batch"))
+        if response and response.get("Status") == 0:
+            connectParts = json.loads(response["Output"], object_pairs_hook=OrderedDict)["connectParts"]
+
+    if connectParts is None:
+        instances = InstanceInfo(organization=organization, keysDir=keysDir, regions=regions, sharedDir=sharedDir)
+        listOfIPs = instances.getInstanceInfo(tagList)
+        connectParts = OrderedDict()
+        for item in listOfIPs:
+            parts = instances.getConnectString(item)
+            if parts:
+                connectParts[item.InstanceName] = parts._asdict()
+
+    return OrderedDict((aName, connectParts[aName]) for aName in sorted(connectParts))
+
+
+class FleetExecutor:
+
+    def __init__(self, maxParallel=DEFAULT_MAX_PARALLEL, timeout=DEFAULT_TIMEOUT,
+                 connectTimeout=DEFAULT_CONNECT_TIMEOUT, output=None, sessionPool=None):
+        """Construct an instance of the FleetExecutor class."""
+        self.maxParallel = maxParallel if maxParallel and maxParallel > 0 else 1
+        # a timeout of 0 lets the command run on a host for as long as it takes
+        self.timeout = timeout
+        self.connectTimeout = connectTimeout
+        self.output = output or sys.stdout
+        # the shared ssh sessions to use, if there is no pool each command makes its own connection
+        self.sessionPool = sessionPool
+        # the output of the hosts is written a line at a time so the lines from different hosts don't get mixed up
+        self.outputLock = threading.Lock()
+
+    def writeLine(self, instanceName, aLine):
+        """Write one line of a host's output with the name of the host in front of it."""
+        with self.outputLock:
+            self.output.write(instanceName + ": " + aLine.rstrip("\r\n") + "\n")
+            self.output.flush()
+
+    def runOnHost(self, instanceName, sshCommand):
+        """Run the ssh command for one host, writing its output as it comes in, and return how it went."""
+        startTime = time.time()
+        devNull = open(os.devnull, 'r')
+        try:
+            # each host gets its own process group so that a timeout stops the ProxyCommand ssh along with it
+            process = subprocess.Popen(sshCommand, stdin=devNull, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, preexec_fn=os.setsid)
+        except OSError as e:
+            self.writeLine(instanceName, "could not run ssh: {}".format(e))
+            return HostResult(InstanceName=instanceName, ExitCode=None, TimedOut=False,
+                              Elapsed=time.time() - startTime)
+        finally:
+            devNull.close()
+
+        timedOut = []
+        timer = None
+        if self.timeout and self.timeout > 0:
+            timer = startProcessTimer(process, self.timeout, timedOut)
+
+        try:
+            for aLine in iter(process.stdout.readline, b''):
+                self.writeLine(instanceName, aLine.decode('utf-8', 'replace'))
+            process.stdout.close()
+            exitCode = process.wait()
+        finally:
+            if timer:
+                timer.cancel()
+
+        return HostResult(InstanceName=instanceName, ExitCode=exitCode, TimedOut=bool(timedOut),
+                          Elapsed=time.time() - startTime)
+
+    def runOnInstance(self, instanceName, connectParts, command, extraOptions=None):
+        """Run the command on one instance, over its shared session if there is a pool and the session is up."""
+        sshOptions = list(extraOptions or [])
+        if self.sessionPool and self.sessionPool.warm(instanceName, connectParts):
+            sshOptions += self.sessionPool.getSSHOptions(connectParts)
+
+        return self.runOnHost(instanceName, createSSHCommand(connectParts, command, self.connectTimeout, sshOptions))
+
+    def run(self, connectPartsByName, command, extraOptions=None):
+        """Run the command on each of the instances and return the results in the same order as the instances."""
+        instances = list(connectPartsByName.items())
+        if not instances:
+            return []
+
+        pool = ThreadPool(min(self.maxParallel, len(instances)))
+        try:
+            return pool.map(lambda anInstance: self.runOnInstance(anInstance[0], anInstance[1], command, extraOptions),
+                            instances)
+        finally:
+            pool.close()
+            pool.join()
+
+
+def formatSummary(results, timeout=DEFAULT_TIMEOUT):
+    """Return the lines that summarize how the command went on each host."""
+    failed = [aResult for aResult in results if aResult.TimedOut or aResult.ExitCode != 0]
+
+    retLines = ["Summary: {} hosts, {} succeeded, {} failed".format(len(results), len(results) - len(failed),
+                                                                   len(failed))]
+    for aResult in failed:
+        if aResult.TimedOut:
+            reason = "timed out after {} seconds".format(timeout)
+        elif aResult.ExitCode is None:
+            reason = "ssh could not be run"
+        elif aResult.ExitCode == SSH_ERROR_EXIT_CODE:
+            reason = "CRITICAL: this host could not be reached (ssh exit code {})".format(aResult.ExitCode)
+        else:
+            reason = "exit code {}".format(aResult.ExitCode)
+        retLines.append("    {}: {}".format(aResult.InstanceName, reason))
+
+    return retLines
+
+
+def checkArgs():
+    """Check the command line arguments."""
+    parser = argparse.ArgumentParser(
+        description=('This script runs a command on a set of instances at the same time over ssh and writes the '
+                     'output of each host as it comes in, followed by a summary of the exit codes.'))
+    parser.add_argument('-o', '--organization', help='The organization (customer name) that the instances are for',
+                        required=False)
+    parser.add_argument('-r', '--regions', help='A list of regions separated by a space to look for the instances in',
+                        required=False)
+    parser.add_argument('-t', '--tags', help='A list of key=value pairs separated by a space (no space before or after '
+                                             'the equal sign).  This will be used to filter the instances to run the '
+                                             'command on',
+                        required=False)
+    parser.add_argument('-w', '--hosts', help='A list of instance names separated by a comma to run the command on',
+                        required=False)
+    parser.add_argument('-kd', '--keysDirectory', help='This is the path to where the key resides on your system ',
+                        required=False)
+    parser.add_argument('-sd', '--sharedDirectory', help='This is the path to the shared drive on the system this is '
+                                                         'running on.',
+                        required=False)
+    parser.add_argument('-mp', '--maxParallel', help='The maximum number of hosts to run the command on at the same '
+                                                     'time. DEFAULT: ' + str(DEFAULT_MAX_PARALLEL),
+                        type=int, default=DEFAULT_MAX_PARALLEL,
+                        required=False)
+    parser.add_argument('--timeout', help='The number of seconds the command can run on a host before it is stopped. '
+                                          'Use 0 to not stop it. DEFAULT: ' + str(DEFAULT_TIMEOUT),
+                        type=int, default=DEFAULT_TIMEOUT,
+                        required=False)
+    parser.add_argument('--connectTimeout', help='The number of seconds to wait for the ssh connection to a host. '
+                                                 'DEFAULT: ' + str(DEFAULT_CONNECT_TIMEOUT),
+                        type=int, default=DEFAULT_CONNECT_TIMEOUT,
+                        required=False)
+    parser.add_argument('--noDaemon', help='Do not ask the inventory daemon (instanceinfod.py) for the instances even '
+                                           'if it is running.',
+                        action="store_true",
+                        required=False)
+    parser.add_argument('--noSessions', help='Make a new ssh connection to each host rather than using (and starting '
+                                             'if needed) the shared ssh session for it.',
+                        action="store_true",
+                        required=False)
+    parser.add_argument('--persist', help='The number of seconds a shared ssh session stays open after it was last '
+                                          'used. DEFAULT: ' + str(DEFAULT_CONTROL_PERSIST),
+                        type=int, default=DEFAULT_CONTROL_PERSIST,
+                        required=False)
+    parser.add_argument('--test', help='Show the command and the hosts it would be run on without running it.',
+                        action="store_true",
+                        required=False)
+    parser.add_argument('command', help='The command to run on each of the hosts')
+    args = parser.parse_args()
+
+    retHosts = [aHost for aHost in args.hosts.split(",") if aHost] if args.hosts else []
+
+    return (args.organization, parseRegionString(args.regions), parseTagString(args.tags), retHosts,
+            args.keysDirectory, args.sharedDirectory, args.maxParallel, args.timeout, args.connectTimeout,
+            not args.noDaemon, not args.noSessions, args.persist, args.test, args.command)
+
+
+def main(argv):
+    """Main code goes here."""
+    (organization, regions, tagList, hosts, keysDir, sharedDir, maxParallel, timeout, connectTimeout, useDaemon,
+     useSessions, persist, testOnly, command) = checkArgs()
+
+    connectPartsByName = getConnectPartsForInstances(organization, regions, keysDir, sharedDir, tagList, useDaemon)
+    if hosts:
+        for aHost in hosts:
+            if aHost not in connectPartsByName:
+                sys.stderr.write("WARNING: no running instance was found for {}\n".format(aHost))
+        connectPartsByName = OrderedDict((aName, connectPartsByName[aName]) for aName in hosts
+                                         if aName in connectPartsByName)
+
+    if testOnly:
+        # they just want to see what would happen
+        print("")
+        print("Test would run command: " + command)
+        print("")
+        print("For these hosts:")
+        for aName in connectPartsByName:
+            print(aName)
+        print("")
+        return
+
+    if not connectPartsByName:
+        print("No instances were found to run the command on.")
+        sys.exit(1)
+
+    sessionPool = SSHSessionPool(persist=persist, connectTimeout=connectTimeout) if useSessions else None
+    fleetExecutor = FleetExecutor(maxParallel=maxParallel, timeout=timeout, connectTimeout=connectTimeout,
+                                  sessionPool=sessionPool)
+    results = fleetExecutor.run(connectPartsByName, command)
+
+    sys.stderr.write("\n" + "\n".join(formatSummary(results, timeout)) + "\n")
+    if any(aResult.TimedOut or aResult.ExitCode != 0 for aResult in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
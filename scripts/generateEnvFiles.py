@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+"""Generate the env files for an app from its env file layers."""
+
+# ==============================================================================
+#
+#          FILE: generateEnvFiles.py
+#
+#         USAGE: generateEnvFiles.py --type TYPE --env ENV --appName APPNAME
+#                                    --appUtilsDir DIR
+#
+#   DESCRIPTION: called by deployenv.sh to put the env files for an app
+#                together and write the files made from them.  For the
+#                docker type these are the dcEnv-APPNAME-ENV.env and .sh in
+#                the app utils environments/.generatedEnvFiles directory.
+#                For the instance type they are /etc/environment and
+#                /etc/default/supervisor.  Only the files whose inputs have
+#                changed since they were generated are written, unless
+#                --force is given.
+#
+#       OPTIONS: ---
+#  REQUIREMENTS: ---
+#          BUGS: ---
+#         NOTES: ---
+#        AUTHOR: Gregg Jensen (), gjensen@devops.center
+#                Bob Lozano (), bob@devops.center
+#  ORGANIZATION: devops.center
+#       CREATED: 11/21/2016 15:13:37
+#      REVISION:  ---
+#
+# Copyright 2014-2017 devops.center llc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ==============================================================================
+
+import sys
+import os
+import argparse
+import itertools
+from os.path import expanduser
+try:
+    import envlayers
+except ImportError:
+    from scripts import envlayers
+# ==============================================================================
+"""
+this script is called by deployenv.sh in place of putting the layers together
+in a temporary file with cat and sed and running fixUpEnvFile.py on it.  The
+layers are merged from where each entry is in its file, so the values are not
+all read into memory, and a value that starts with a quote can go over more
+than one line as it can with fixUpEnvFile.py --streaming.  Each file is
+written once, atomically.
+"""
+__version__ = "0.1"
+
+__copyright__ = "Copyright 2016, devops.center"
+__credits__ = ["Bob Lozano", "Gregg Jensen"]
+__license__ = "GPL"
+__status__ = "Development"
+# ==============================================================================
+
+
+def checkArgs():
+    """Check the arguments passed in."""
+    parser = argparse.ArgumentParser(
+        description='Script that merges the env files for an application ' +
+                    'and writes the env files generated from them')
+    parser.add_argument('--type', help='Either docker or instance. ' +
+                        'DEFAULT: docker',
+                        choices=['docker', 'instance'],
+                        default='docker',
+                        required=False)
+    parser.add_argument('-e', '--env', help='the env is one of local, dev, ' +
+                        'staging, prod. DEFAULT: local',
+                        default='local',
+                        required=False)
+    parser.add_argument('-a', '--appName', help='The application name',
+                        required=True)
+    parser.add_argument('--appUtilsDir', help='The application utils ' +
+                        'directory that has the environments directory in it',
+                        required=True)
+    parser.add_argument('--dcUtils', help='The dcUtils directory that has ' +
+                        'the common.env in its environments directory. ' +
+                        'DEFAULT: $dcUTILS',
+                        default=os.getenv("dcUTILS"),
+                        required=False)
+    parser.add_argument('--runAs', help='The alternate name given to ' +
+                        'deployenv.sh --run-as, for a local env the ' +
+                        'personal_RUNAS.env is used rather than personal.env',
+                        required=False)
+    parser.add_argument('--baseCustomerDir', help='The BASE_CUSTOMER_DIR ' +
+                        'put in the docker env files',
+                        default='',
+                        required=False)
+    parser.add_argument('--appUtils', help='The CUSTOMER_APP_UTILS put in ' +
+                        'the docker env files',
+                        default='',
+                        required=False)
+    parser.add_argument('--appWeb', help='The CUSTOMER_APP_WEB put in the ' +
+                        'docker env files',
+                        default='',
+                        required=False)
+    parser.add_argument('--dcConfigDir', help='The directory with the ' +
+                        'instance-*.env files in it for an instance. ' +
+                        'DEFAULT: ~/.dcConfig',
+                        default=expanduser("~") + "/.dcConfig",
+                        required=False)
+    parser.add_argument('--environmentFile', help='The environment file ' +
+                        'written for an instance. DEFAULT: /etc/environment',
+                        default='/etc/environment',
+                        required=False)
+    parser.add_argument('--supervisorFile', help='The supervisor defaults ' +
+                        'file written for an instance. ' +
+                        'DEFAULT: /etc/default/supervisor',
+                        default='/etc/default/supervisor',
+                        required=False)
+    parser.add_argument('--force', help='Write all the generated files ' +
+                        'even when the env files they are generated from ' +
+                        'have not changed',
+                        action="store_true",
+                        required=False)
+    args = parser.parse_args()
+
+    if not args.dcUtils:
+        print('The dcUtils directory has to be given with --dcUtils or ' +
+              'the dcUTILS environment variable')
+        sys.exit(1)
+
+    return args
+
+
+def generateDockerFiles(args):
+    """Write the dcEnv-APPNAME-ENV.env and .sh files for the app."""
+    envList = {"BASE_CUSTOMER_DIR": args.baseCustomerDir,
+               "CUSTOMER_APP_UTILS": args.appUtils,
+               "CUSTOMER_APP_WEB": args.appWeb}
+    try:
+        layerFiles = envlayers.getLayerFiles(args.dcUtils, args.appUtilsDir,
+                                             args.env, args.runAs)
+    except IOError as e:
+        print("NOTE: " + str(e) + ". Exiting.")
+        sys.exit(1)
+
+    generatedDir = args.appUtilsDir + "/environments/.generatedEnvFiles"
+    baseName = generatedDir + "/dcEnv-" + args.appName + "-" + args.env
+    params = {"type": "docker", "appName": args.appName, "env": args.env,
+              "runAs": args.runAs, "envList": envList}
+
+    def renderOutputs():
+        merged = envlayers.mergeLayerEntries(layerFiles, envList, args.env,
+                                             args.appName)
+        return [(baseName + ".env", envlayers.iterMergedChunks(merged)),
+                (baseName + ".sh",
+                 envlayers.iterMergedChunks(merged, "export "))]
+
+    generateOutputs(args, layerFiles, params,
+                    generatedDir + "/.generated-" + args.appName + "-" +
+                    args.env + ".deps",
+                    [baseName + ".env", baseName + ".sh"], renderOutputs)
+
+
+def generateInstanceFiles(args):
+    """Write the /etc/environment and /etc/default/supervisor files."""
+    # the instance.env has the tags for this instance that will be made to be
+    # environment variables
+    instanceEnvFile = None
+    if os.path.isfile(args.dcConfigDir + "/instance.env"):
+        instanceEnvFile = envlayers.collectInstanceEnvFiles(args.dcConfigDir)
+
+    layerFiles = envlayers.getInstanceLayerFiles(
+        args.dcUtils, args.appUtilsDir, args.env, instanceEnvFile)
+
+    # the /etc/environment starts from the one the instance came with, saved
+    # the first time this is run, then has the dcUTILS path before the rest
+    originalFile = args.environmentFile + ".ORIG"
+    params = {"type": "instance", "env": args.env}
+
+    def renderOutputs():
+        merged = envlayers.mergeLayerEntries(layerFiles, {}, args.env)
+        originalText = b''
+        if os.path.isfile(originalFile):
+            with open(originalFile, 'rb') as f:
+                originalText = f.read()
+            if originalText and not originalText.endswith(b'\n'):
+                originalText += b'\n'
+
+        return [(args.environmentFile,
+                 itertools.chain([originalText, b"dcUTILS=~/dcUtils\n"],
+                                 envlayers.iterMergedChunks(merged))),
+                (args.supervisorFile,
+                 envlayers.iterMergedChunks(merged, "export "))]
+
+    depsFile = args.dcConfigDir + "/.instance-env.deps"
+    generateOutputs(args, layerFiles + [("environment.ORIG", originalFile)],
+                    params, depsFile,
+                    [args.environmentFile, args.supervisorFile], renderOutputs)
+
+    # this is run with sudo to write the /etc files, but the ones in the
+    # ~/.dcConfig stay the user's
+    for aPath in (instanceEnvFile, depsFile):
+        if aPath:
+            giveToInvokingUser(aPath)
+
+
+def giveToInvokingUser(aPath):
+    """Give a file written while running with sudo back to the sudo user."""
+    sudoUid = os.environ.get("SUDO_UID")
+    if os.geteuid() != 0 or not sudoUid or not os.path.exists(aPath):
+        return
+
+    os.chown(aPath, int(sudoUid), int(os.environ.get("SUDO_GID", -1)))
+
+
+def generateOutputs(args, inputFiles, params, depsFile, outputPaths,
+                    renderOutputs):
+    """Write the outputs that are out of date with their inputs.
+
+    renderOutputs returns the path of each output and the chunks of bytes
+    that go in it, it is only called when an input has changed or an output
+    isn't what was written last time.
+    """
+    inputs = dict((aPath, envlayers.hashFile(aPath))
+                  for name, aPath in inputFiles if aPath)
+
+    if not args.force and envlayers.isUpToDate(depsFile, inputs, params,
+                                               outputPaths):
+        print("The generated env files are up to date with the env files " +
+              "they are generated from")
+        return
+
+    for aPath, chunks in renderOutputs():
+        if envlayers.writeChunksIfChanged(aPath, chunks, args.force):
+            print("Generated " + aPath)
+
+    envlayers.writeDependencies(depsFile, inputs, params, outputPaths)
+
+
+def main(argv):
+    """Execute the script."""
+    args = checkArgs()
+
+    if args.type == "instance":
+        generateInstanceFiles(args)
+    else:
+        generateDockerFiles(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+"""
+Docstring for hostaccess.py. This script checks that each of the instances that
+InstanceInfo finds can be logged into with ssh, and that each of the jump servers
+(gateways) in front of them can be too.  The hosts are all checked at the same
+time and each one that can't be logged into is put into one of these categories:
+
+    auth        the host answered but the key wasn't accepted
+    timeout     the host didn't answer in time
+    dns         the host name couldn't be looked up
+    gateway     the jump server in front of the host couldn't be logged into
+    hostkey     the host key didn't match the one that is known for the host
+    refused     the host refused the connection
+    error       anything else
+
+A report sorted with the failures first is printed, or json with --json.  As with
+the sshcmd.exp script that paws -x used before, the host keys of hosts that
+haven't been seen before are accepted and added to the known hosts.
+"""
+
+import os
+import sys
+import argparse
+import json
+import time
+import subprocess
+from collections import namedtuple, OrderedDict
+from instanceinfo import parseRegionString, parseTagString
+from sshsessions import createSSHCommand, startProcessTimer, runForEach
+from fleetexec import getConnectPartsForInstances
+
+# ==============================================================================
+__version__ = "0.1"
+
+__copyright__ = "Copyright 2017, devops.center"
+__credits__ = ["Bob Lozano", "Gregg Jensen"]
+__license__ = ' \
+   # Copyright 2014-2017 devops.center llc                                    \
+   #                                                                          \
+   # Licensed under the Apache License, Version 2.0 (the "License");          \
+   # you may not use this file except in compliance with the License.         \
+   # You may obtain a copy of the License at                                  \
+   #                                                                          \
+   #   http://www.apache.org/licenses/LICENSE-2.0                             \
+   #                                                                          \
+   # Unless required by applicable law or agreed to in writing, software      \
+   # distributed under the License is distributed on an "AS IS" BASIS,        \
+   # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. \
+   # See the License for the specific language governing permissions and      \
+   # limitations under the License.                                           \
+   # '
+__status__ = "Development"
+
+# the number of hosts that are checked at the same time
+DEFAULT_MAX_PARALLEL = 64
+
+# the number of seconds ssh waits for the connection to a host to be made
+DEFAULT_CONNECT_TIMEOUT = 10
+
+# the text ssh writes for each kind of failure, checked in this order
+FAILURE_PATTERNS = [
+    ("hostkey", ["Host key verification failed", "REMOTE HOST IDENTIFICATION HAS CHANGED"]),
+    ("auth", ["Permission denied", "Too many authentication failures", "no such identity"]),
+    ("dns", ["Could not resolve hostname", "Name or service not known", "nodename nor servname",
+             "Temporary failure in name resolution"]),
+    ("timeout", ["timed out", "Connection timed out", "Operation timed out"]),
+    ("refused", ["Connection refused"]),
+]
+
+# the order the categories are listed in the report, the failures come before the hosts that are ok
+CATEGORY_ORDER = ["gateway", "auth", "hostkey", "dns", "timeout", "refused", "error", "ok"]
+
+# ==============================================================================
+
+AccessResult = namedtuple('AccessResult', 'Name, Kind, Session, Gateway, Category, Message, Elapsed')
+
+
+def classifyFailure(output):
+    """Return the category for why ssh failed, based on what it wrote."""
+    for category, patterns in FAILURE_PATTERNS:
+        for aPattern in patterns:
+            if aPattern in output:
+                return category
+
+    return "error"
+
+
+def getFailureMessage(output):
+    """Return the last line ssh wrote, which is the one that says why it failed."""
+    lines = [aLine.strip() for aLine in output.splitlines() if aLine.strip()]
+    return lines[-1] if lines else ''
+
+
+def getGatewayKey(connectParts):
+    """Return the string that names the jump server an instance is reached through, or None if there isn't one."""
+    if not connectParts.get("JumpServerHost"):
+        return None
+
+    return "{}@{}:{}".format(connectParts["JumpServerLogin"], connectParts["JumpServerHost"],
+                             connectParts.get("JumpServerPort") or 22)
+
+
+def getGatewayConnectParts(connectParts):
+    """Return the connect parts for logging into the jump server in front of an instance."""
+    return {"DestHost": connectParts["JumpServerHost"], "DestSSHPort": connectParts.get("JumpServerPort"),
+            "DestLogin": connectParts["JumpServerLogin"], "DestKey": connectParts.get("JumpServerKey")}
+
+
+class HostAccessChecker:
+
+    def __init__(self, maxParallel=DEFAULT_MAX_PARALLEL, connectTimeout=DEFAULT_CONNECT_TIMEOUT):
+        """Construct an instance of the HostAccessChecker class."""
+        self.maxParallel = maxParallel if maxParallel and maxParallel > 0 else 1
+        self.connectTimeout = connectTimeout
+
+    def probe(self, name, kind, connectParts, gateway=None):
+        """Log into one host and right back out, and return how it went."""
+        # the ssh to the jump server gets the same options, so it can't stop to ask for a password or about the host
+        # key either, and its failure is reported as what it was rather than as the outer ssh timing out
+        probeOptions = ["-o", "StrictHostKeyChecking=no"]
+        sshCommand = createSSHCommand(connectParts, "exit 0", self.connectTimeout, probeOptions,
+                                      ["-o", "BatchMode=yes", "-o", "ConnectTimeout=" + str(self.connectTimeout)] +
+                                      probeOptions)
+        session = "{}@{}:{}".format(connectParts.get("DestLogin") or "ubuntu", connectParts["DestHost"],
+                                    connectParts.get("DestSSHPort") or 22)
+        startTime = time.time()
+
+        devNull = open(os.devnull, 'r')
+        try:
+            # its own process group so that the ProxyCommand is stopped along with it
+            process = subprocess.Popen(sshCommand, stdin=devNull, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       preexec_fn=os.setsid)
+        except OSError as e:
+            return AccessResult(Name=name, Kind=kind, Session=session, Gateway=gateway, Category="error",
+                                Message="could not run ssh: {}".format(e), Elapsed=0)
+        finally:
+            devNull.close()
+
+        # the connect timeout covers the connection, this covers a host that connects and then hangs
+        timedOut = []
+        timer = startProcessTimer(process, self.connectTimeout * 3, timedOut)
+        try:
+            output = process.communicate()[0].decode('utf-8', 'replace')
+        finally:
+            timer.cancel()
+
+        if timedOut:
+            category = "timeout"
+            message = "no answer after {} seconds".format(self.connectTimeout * 3)
+        elif process.returncode == 0:
+            category = "ok"
+            message = ''
+        else:
+            category = classifyFailure(output)
+            message = getFailureMessage(output)
+
+        return AccessResult(Name=name, Kind=kind, Session=session, Gateway=gateway, Category=category,
+                            Message=message, Elapsed=round(time.time() - startTime, 2))
+
+    def check(self, connectPartsByName):
+        """Check the jump servers and the instances at the same time and return the results in report order."""
+        probes = []
+        gateways = OrderedDict()
+        for connectParts in connectPartsByName.values():
+            gatewayKey = getGatewayKey(connectParts)
+            if gatewayKey and gatewayKey not in gateways:
+                gateways[gatewayKey] = getGatewayConnectParts(connectParts)
+        for gatewayKey, gatewayParts in gateways.items():
+            probes.append((gatewayKey, "gateway", gatewayParts, None))
+        for instanceName, connectParts in connectPartsByName.items():
+            probes.append((instanceName, "instance", connectParts, getGatewayKey(connectParts)))
+
+        results = runForEach(lambda aProbe: self.probe(*aProbe), probes, self.maxParallel)
+
+        # an instance that couldn't be reached because its gateway couldn't be logged into is put down to the gateway
+        failedGateways = set(aResult.Name for aResult in results
+                             if aResult.Kind == "gateway" and aResult.Category != "ok")
+        results = [aResult._replace(Category="gateway") if aResult.Kind == "instance" and aResult.Category != "ok"
+                   and aResult.Gateway in failedGateways else aResult for aResult in results]
+
+        # the failures come first, with the gateways ahead of the instances since they explain the instances behind them
+        return sorted(results, key=lambda aResult: (aResult.Category == "ok", aResult.Kind != "gateway",
+                                                    CATEGORY_ORDER.index(aResult.Category), aResult.Name))
+
+
+def formatReport(results):
+    """Return the lines of the readable report for the results."""
+    instanceResults = [aResult for aResult in results if aResult.Kind == "instance"]
+    gatewayResults = [aResult for aResult in results if aResult.Kind == "gateway"]
+    failedCounts = OrderedDict()
+    for aResult in instanceResults:
+        if aResult.Category != "ok":
+            failedCounts[aResult.Category] = failedCounts.get(aResult.Category, 0) + 1
+
+    numFailed = sum(failedCounts.values())
+    summary = "Host access: {} hosts, {} ok, {} failed".format(len(instanceResults),
+                                                                len(instanceResults) - numFailed, numFailed)
+    if failedCounts:
+        summary += " (" + ", ".join("{} {}".format(count, category) for category, count in failedCounts.items()) + ")"
+    if gatewayResults:
+        summary += "; {} gateways, {} failed".format(len(gatewayResults),
+                                                     len([aResult for aResult in gatewayResults
+                                                          if aResult.Category != "ok"]))
+
+    retLines = [summary, ""]
+    for aResult in results:
+        name = aResult.Name if aResult.Kind == "instance" else "gateway " + aResult.Name
+        if aResult.Category == "ok":
+            retLines.append("    {:<8} {}".format("ok", name))
+        else:
+            session = aResult.Session if aResult.Kind == "instance" else ''
+            if aResult.Gateway:
+                session += " via " + aResult.Gateway
+            retLines.append("    {:<8} {}{} {}".format(aResult.Category, name, " (" + session + ")" if session else '',
+                                                      aResult.Message))
+
+    return retLines
+
+
+def checkArgs():
+    """Check the command line arguments."""
+    parser = argparse.ArgumentParser(
+        description=('This script checks that each of the instances, and the jump servers in front of them, can be '
+                     'logged into with ssh and reports why the ones that can not be failed.'))
+    parser.add_argument('-o', '--organization', help='The organization (customer name) that the instances are for',
+                        required=False)
+    parser.add_argument('-r', '--regions', help='A list of regions separated by a space to look for the instances in',
+                        required=False)
+    parser.add_argument('-t', '--tags', help='A list of key=value pairs separated by a space (no space before or after '
+                                             'the equal sign).  This will be used to filter the instances to check',
+                        required=False)
+    parser.add_argument('-kd', '--keysDirectory', help='This is the path to where the key resides on your system ',
+                        required=False)
+    parser.add_argument('-sd', '--sharedDirectory', help='This is the path to the shared drive on the system this is '
+                                                         'running on.',
+                        required=False)
+    parser.add_argument('-mp', '--maxParallel', help='The maximum number of hosts to check at the same time. '
+                                                     'DEFAULT: ' + str(DEFAULT_MAX_PARALLEL),
+                        type=int, default=DEFAULT_MAX_PARALLEL,
+                        required=False)
+    parser.add_argument('--connectTimeout', help='The number of seconds to wait for the ssh connection to a host. '
+                                                 'DEFAULT: ' + str(DEFAULT_CONNECT_TIMEOUT),
+                        type=int, default=DEFAULT_CONNECT_TIMEOUT,
+                        required=False)
+    parser.add_argument('--json', help='Print the results as json rather than as a report.',
+                        action="store_true",
+                        required=False)
+    parser.add_argument('--noDaemon', help='Do not ask the inventory daemon (instanceinfod.py) for the instances even '
+                                           'if it is running.',
+                        action="store_true",
+                        required=False)
+    parser.add_argument('--test', help='Show the hosts that would be checked without checking them.',
+                        action="store_true",
+                        required=False)
+    args = parser.parse_args()
+
+    return (args.organization, parseRegionString(args.regions), parseTagString(args.tags), args.keysDirectory,
+            args.sharedDirectory, args.maxParallel, args.connectTimeout, args.json, not args.noDaemon, args.test)
+
+
+def main(argv):
+    """Main code goes here."""
+    (organization, regions, tagList, keysDir, sharedDir, maxParallel, connectTimeout, asJson, useDaemon,
+     testOnly) = checkArgs()
+
+    connectPartsByName = getConnectPartsForInstances(organization, regions, keysDir, sharedDir, tagList, useDaemon)
+
+    if testOnly:
+        # they just want to see what would happen
+        print("Would check the following hosts for access:")
+        print("")
+        for instanceName in connectPartsByName:
+            print(instanceName)
+        print("")
+        return
+
+    hostAccessChecker = HostAccessChecker(maxParallel=maxParallel, connectTimeout=connectTimeout)
+    results = hostAccessChecker.check(connectPartsByName)
+
+    if asJson:
+        print(json.dumps([aResult._asdict() for aResult in results], indent=4))
+    else:
+        print("\n".join(formatReport(results)))
+
+    if any(aResult.Category != "ok" for aResult in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -12,6 +12,9 @@ IPAddressSet = namedtuple('IPAddressSet', 'PublicIpAddress, PublicDnsName, Publi
 
 ConnectParts are the elements that can be combined to form an SSH or SCP connect string for an instance.
 ConnectParts = namedtuple('ConnectParts', 'DestHost, DestSSHPort, DestSCPPort, DestLogin, DestKey, JumpServerPart')
+
+InstanceDetails is what is returned for each instance found.  It is defined once, at the module level, as a
+namedtuple with no per instance __dict__ so a large list of them stays small.
 """
 
 import os
@@ -19,10 +22,16 @@ import sys
 import argparse
 import json
 import re
-import boto3
-from botocore.exceptions import ClientError
-from collections import namedtuple
+import socket
+import time
+from collections import namedtuple, OrderedDict
 from os.path import expanduser
+try:
+    from inventorycache import InventoryCache, DEFAULT_CACHE_TTL
+    import dcsettings
+except ImportError:
+    from scripts.inventorycache import InventoryCache, DEFAULT_CACHE_TTL
+    from scripts import dcsettings
 
 # ==============================================================================
 __version__ = "0.1"
@@ -46,25 +55,197 @@ __license__ = ' \
    # '
 __status__ = "Development"
 
+# the default number of regions that will be queried at the same time when run from the command line
+DEFAULT_MAX_WORKERS = 8
+
+# the number of instances asked for in each describe_instances page, AWS allows anywhere from 5 to 1000
+DEFAULT_PAGE_SIZE = 100
+MIN_PAGE_SIZE = 5
+MAX_PAGE_SIZE = 1000
+
+# where the inventory daemon (instanceinfod.py) listens for the shell command requests
+DEFAULT_SOCKET_PATH = "~/.dcConfig/instanceinfod.sock"
+
+# how long to wait to connect to the daemon, a daemon that is running accepts right away so one that doesn't is hung
+DAEMON_CONNECT_TIMEOUT = 2
+
+# how long in all to wait for the daemon's answer before doing the work here instead.  It answers from what it has
+# loaded, so this only has to cover a --refresh that has it ask AWS again
+DAEMON_RESPONSE_TIMEOUT = 30
+
+# boto3 (and botocore) take a noticeable amount of time to import, so they are only imported when a region actually
+# has to be asked for its instances.  When the daemon answers, or the cache has everything, they are never loaded.
+boto3 = None
+
+# the compiled regular expression for each wildcard tag value that has been filtered on
+tagPatterns = {}
+
+# the most compiled tag patterns kept at once, the daemon runs for a long time and would otherwise keep every
+# wildcard it was ever asked for
+MAX_TAG_PATTERNS = 256
+
+# the only parts of an instance that are kept once it has been found, the rest of what AWS returns for an instance
+# (block devices, network interfaces, ...) isn't used and would just take up memory for every instance
+INSTANCE_FIELDS = ('PublicIpAddress', 'PublicDnsName', 'PublicPort', 'PrivateIpAddress', 'PrivateDnsName',
+                   'PrivatePort', 'JumpServer', 'UserLogin')
+
+# the tags that mark an AWS instance as only an association, these are never returned
+EXCLUDED_TAG_KEYS = ('instance-association',)
+
+# the index of each VM config file that has been read, along with the mtime and size of the file when it was read
+vmConfigIndexes = {}
+
+# the names of the files in each directory searched for keys along with the directory's mtime when it was read
+keyDirectories = {}
 
 # ==============================================================================
 
 
+def importBoto3():
+    """Import boto3 the first time it is needed."""
+    global boto3
+    if boto3 is None:
+        import boto3 as boto3Module
+        boto3 = boto3Module
+
+
+def getTagPattern(tagValue):
+    """Return the compiled regular expression for a wildcard tag value, compiling it only the first time."""
+    pattern = tagPatterns.get(tagValue)
+    if pattern is None:
+        # update the search mechanism to make this behave like AWS search.
+        pattern = re.compile('^' + tagValue.replace('*', '.*'))
+        if len(tagPatterns) >= MAX_TAG_PATTERNS:
+            tagPatterns.clear()
+        tagPatterns[tagValue] = pattern
+
+    return pattern
+
+
+def getKeyFilesInDirectory(aPath):
+    """Return the set of file names in a key directory, only reading the directory again when its mtime changes."""
+    try:
+        dirMTime = os.stat(aPath).st_mtime
+    except OSError:
+        # the directory isn't there (yet), so there aren't any keys in it
+        keyDirectories.pop(aPath, None)
+        return frozenset()
+
+    cached = keyDirectories.get(aPath)
+    if cached is None or cached[0] != dirMTime:
+        try:
+            fileNames = frozenset(os.listdir(aPath))
+        except OSError:
+            fileNames = frozenset()
+        cached = (dirMTime, fileNames)
+        keyDirectories[aPath] = cached
+
+    return cached[1]
+
+
+class FilterPlan(namedtuple('FilterPlan', 'SourceFilters, ExcludedTagKeys')):
+    """The filters a region's source applies and the ones that are left to be applied as the instances come back."""
+    __slots__ = ()
+
+
+class VMConfigIndex:
+
+    def __init__(self, instances):
+        """Construct an instance of the VMConfigIndex class for the instances in a VM config file."""
+        self.instances = instances
+        # tag key -> tag value -> the positions of the instances that have it
+        self.tagIndex = {}
+        for position, anInstance in enumerate(instances):
+            for tags in anInstance.get("Tags", []):
+                self.tagIndex.setdefault(tags["Key"], {}).setdefault(tags["Value"], set()).add(position)
+
+    def findInstances(self, filterList):
+        """Return the running instances that match one of the values for each of the tags, in the file's order."""
+        positions = self.tagIndex.get('instance-state-name', {}).get('running', set())
+        for tagKey, tagValues in filterList.items():
+            valuesForKey = self.tagIndex.get(tagKey, {})
+            positionsForKey = set()
+            for aValue in tagValues:
+                if '*' in aValue:
+                    # a wildcard is matched against the distinct values of the tag rather than every instance
+                    pattern = getTagPattern(aValue)
+                    for tagValue, tagPositions in valuesForKey.items():
+                        if pattern.match(tagValue):
+                            positionsForKey |= tagPositions
+                else:
+                    positionsForKey |= valuesForKey.get(aValue, set())
+
+            positions = positions & positionsForKey
+            if not positions:
+                return []
+
+        return [self.instances[position] for position in sorted(positions)]
+
+
+def getVMConfigIndex(configFilePath):
+    """Return the index for a VM config file, only reading and indexing the file again when it changes."""
+    fileStat = os.stat(configFilePath)
+    fileVersion = (fileStat.st_mtime, fileStat.st_size)
+
+    cached = vmConfigIndexes.get(configFilePath)
+    if cached is None or cached[0] != fileVersion:
+        with open(configFilePath) as data_file:
+            data = json.load(data_file)
+        cached = (fileVersion, VMConfigIndex(data['Instances']))
+        vmConfigIndexes[configFilePath] = cached
+
+    return cached[1]
+
+
+def getCompactRecord(anInstance):
+    """Return the parts of an instance that are used once it has been found: INSTANCE_FIELDS, its tags and key."""
+    compactRecord = dict((aField, anInstance[aField]) for aField in INSTANCE_FIELDS if aField in anInstance)
+    compactRecord["Tags"] = anInstance.get("Tags", [])
+    compactRecord["KeyName"] = anInstance.get("KeyName")
+    return compactRecord
+
+
+def matchesResidualFilters(anInstance, filterPlan):
+    """Check an instance against the filters that its source couldn't apply."""
+    for tags in anInstance.get("Tags", []):
+        if tags["Key"] in filterPlan.ExcludedTagKeys:
+            return False
+
+    return True
+
+
+class InstanceDetails(namedtuple('InstanceDetails', 'PublicIpAddress, PublicDnsName, PublicPort, '
+                                                   'PrivateIpAddress, PrivateDnsName, PrivatePort, '
+                                                   'Gateway, '
+                                                   'InstanceName, DestLogin, DestKey, Shard, Tags')):
+    """The details returned for each instance found."""
+    __slots__ = ()
+
+
 class InstanceInfo:
 
-    def __init__(self, organization=None, keysDir=None, regions=None, sharedDir=None):
+    def __init__(self, organization=None, keysDir=None, regions=None, sharedDir=None, maxWorkers=1,
+                 pageSize=DEFAULT_PAGE_SIZE, inventoryCache=None, sessionFactory=None):
         """Construct an instance of the InstanceInfo class."""
         self.organization = organization
+        self.maxWorkers = maxWorkers if maxWorkers and maxWorkers > 0 else 1
+        self.pageSize = min(max(pageSize or DEFAULT_PAGE_SIZE, MIN_PAGE_SIZE), MAX_PAGE_SIZE)
+        self.inventoryCache = inventoryCache
+        # an optional callable(organization, regionName) that hands back a session, used to reuse sessions
+        self.sessionFactory = sessionFactory
+        self.sharedSettingsFile = None
         self.keysDirectory = keysDir
         self.regionsToSearch = regions
         self.customerRegionsToSearch = []
         self.allInstances = {}
         self.allRegions = []
         self.instances = {}
+        # JumpServerName -> the Gateway entry for it, built once from all the regions when they are read in
         self.jumpServers = {}
         self.filters = {}
         self.sharedDirectory = sharedDir
-        self.lastReturnedListOfInstances = {}
+        # the instances are kept in the order the regions were merged in, which a dict doesn't do on python 2
+        self.lastReturnedListOfInstances = OrderedDict()
         self.lastReturnedListOfIPAddresses = []
         self.lastReturnedListOfKeyAndPaths = []
 
@@ -103,8 +284,9 @@ class InstanceInfo:
             commonSharedFile = self.sharedDirectory + "/devops.center/dcConfig/settings.json"
 
         # read in the shared settings file
+        self.sharedSettingsFile = expanduser(commonSharedFile)
         try:
-            with open(expanduser(commonSharedFile)) as data_file:
+            with open(self.sharedSettingsFile) as data_file:
                 settingsRaw = json.load(data_file)
         except IOError as e:
             print("ERROR trying to read the shared settings file for {}".format(self.organization))
@@ -115,23 +297,21 @@ class InstanceInfo:
             self.organization = self.getSettingsValue('PROFILE')
 
         self.allRegions = settingsRaw['Regions']
+        self.createJumpServerMap()
+
+    def createJumpServerMap(self):
+        """Map each JumpServerName to its Gateway entry so looking up an instance's jumpserver is one lookup."""
+        self.jumpServers = {}
+        # the jumpserver can be in a region other than the ones being searched, so all the regions are used.  If the
+        # same name is used in more than one region the first one defined is used.
+        for region in self.allRegions:
+            for jumpServer in region.get("Gateway", []):
+                if jumpServer["JumpServerName"] not in self.jumpServers:
+                    self.jumpServers[jumpServer["JumpServerName"]] = jumpServer
 
     def getSettingsValue(self,theKey):
         """Read the ~/.dcConfig/settings file."""
-        baseSettingsFile = expanduser("~") + "/.dcConfig/settings"
-        try:
-            with open(baseSettingsFile, 'r') as f:
-                lines = [line.rstrip('\n') for line in f]
-        except IOError as e:
-            return None
-
-        retValue = None
-        for aLine in lines:
-            if re.search("^"+theKey+"=", aLine):
-                retValue = aLine.split("=")[1].replace('"', '')
-                break
-
-        return retValue
+        return dcsettings.getSettingsValue(theKey)
 
     def getRegionsToSearch(self):
         """Match up the regions passed in with the regions that the user has defined."""
@@ -154,18 +334,11 @@ class InstanceInfo:
         # select the regions based upon the regions the user passed in
         self.getRegionsToSearch()
 
-        # if we get here there are customer regions that match the regions we need to search in
-        # so we need to loop through all the regions to search, looking for the instances that match the filters
-        for regionInfo in self.customerRegionsToSearch:
-            if regionInfo['InstanceType'] == "AWS":
-                self.getInstancesFromAWS(filterList)
-            elif regionInfo['InstanceType'] == "VM":
-                self.readInstanceConfigFile(regionInfo['configFileName'])
-                self.applyVMFilters(filterList)
-            else:
-                print("Error: Unknown InstanceType({}) for region: {}".format(regionInfo['InstanceType'],
-                                                                              regionInfo['RegionName']),
-                                                                              regionInfo['RegionName'])
+        # if we get here there are customer regions that match the regions we need to search in so go get the
+        # instances from each of them (at the same time if maxWorkers allows it) and then merge what came back in
+        # the order the regions are defined, so the results are the same no matter which region answers first
+        for regionInfo, regionInstances in self.discoverRegions(filterList):
+            self.mergeRegionInstances(regionInfo, regionInstances, filterList)
 
         for theInstanceName in self.lastReturnedListOfInstances:
             anInst = self.lastReturnedListOfInstances[theInstanceName]
@@ -191,12 +364,6 @@ class InstanceInfo:
 
             retKeyList = self.determineWhereKeyExists(retKeyList, self.keysDirectory)
 
-            # create a named tuple to return
-            InstanceDetails = namedtuple('InstanceDetails', 'PublicIpAddress, PublicDnsName, PublicPort, '
-                                                            'PrivateIpAddress, PrivateDnsName, PrivatePort, ' 
-                                                            'Gateway, '
-                                                            'InstanceName, DestLogin, DestKey, Shard, Tags')
-
             self.lastReturnedListOfIPAddresses.append(InstanceDetails(
                 PublicIpAddress=(anInst["PublicIpAddress"] if "PublicIpAddress" in anInst else ''),
                 PublicDnsName=(anInst["PublicDnsName"] if "PublicDnsName" in anInst else ''),
@@ -235,57 +402,143 @@ class InstanceInfo:
 
         return returnList
 
-    def getInstancesFromAWS(self, filterList):
-        """Create a list of IPs for the instances that are found based upon the filters from AWS."""
-        # AWS wants the filters to be a specific way, so we need to convert the passed in filterList
-        filterListToSend = self.createAWSFilterListFromDict(filterList)
-
-        # - we couldn't get here if we didn't have a customer name, so we'll use that as the profile name
-        # - next we need to see if they passed in any regions.  If they have not, then we default to what
-        #   they have defined in the ~/.aws/config
-        # - if there are one or more regions then we will loop through all the regions getting all the
-        #   instances that match the filterList
-        if self.customerRegionsToSearch and len(self.customerRegionsToSearch) > 0:
-            # looping through regions gathering data
-            for aRegion in self.customerRegionsToSearch:
-                if aRegion['InstanceType'] == 'AWS':
-                    if self.organization:
-                        aSession = boto3.Session(profile_name=self.organization, region_name=aRegion['RegionName'])
-                    else:
-                        aSession = boto3.Session(region_name=aRegion['RegionName'])
-
-                    self.getInstancesFromAWSForRegion(aSession, filterListToSend)
-
-        elif self.organization:
-            aSession = boto3.Session(profile_name=self.organization)
-            self.getInstancesFromAWSForRegion(aSession, filterListToSend)
-        else:
-            # this is when it is running on an AWS that has the IAM rule to be able to access a customers instances
-            # without a ~/.aws/{config|credentials}
-            aSession = boto3.Session()
-            self.getInstancesFromAWSForRegion(aSession, filterListToSend)
-
-    def getInstancesFromAWSForRegion(self, awsSession, filterList):
+    def iterReservationsFromAWSForRegion(self, awsSession, filterList):
+        """Yield the reservations from AWS for the region the session is for, one page at a time."""
+        client = awsSession.client('ec2')
+        # use the filters to make a call to AWS using boto3 to get the the list of IPs.  The paginator follows the
+        # NextToken for us so large accounts get all of their instances and only one page is held at a time.
+        paginator = client.get_paginator('describe_instances')
+        for page in paginator.paginate(Filters=filterList, PaginationConfig={'PageSize': self.pageSize}):
+            for reservation in page['Reservations']:
+                yield reservation
+
+    def iterInstancesFromAWSForRegion(self, awsSession, filterList):
+        """Yield the raw instances from AWS for the region the session is for."""
+        for reservation in self.iterReservationsFromAWSForRegion(awsSession, filterList):
+            for anInstance in reservation['Instances']:
+                yield anInstance
+
+    def createSessionForRegion(self, regionName):
+        """Create a boto3 session for the given region using the organization as the profile if there is one."""
+        if self.sessionFactory:
+            return self.sessionFactory(self.organization, regionName)
+
+        importBoto3()
+        if self.organization:
+            return boto3.Session(profile_name=self.organization, region_name=regionName)
+
+        return boto3.Session(region_name=regionName)
+
+    def discoverRegions(self, filterList):
+        """Return (regionInfo, instances) for each region to search, in the order of the regions."""
+        regions = self.customerRegionsToSearch
+
+        if self.maxWorkers > 1 and len(regions) > 1:
+            from multiprocessing.pool import ThreadPool
+
+            def discover(regionInfo):
+                return self.discoverRegionSafely(regionInfo, filterList)
+
+            # each region gets its own session and client so they can be queried at the same time.  map hands
+            # the results back in the same order as the regions were given no matter when each one finishes.
+            pool = ThreadPool(min(self.maxWorkers, len(regions)))
+            try:
+                results = pool.map(discover, regions)
+            finally:
+                pool.close()
+                pool.join()
+
+            return zip(regions, results)
+
+        # one region at a time, each one is merged before the next one is asked
+        return ((regionInfo, self.discoverRegionSafely(regionInfo, filterList)) for regionInfo in regions)
+
+    def discoverRegionSafely(self, regionInfo, filterList):
+        """Return the instances for one region, or none of them with an error message if the region fails."""
         try:
-            client = awsSession.client('ec2')
-            # use the filters to make a call to AWS using boto3 to get the the list of IPs
-            response = client.describe_instances(Filters=filterList)
-        except ClientError as e:
-            print("Could not make a client session to AWS: \nReason: {0}".format(e))
-
-        for tmpInst in response['Reservations']:
-            self.createAllInstances(tmpInst['Instances'])
+            # all the pages are read before any of them are merged, so a region that fails partway through doesn't
+            # leave some of its instances in the results as if that was all of them
+            return list(self.discoverRegion(regionInfo, filterList))
+        except Exception as e:
+            # one region failing shouldn't take the rest of them down with it.  This goes to stderr so that the
+            # json written to stdout for the shell commands can still be used.
+            sys.stderr.write("ERROR: could not get the instances for region {}: {}\n".format(
+                regionInfo.get('RegionName'), e))
+            return []
+
+    def discoverRegion(self, regionInfo, filterList):
+        """Return the compact records of the instances for one region, from the inventory cache if it has them."""
+        if not self.inventoryCache:
+            return self.discoverRegionFromSource(regionInfo, filterList)
+
+        cacheKey = self.inventoryCache.createKey(self.organization, regionInfo['RegionName'], filterList)
+        sourceFiles = self.getRegionSourceFiles(regionInfo)
+        cachedInstances = self.inventoryCache.read(cacheKey, sourceFiles)
+        if cachedInstances is not None:
+            return cachedInstances
+
+        # the fingerprint is taken before the source files are read, so a change while they are makes the entry stale
+        sourceFingerprint = self.inventoryCache.fingerprint(sourceFiles)
+        return self.inventoryCache.write(cacheKey, sourceFingerprint,
+                                         self.discoverRegionFromSource(regionInfo, filterList))
+
+    def getRegionSourceFiles(self, regionInfo):
+        """Return the local files that the instances for a region depend on."""
+        sourceFiles = [self.sharedSettingsFile] if self.sharedSettingsFile else []
+        if regionInfo['InstanceType'] == "VM":
+            sourceFiles.append(self.getInstanceConfigFilePath(regionInfo['configFileName']))
+
+        return sourceFiles
+
+    def planRegionFilters(self, regionInfo, filterList):
+        """Split the filters into the ones the region's source can apply and the ones that are applied here."""
+        if regionInfo['InstanceType'] == "AWS":
+            # EC2 takes all the tag filters, wildcards included, and the running state.  What it can't do is leave
+            # out the instances that have a tag, so that is all that is left to do here.
+            return FilterPlan(SourceFilters=self.createAWSFilterListFromDict(filterList),
+                              ExcludedTagKeys=EXCLUDED_TAG_KEYS)
+
+        # the VM config index looks up all the tag filters, wildcards included, and the running state
+        return FilterPlan(SourceFilters=filterList or {}, ExcludedTagKeys=())
+
+    def applyResidualFilters(self, instances, filterPlan):
+        """Yield the instances that pass the filters their source couldn't apply."""
+        if not filterPlan.ExcludedTagKeys:
+            return iter(instances)
+
+        return (anInstance for anInstance in instances if matchesResidualFilters(anInstance, filterPlan))
+
+    def discoverRegionFromSource(self, regionInfo, filterList):
+        """Return the compact records of the instances for one region that match the filters.
+
+        The collected instances aren't changed.
+        """
+        if regionInfo['InstanceType'] not in ("AWS", "VM"):
+            print("Error: Unknown InstanceType({}) for region: {}".format(regionInfo['InstanceType'],
+                                                                          regionInfo['RegionName']))
+            return []
+
+        # as much of the filtering as possible is done by the source so only the matches come back from it
+        filterPlan = self.planRegionFilters(regionInfo, filterList)
+        if regionInfo['InstanceType'] == "AWS":
+            aSession = self.createSessionForRegion(regionInfo['RegionName'])
+            instances = self.iterInstancesFromAWSForRegion(aSession, filterPlan.SourceFilters)
+        else:
+            vmConfigIndex = getVMConfigIndex(self.getInstanceConfigFilePath(regionInfo['configFileName']))
+            instances = vmConfigIndex.findInstances(filterPlan.SourceFilters)
 
-        for anInstance in self.allInstances:
-            tmpInst = self.allInstances[anInstance]
-            if "instance-association" not in tmpInst["TagsDict"]:
-                self.lastReturnedListOfInstances[anInstance] = self.allInstances[anInstance]
+        # only the compact records go on from here, so that is all that is kept in the inventory cache as well
+        return (getCompactRecord(anInstance) for anInstance in self.applyResidualFilters(instances, filterPlan))
 
-    def readInstanceConfigFile(self, configFileName):
-        """read the json config file and return a List of the elements found
-        defined in the file"""
+    def mergeRegionInstances(self, regionInfo, regionInstances, filterList):
+        """Add the instances found for a region to all the instances and to the returned list of instances."""
+        # the filters have all been applied by the time the instances get here
+        for anInstance in self.createAllInstances(regionInstances):
+            self.lastReturnedListOfInstances[anInstance] = self.allInstances[anInstance]
 
-        # need to determine the path to the configFileName as it should be in the dcCOMMON_SHARED_DIR path
+    def getInstanceConfigFilePath(self, configFileName):
+        """Return the path to the VM config file, which should be in the dcCOMMON_SHARED_DIR path."""
+        sharedInstanceInfo = configFileName
         if not self.sharedDirectory:
             checkForDCInternal = self.getSettingsValue("dcInternal")
             commonSharedDir = self.getSettingsValue("dcCOMMON_SHARED_DIR")
@@ -300,62 +553,30 @@ class InstanceInfo:
         else:
             sharedInstanceInfo = self.sharedDirectory + "/devops.center/dcConfig/" + configFileName
 
-        # first read in the file
-        try:
-            with open(expanduser(sharedInstanceInfo)) as data_file:
-                self.data = json.load(data_file)
-        except IOError as e:
-            print("ERORR: with InstanceInfo.json file: {}".format(e))
-            sys.exit(1)
-
-        self.createAllInstances(self.data['Instances'])
+        return expanduser(sharedInstanceInfo)
 
     def createAllInstances(self, aSetOfInstances):
-        """Create a true dictionary for each set of tags per instance."""
+        """Create a true dictionary for each set of tags per instance and return the names of the instances."""
+        instanceNames = []
         for instance in aSetOfInstances:
             tagsDict = {}
             for tags in instance["Tags"]:
                 tagsDict[tags["Key"]] = tags["Value"]
 
-            instance["TagsDict"] = tagsDict
             instanceName = tagsDict["Name"]
-            if type(instance["KeyName"]) != list:
-                instance["KeyName"] = [str(instance["KeyName"])]
-            self.allInstances[instanceName] = instance.copy()
-
-    def checkInstanceForTags(self, anInstance, filterList):
-        """Iterate through the instances looking for the set of filters."""
-        numFilters = len(filterList)
-
-        c = 0
-        for k, v in filterList.items():
-            if k in anInstance['TagsDict']:
-                # since each value should be a list we need to go through each of them
-                for eachValue in v:
-                    if '*' in eachValue:
-                        # update the search mechanism to make this behave like AWS search.
-                        regexValue = '^' + eachValue.replace('*', '.*')
-                        if re.match(regexValue, anInstance['TagsDict'][k]):
-                            c += 1
-                            break
-                    else:
-                        if eachValue == anInstance['TagsDict'][k]:
-                            c += 1
-                            break
+            keyName = instance["KeyName"]
+            if type(keyName) != list:
+                keyName = [str(keyName)]
 
-        if c == numFilters:
-            if anInstance['TagsDict']['instance-state-name'] == "running":
-                return anInstance
-        else:
-            return None
+            # only keep the fields that are used from here on rather than a copy of everything that came back
+            compactInstance = dict((aField, instance[aField]) for aField in INSTANCE_FIELDS if aField in instance)
+            compactInstance["TagsDict"] = tagsDict
+            compactInstance["KeyName"] = keyName
 
-    def applyVMFilters(self, filterList):
-        """Create a list of instances based upon the filters."""
-        for anInstance in self.allInstances:
-            tmpInstance = self.checkInstanceForTags(self.allInstances[anInstance], filterList)
-            if tmpInstance:
-                self.lastReturnedListOfInstances[anInstance] = tmpInstance
+            self.allInstances[instanceName] = compactInstance
+            instanceNames.append(instanceName)
 
+        return instanceNames
 
     def getJumpServerInfo(self, anInstanceName):
         """Return the jumpserver/gateway connect information like: user@IP:port."""
@@ -363,14 +584,7 @@ class InstanceInfo:
             anInstInfo = self.lastReturnedListOfInstances[anInstanceName]
 
             if "JumpServer" in anInstInfo:
-                # go through each of the customer regions to search
-                for region in self.customerRegionsToSearch:
-                    # looking for a Gatway section
-                    if "Gateway" in region:
-                        # and if found go through the list to find the jumpserver match
-                        for jumpServer in region["Gateway"]:
-                            if jumpServer["JumpServerName"] == anInstInfo["JumpServer"]:
-                                return jumpServer
+                return self.jumpServers.get(anInstInfo["JumpServer"])
 
         except SystemError as e:
             print("=>{}<=".format(e))
@@ -487,6 +701,52 @@ class InstanceInfo:
 
         return retList
 
+    def getBatchInfo(self, listOfIPs):
+        """Return the IPs, connect parts, gateway info and keys for all the instances from the one discovery."""
+        connectParts = OrderedDict()
+        gatewayInfo = OrderedDict()
+        for item in listOfIPs:
+            connectParts[item.InstanceName] = self.getConnectString(item)
+            gatewayInfo[item.InstanceName] = self.getGatewayInfo(item)
+
+        return OrderedDict([("listOfIPAddresses", listOfIPs),
+                            ("connectParts", connectParts),
+                            ("gatewayInfo", gatewayInfo),
+                            ("listOfKeys", self.getListOfKeys() or []),
+                            ("sshConfig", "\n".join(self.getSSHConfig(listOfIPs)))])
+
+    def getSSHConfig(self, listOfIPs):
+        """Return the lines of an ssh config file with a Host entry for each of the instances."""
+        retLines = []
+        for item in sorted(listOfIPs, key=lambda anItem: anItem.InstanceName):
+            retLines.append("Host " + item.InstanceName)
+            # use the public address if there is one, otherwise the private one (which is what a jumpserver is for)
+            if item.PublicIpAddress:
+                retLines.append(" hostname " + item.PublicIpAddress)
+                retLines.append(" port " + str(item.PublicPort or 22))
+            else:
+                retLines.append(" hostname " + item.PrivateIpAddress)
+                retLines.append(" port " + str(item.PrivatePort or 22))
+
+            if item.DestKey:
+                retLines.append(" identityfile \"" + item.DestKey[0] + "\"")
+            retLines.append(" user " + (item.DestLogin or "ubuntu"))
+
+            if item.Gateway:
+                parts = self.getConnectString(item)
+                if parts and parts.JumpServerHost:
+                    jumpServerKey = parts.JumpServerKey[0] if type(parts.JumpServerKey) == list else parts.JumpServerKey
+                    retLines.append(" ProxyCommand ssh -i \"" + jumpServerKey + "\" -W %h:%p -p " +
+                                    str(parts.JumpServerPort) + " " + parts.JumpServerLogin + "@" + parts.JumpServerHost)
+            retLines.append("")
+
+        return retLines
+
+    def getColumnarInfo(self, listOfIPs):
+        """Return the instances as one list per field, each list in the same order as the instances."""
+        columns = zip(*listOfIPs) if listOfIPs else [[] for aField in InstanceDetails._fields]
+        return OrderedDict((aField, list(aColumn)) for aField, aColumn in zip(InstanceDetails._fields, columns))
+
     def determineWhereKeyExists(self, keyList, additionalSearchPath=None):
         """Search through a list of directories for each key passed in and see where the key exists"""
         retList = []
@@ -507,6 +767,9 @@ class InstanceInfo:
                 aPath = expanduser(aPath)
 
 
+            # the directory is read once and then each key is looked up in what was found there
+            keyFilesInPath = getKeyFilesInDirectory(aPath)
+
             keysToRemove = []
             for keyToFind in keyList:
                 # get just the key name stripping off any paths
@@ -517,7 +780,7 @@ class InstanceInfo:
                     strippedKeyToFind = strippedKeyToFind + ".pem"
 
                 tmpKeyPath = aPath + "/" + strippedKeyToFind
-                if os.path.exists(tmpKeyPath):
+                if strippedKeyToFind in keyFilesInPath:
                     retList.append(tmpKeyPath)
                     keysToRemove.append(keyToFind)
 
@@ -549,8 +812,41 @@ def checkArgs():
                                                       'script then this would execute one method with a given set of '
                                                       'tags/filters.  You would have to provide the filter set each '
                                                       'time as the object would go away once the python script ends, '
-                                                      'which would be with each invocation of this script.',
-                        choices=['connectParts', 'listOfIPAddresses', 'listOfKeys', 'gatewayInfo'],
+                                                      'which would be with each invocation of this script.  batch '
+                                                      'returns one json document with the listOfIPAddresses, the '
+                                                      'connectParts and gatewayInfo keyed by instance name and the '
+                                                      'listOfKeys, all from one pass through the regions.  columns '
+                                                      'returns the listOfIPAddresses as one list per field.  '
+                                                      'sshConfig returns an ssh config file with a Host entry for '
+                                                      'each instance (batch has it too).',
+                        choices=['connectParts', 'listOfIPAddresses', 'listOfKeys', 'gatewayInfo', 'batch',
+                                 'columns', 'sshConfig'],
+                        required=False)
+    parser.add_argument('-mw', '--maxWorkers', help='The maximum number of regions to query at the same time. Use 1 '
+                                                    'to query the regions one after the other. DEFAULT: ' +
+                                                    str(DEFAULT_MAX_WORKERS),
+                        type=int, default=DEFAULT_MAX_WORKERS,
+                        required=False)
+    parser.add_argument('-ps', '--pageSize', help='The number of instances to ask AWS for in each page of results '
+                                                  '(' + str(MIN_PAGE_SIZE) + '-' + str(MAX_PAGE_SIZE) +
+                                                  '). DEFAULT: ' + str(DEFAULT_PAGE_SIZE),
+                        type=int, default=DEFAULT_PAGE_SIZE,
+                        required=False)
+    parser.add_argument('--cacheTTL', help='Keep the instances found for a region in the local cache '
+                                           '(~/.dcConfig/cache/instanceinfo) and use them instead of asking the '
+                                           'region again for this many seconds, ' + str(DEFAULT_CACHE_TTL) +
+                                           ' is a good value.  An instance started in that time is not found until '
+                                           'the entry is that old or --refresh is given.  The cache is not used '
+                                           'unless this is given. DEFAULT: 0',
+                        type=int, default=0,
+                        required=False)
+    parser.add_argument('--refresh', help='With --cacheTTL, ignore anything in the local cache and get the instances '
+                                          'from the regions again, updating the cache with what is found.',
+                        action="store_true",
+                        required=False)
+    parser.add_argument('--noDaemon', help='Do not hand the shell command to the inventory daemon (instanceinfod.py) '
+                                           'even if it is running.',
+                        action="store_true",
                         required=False)
     args, unknown = parser.parse_known_args()
 
@@ -558,26 +854,9 @@ def checkArgs():
     if args.organization:
         retOrganization = args.organization
 
-    retRegions = []
-    if args.regions:
-        # first change the spaces that need to be there to something that shouldn't be in the string
-        # looking for backslash space
-        spacedOutString = re.sub(r"[\\]\s", "!+!", args.regions)
-        # make a dictionary out of the string now
-        tmpList = spacedOutString.split(" ")
-        # and use a dict comprehension to get the spaces back in at the appropriate place
-        retRegions = [re.sub(r"\!\+\!", " ", k) for k in tmpList]
-
-
-    retTags = {}
-    if args.tags:
-        # first change the spaces that need to be there to something that shouldn't be in the string
-        # looking for backslash space
-        spacedOutString = re.sub(r"[\\]\s", "!+!", args.tags)
-        # make a dictionary out of the string now
-        tmpDict = dict(item.split("=") for item in spacedOutString.split(" "))
-        # and use a dict comprehension to get the spaces back in at the appropriate place
-        retTags = {k: re.sub(r"\!\+\!", " ", v).split(" ") for k, v in tmpDict.items()}
+    retRegions = parseRegionString(args.regions)
+
+    retTags = parseTagString(args.tags)
 
     retKeysDirectory = ''
     if args.keysDirectory:
@@ -591,41 +870,147 @@ def checkArgs():
     if args.shellCommand:
         retCommand = args.shellCommand
 
-    return(retOrganization, retRegions, retKeysDirectory, retSharedDirectory, retTags, retCommand )
+    return(retOrganization, retRegions, retKeysDirectory, retSharedDirectory, retTags, retCommand, args.maxWorkers,
+           args.pageSize, args.cacheTTL, args.refresh, not args.noDaemon)
+
+
+def parseRegionString(regionString):
+    """Return the list of regions in a space separated string of regions."""
+    if not regionString:
+        return []
+
+    # first change the spaces that need to be there to something that shouldn't be in the string
+    # looking for backslash space
+    spacedOutString = re.sub(r"[\\]\s", "!+!", regionString)
+    # make a dictionary out of the string now
+    tmpList = spacedOutString.split(" ")
+    # and use a dict comprehension to get the spaces back in at the appropriate place
+    return [re.sub(r"\!\+\!", " ", k) for k in tmpList]
+
+
+def parseTagString(tagString):
+    """Return the filter dictionary for a string of key=value pairs separated by a space."""
+    if not tagString:
+        return {}
+
+    # first change the spaces that need to be there to something that shouldn't be in the string
+    # looking for backslash space
+    spacedOutString = re.sub(r"[\\]\s", "!+!", tagString)
+    # make a dictionary out of the string now
+    tmpDict = dict(item.split("=") for item in spacedOutString.split(" "))
+    # and use a dict comprehension to get the spaces back in at the appropriate place
+    return {k: re.sub(r"\!\+\!", " ", v).split(" ") for k, v in tmpDict.items()}
+
+
+def formatShellCommandOutput(instances, listOfIPs, shellCommand):
+    """Return the text that a shell command prints for the instances that were found."""
+    import simplejson as json
+    retLines = []
+    if shellCommand == "connectParts":
+        partsList = []
+        for item in listOfIPs:
+            parts = instances.getConnectString(item)
+            partsList.append(parts)
+
+        jsonObj = json.dumps(partsList)
+        retLines.append("{}".format(jsonObj))
+
+    if shellCommand == "listOfIPAddresses":
+        jsonObj = json.dumps(listOfIPs)
+        retLines.append("{}".format(jsonObj))
+
+    if shellCommand == "listOfKeys":
+        keys = instances.getListOfKeys()
+        for aKey in keys:
+            retLines.append("{}".format(aKey))
+
+    if shellCommand == "gatewayInfo":
+        for item in listOfIPs:
+            gatewayInfo = instances.getGatewayInfo(item)
+            retLines.append("Gateway/JumpServer info: {}".format(gatewayInfo))
+
+    if shellCommand == "batch":
+        jsonObj = json.dumps(instances.getBatchInfo(listOfIPs))
+        retLines.append("{}".format(jsonObj))
+
+    if shellCommand == "columns":
+        jsonObj = json.dumps(instances.getColumnarInfo(listOfIPs))
+        retLines.append("{}".format(jsonObj))
+
+    if shellCommand == "sshConfig":
+        retLines += instances.getSSHConfig(listOfIPs)
+
+    return "\n".join(retLines)
+
+
+def createDaemonRequest(organization, regions, keysDir, sharedDir, tagList, shellCommand, refresh=False):
+    """Return the request that is sent to the inventory daemon for a shell command."""
+    return {"Organization": organization, "Regions": regions, "KeysDirectory": keysDir,
+            "SharedDirectory": sharedDir, "Tags": tagList, "ShellCommand": shellCommand, "Refresh": refresh}
+
+
+def sendDaemonRequest(request, socketPath=DEFAULT_SOCKET_PATH, responseTimeout=DAEMON_RESPONSE_TIMEOUT,
+                      connectTimeout=DAEMON_CONNECT_TIMEOUT):
+    """Send a request to the inventory daemon and return its response, or None if the daemon isn't available."""
+    socketPath = expanduser(socketPath)
+    if not os.path.exists(socketPath):
+        return None
+
+    aSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        aSocket.settimeout(connectTimeout)
+        aSocket.connect(socketPath)
+
+        # the response timeout is for the whole answer, not each recv, so a daemon that trickles it out still can't
+        # hold this up for longer than that
+        deadline = time.time() + responseTimeout
+        aSocket.settimeout(responseTimeout)
+        aSocket.sendall((json.dumps(request) + "\n").encode('utf-8'))
+
+        chunks = []
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            aSocket.settimeout(remaining)
+            aChunk = aSocket.recv(65536)
+            if not aChunk:
+                break
+            chunks.append(aChunk)
+
+        return json.loads(b"".join(chunks).decode('utf-8'))
+    except (socket.error, socket.timeout, ValueError):
+        # no daemon listening, it went away or it sent something that can't be used, so do the work here instead
+        return None
+    finally:
+        aSocket.close()
 
 
 def main(argv):
     """Main code goes here."""
-    (organization, regions, keysDir, sharedDir, tagList, shellCommand) = checkArgs()
-
-    instances = InstanceInfo(organization=organization, keysDir=keysDir, regions=regions, sharedDir=sharedDir)
+    (organization, regions, keysDir, sharedDir, tagList, shellCommand, maxWorkers, pageSize, cacheTTL,
+     refresh, useDaemon) = checkArgs()
+
+    if shellCommand and useDaemon:
+        # if the inventory daemon is running it already has the regions loaded so let it answer
+        response = sendDaemonRequest(createDaemonRequest(organization, regions, keysDir, sharedDir, tagList,
+                                                         shellCommand, refresh))
+        if response and response.get("Status") == 0:
+            if response["Output"]:
+                print(response["Output"])
+            return
+
+    inventoryCache = None
+    if cacheTTL > 0:
+        inventoryCache = InventoryCache(ttl=cacheTTL, refresh=refresh)
+
+    instances = InstanceInfo(organization=organization, keysDir=keysDir, regions=regions, sharedDir=sharedDir,
+                             maxWorkers=maxWorkers, pageSize=pageSize, inventoryCache=inventoryCache)
     listOfIPs = instances.getInstanceInfo(tagList)
     if shellCommand:
-        if shellCommand == "connectParts":
-            import simplejson as json
-            partsList = []
-            for item in listOfIPs:
-                parts = instances.getConnectString(item)
-                partsList.append(parts)
-
-            jsonObj = json.dumps(partsList)
-            print("{}".format(jsonObj))
-
-        if shellCommand == "listOfIPAddresses":
-            import simplejson as json
-            jsonObj = json.dumps(listOfIPs)
-            print("{}".format(jsonObj))
-
-        if shellCommand == "listOfKeys":
-            keys = instances.getListOfKeys()
-            for aKey in keys:
-                print("{}".format(aKey))
-
-        if shellCommand == "gatewayInfo":
-            import simplejson as json
-            for item in listOfIPs:
-                gatewayInfo = instances.getGatewayInfo(item)
-                print("Gateway/JumpServer info: {}".format(gatewayInfo))
+        output = formatShellCommandOutput(instances, listOfIPs, shellCommand)
+        if output:
+            print(output)
     else:
         print("Example Mode\nLooping through list of instances:")
         for item in listOfIPs:
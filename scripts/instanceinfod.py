@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+"""
+Docstring for instanceinfod.py. This script runs a long lived inventory service
+on top of InstanceInfo so that paws, pawscp and the other shell scripts don't
+have to start python, import boto3 and connect to AWS for every call to
+instanceinfo.py.
+
+The service listens on a Unix domain socket (~/.dcConfig/instanceinfod.sock by
+default).  instanceinfo.py checks for that socket and, if something answers,
+hands it the shell command (-sc) request and prints what comes back.  If the
+service isn't running it does the work itself just as it always has.
+
+The service keeps a session and ec2 client per organization and region so the
+connections to AWS stay open, keeps the instances it has found for each request
+in memory, and refreshes them in the background while they are being used.
+
+The requests and responses are one line of json each:
+    {"Command": "shellCommand", "Organization": ..., "Regions": [...], "Tags": {...},
+     "KeysDirectory": ..., "SharedDirectory": ..., "ShellCommand": ..., "Refresh": false}
+    {"Status": 0, "Output": "what instanceinfo.py would have printed"}
+"""
+
+import os
+import sys
+import argparse
+import json
+import time
+import threading
+from os.path import expanduser
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+import instanceinfo
+from instanceinfo import InstanceInfo, formatShellCommandOutput, sendDaemonRequest, importBoto3
+from instanceinfo import DEFAULT_SOCKET_PATH, DEFAULT_MAX_WORKERS, DEFAULT_PAGE_SIZE
+
+# ==============================================================================
+__version__ = "0.1"
+
+__copyright__ = "Copyright 2017, devops.center"
+__credits__ = ["Bob Lozano", "Gregg Jensen"]
+__license__ = ' \
+   # Copyright 2014-2017 devops.center llc                                    \
+   #                                                                          \
+   # Licensed under the Apache License, Version 2.0 (the "License");          \
+   # you may not use this file except in compliance with the License.         \
+   # You may obtain a copy of the License at                                  \
+   #                                                                          \
+   #   http://www.apache.org/licenses/LICENSE-2.0                             \
+   #                                                                          \
+   # Unless required by applicable law or agreed to in writing, software      \
+   # distributed under the License is distributed on an "AS IS" BASIS,        \
+   # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. \
+   # See the License for the specific language governing permissions and      \
+   # limitations under the License.                                           \
+   # '
+__status__ = "Development"
+
+DEFAULT_LOG_FILE = "~/.dcConfig/instanceinfod.log"
+
+# how often, in seconds, the inventories that are being used are read from the regions again
+DEFAULT_REFRESH_INTERVAL = 60
+
+# an inventory that is older than this is rebuilt before it is used rather than waiting for the refresh
+DEFAULT_STALE_AFTER = 300
+
+# an inventory that hasn't been asked for in this long is dropped instead of being refreshed
+DEFAULT_IDLE_TIMEOUT = 3600
+
+# ==============================================================================
+
+
+class WarmSession:
+    """Wrap a boto3 session so that its clients, and their connections, are made once and then reused."""
+
+    def __init__(self, session):
+        """Construct an instance of the WarmSession class."""
+        self.session = session
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def client(self, serviceName):
+        """Return the client for the service, creating it the first time it is asked for."""
+        with self.lock:
+            if serviceName not in self.clients:
+                self.clients[serviceName] = self.session.client(serviceName)
+            return self.clients[serviceName]
+
+
+class WarmSessionPool:
+    """Keep one WarmSession for each organization and region."""
+
+    def __init__(self):
+        """Construct an instance of the WarmSessionPool class."""
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def getSession(self, organization, regionName):
+        """Return the session for the organization and region, creating it the first time it is asked for."""
+        with self.lock:
+            key = (organization, regionName)
+            if key not in self.sessions:
+                importBoto3()
+                if organization:
+                    aSession = instanceinfo.boto3.Session(profile_name=organization, region_name=regionName)
+                else:
+                    aSession = instanceinfo.boto3.Session(region_name=regionName)
+                self.sessions[key] = WarmSession(aSession)
+            return self.sessions[key]
+
+
+class InventoryEntry:
+    """The instances found for one request along with when they were found and last used."""
+
+    def __init__(self, request, instances, listOfIPs):
+        """Construct an instance of the InventoryEntry class."""
+        self.request = request
+        self.instances = instances
+        self.listOfIPs = listOfIPs
+        self.builtAt = time.time()
+        self.lastUsed = self.builtAt
+
+
+class InventoryDaemon:
+
+    def __init__(self, maxWorkers=DEFAULT_MAX_WORKERS, pageSize=DEFAULT_PAGE_SIZE,
+                 refreshInterval=DEFAULT_REFRESH_INTERVAL, staleAfter=DEFAULT_STALE_AFTER,
+                 idleTimeout=DEFAULT_IDLE_TIMEOUT):
+        """Construct an instance of the InventoryDaemon class."""
+        self.maxWorkers = maxWorkers
+        self.pageSize = pageSize
+        self.refreshInterval = refreshInterval
+        self.staleAfter = staleAfter
+        self.idleTimeout = idleTimeout
+        self.sessionPool = WarmSessionPool()
+        self.entries = {}
+        self.entriesLock = threading.Lock()
+        self.buildLocks = {}
+        self.server = None
+        self.stopping = threading.Event()
+
+    def getRequestKey(self, request):
+        """Return the key for the parts of a request that decide which instances are found."""
+        return json.dumps([request.get("Organization"), request.get("Regions"), request.get("KeysDirectory"),
+                           request.get("SharedDirectory"), request.get("Tags")], sort_keys=True)
+
+    def buildEntry(self, request):
+        """Find the instances for a request using the warm sessions."""
+        instances = InstanceInfo(organization=request.get("Organization"), keysDir=request.get("KeysDirectory"),
+                                 regions=request.get("Regions"), sharedDir=request.get("SharedDirectory"),
+                                 maxWorkers=self.maxWorkers, pageSize=self.pageSize,
+                                 sessionFactory=self.sessionPool.getSession)
+        listOfIPs = instances.getInstanceInfo(request.get("Tags") or {})
+        return InventoryEntry(request, instances, listOfIPs)
+
+    def getEntry(self, request, refresh=False):
+        """Return the inventory for a request, building it if it isn't loaded, is stale or a refresh was asked for."""
+        key = self.getRequestKey(request)
+        with self.entriesLock:
+            buildLock = self.buildLocks.setdefault(key, threading.Lock())
+
+        # only one request at a time builds a given inventory, the others wait and then use what it built
+        with buildLock:
+            entry = self.entries.get(key)
+            if refresh or not entry or time.time() - entry.builtAt > self.staleAfter:
+                entry = self.buildEntry(request)
+                with self.entriesLock:
+                    self.entries[key] = entry
+
+        entry.lastUsed = time.time()
+        return entry
+
+    def handleRequest(self, request):
+        """Return the response for one request."""
+        command = request.get("Command", "shellCommand")
+        if command == "status":
+            with self.entriesLock:
+                numEntries = len(self.entries)
+            return {"Status": 0, "Output": "instanceinfod is running (pid {}) with {} inventories loaded".format(
+                os.getpid(), numEntries)}
+
+        if command == "shutdown":
+            self.stop()
+            return {"Status": 0, "Output": "instanceinfod is stopping"}
+
+        try:
+            entry = self.getEntry(request, request.get("Refresh"))
+            output = formatShellCommandOutput(entry.instances, entry.listOfIPs, request.get("ShellCommand"))
+        except (Exception, SystemExit) as e:
+            # InstanceInfo exits when it can't find what it needs.  The client will do the work itself and report
+            # the problem the way it normally does.
+            return {"Status": 1, "Error": "{}".format(e)}
+
+        return {"Status": 0, "Output": output}
+
+    def refreshEntries(self):
+        """Rebuild the inventories that are being used and drop the ones that are not."""
+        now = time.time()
+        with self.entriesLock:
+            items = list(self.entries.items())
+
+        for key, entry in items:
+            if now - entry.lastUsed > self.idleTimeout:
+                with self.entriesLock:
+                    self.entries.pop(key, None)
+                    self.buildLocks.pop(key, None)
+            elif now - entry.builtAt >= self.refreshInterval:
+                try:
+                    self.getEntry(entry.request, refresh=True).lastUsed = entry.lastUsed
+                except (Exception, SystemExit) as e:
+                    sys.stderr.write("ERROR: could not refresh the inventory for {}: {}\n".format(key, e))
+
+    def refreshLoop(self):
+        """Refresh the inventories in the background until the daemon is stopped."""
+        while not self.stopping.wait(self.refreshInterval):
+            self.refreshEntries()
+
+    def serve(self, socketPath):
+        """Listen on the socket and answer requests until the daemon is stopped."""
+        # only the user that started the daemon can talk to it, so the socket is created with no access for anyone
+        # else rather than changed after it has been bound and could already be connected to
+        oldUmask = os.umask(0o077)
+        try:
+            self.server = InventoryServer(socketPath, InventoryRequestHandler)
+        finally:
+            os.umask(oldUmask)
+        self.server.inventoryDaemon = self
+
+        refreshThread = threading.Thread(target=self.refreshLoop)
+        refreshThread.daemon = True
+        refreshThread.start()
+
+        try:
+            self.server.serve_forever()
+        finally:
+            self.stopping.set()
+            self.server.server_close()
+            if os.path.exists(socketPath):
+                os.remove(socketPath)
+
+    def stop(self):
+        """Stop serving requests."""
+        self.stopping.set()
+        if self.server:
+            # shutdown waits for serve_forever to return so it can't be called from the thread handling a request
+            stopThread = threading.Thread(target=self.server.shutdown)
+            stopThread.daemon = True
+            stopThread.start()
+
+
+class InventoryRequestHandler(socketserver.StreamRequestHandler):
+    """Read one json request from the socket and write back one json response."""
+
+    def handle(self):
+        """Handle a single request."""
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+        except ValueError as e:
+            response = {"Status": 1, "Error": "could not read the request: {}".format(e)}
+        else:
+            response = self.server.inventoryDaemon.handleRequest(request)
+
+        self.wfile.write(json.dumps(response).encode('utf-8'))
+
+
+class InventoryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Answer each connection in its own thread."""
+    daemon_threads = True
+
+
+def detach(logFile):
+    """Run the rest of the process in the background with its output going to the log file."""
+    if os.fork() > 0:
+        # the parent just returns to the shell
+        os._exit(0)
+
+    os.setsid()
+    devNull = open(os.devnull, 'r')
+    os.dup2(devNull.fileno(), sys.stdin.fileno())
+    log = open(expanduser(logFile), 'a')
+    os.dup2(log.fileno(), sys.stdout.fileno())
+    os.dup2(log.fileno(), sys.stderr.fileno())
+
+
+def checkArgs():
+    """Check the command line arguments."""
+    parser = argparse.ArgumentParser(
+        description=('This script runs an inventory service that keeps the instances found by instanceinfo.py in '
+                     'memory and answers the instanceinfo.py shell commands over a local socket.'))
+    parser.add_argument('-c', '--command', help='start the service, stop a running service or show the status of a '
+                                                'running service',
+                        choices=['start', 'stop', 'status'],
+                        default='start',
+                        required=False)
+    parser.add_argument('--socket', help='The path of the socket to listen on. DEFAULT: ' + DEFAULT_SOCKET_PATH,
+                        default=DEFAULT_SOCKET_PATH,
+                        required=False)
+    parser.add_argument('--foreground', help='Keep the service in the foreground rather than running it in the '
+                                             'background with its output going to ' + DEFAULT_LOG_FILE,
+                        action="store_true",
+                        required=False)
+    parser.add_argument('--refreshInterval', help='The number of seconds between refreshes of the inventories that '
+                                                  'are being used. DEFAULT: ' + str(DEFAULT_REFRESH_INTERVAL),
+                        type=int, default=DEFAULT_REFRESH_INTERVAL,
+                        required=False)
+    parser.add_argument('-mw', '--maxWorkers', help='The maximum number of regions to query at the same time. '
+                                                    'DEFAULT: ' + str(DEFAULT_MAX_WORKERS),
+                        type=int, default=DEFAULT_MAX_WORKERS,
+                        required=False)
+    parser.add_argument('-ps', '--pageSize', help='The number of instances to ask AWS for in each page of results. '
+                                                  'DEFAULT: ' + str(DEFAULT_PAGE_SIZE),
+                        type=int, default=DEFAULT_PAGE_SIZE,
+                        required=False)
+    args = parser.parse_args()
+
+    return (args.command, args.socket, args.foreground, args.refreshInterval, args.maxWorkers, args.pageSize)
+
+
+def main(argv):
+    """Main code goes here."""
+    (command, socketPath, foreground, refreshInterval, maxWorkers, pageSize) = checkArgs()
+    socketPath = expanduser(socketPath)
+
+    if command in ("stop", "status"):
+        response = sendDaemonRequest({"Command": "shutdown" if command == "stop" else "status"}, socketPath, 10)
+        if not response:
+            print("instanceinfod is not running")
+            sys.exit(1)
+        print(response.get("Output"))
+        return
+
+    if os.path.exists(socketPath):
+        if sendDaemonRequest({"Command": "status"}, socketPath, 10):
+            print("instanceinfod is already running and listening on {}".format(socketPath))
+            sys.exit(1)
+        # nothing is listening so it was left behind by a daemon that didn't shut down cleanly
+        os.remove(socketPath)
+
+    if not foreground:
+        detach(DEFAULT_LOG_FILE)
+
+    inventoryDaemon = InventoryDaemon(maxWorkers=maxWorkers, pageSize=pageSize, refreshInterval=refreshInterval)
+    inventoryDaemon.serve(socketPath)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+Docstring for inventorycache.py. This module keeps a local copy of the instances
+that instanceinfo.py finds for each region when it is run with --cacheTTL, so
+that the calls that follow each other don't all have to go back to AWS.  It is
+not used otherwise, as an instance started after an entry was written is not
+found until the entry is older than the TTL (or --refresh is given).
+
+Each entry is for one organization, region and set of filters and is written as
+lines of json: the first line is a header that describes the entry and each line
+after that is the compact record of one instance, the few fields instanceinfo.py
+uses rather than all that AWS returns for it.  That way an entry can be written
+and read back one instance at a time.  An entry is used only while it is younger
+than the TTL and the files it was built from (the shared settings.json and, for
+VM regions, the configFileName file) have not changed since it was written.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+from os.path import expanduser
+
+# ==============================================================================
+__version__ = "0.1"
+
+__copyright__ = "Copyright 2017, devops.center"
+__credits__ = ["Bob Lozano", "Gregg Jensen"]
+__license__ = ' \
+   # Copyright 2014-2017 devops.center llc                                    \
+   #                                                                          \
+   # Licensed under the Apache License, Version 2.0 (the "License");          \
+   # you may not use this file except in compliance with the License.         \
+   # You may obtain a copy of the License at                                  \
+   #                                                                          \
+   #   http://www.apache.org/licenses/LICENSE-2.0                             \
+   #                                                                          \
+   # Unless required by applicable law or agreed to in writing, software      \
+   # distributed under the License is distributed on an "AS IS" BASIS,        \
+   # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. \
+   # See the License for the specific language governing permissions and      \
+   # limitations under the License.                                           \
+   # '
+__status__ = "Development"
+
+# bump this when the layout of an entry changes so the old entries are just ignored
+CACHE_FORMAT_VERSION = 3
+
+DEFAULT_CACHE_DIR = "~/.dcConfig/cache/instanceinfo"
+
+# the number of seconds an entry can be used before it has to be read from the source again
+DEFAULT_CACHE_TTL = 300
+
+# ==============================================================================
+
+
+class InventoryCache:
+
+    def __init__(self, cacheDir=None, ttl=DEFAULT_CACHE_TTL, refresh=False):
+        """Construct an instance of the InventoryCache class."""
+        self.cacheDir = expanduser(cacheDir or DEFAULT_CACHE_DIR)
+        self.ttl = ttl
+        # when refresh is set the entries are never read, but new ones are still written
+        self.refresh = refresh
+
+    def createKey(self, organization, regionName, filterList):
+        """Return the key that identifies an entry, with the filters in a fixed order."""
+        filters = [[k, sorted(v)] for k, v in sorted(filterList.items())] if filterList else []
+        return {"Organization": organization or '', "RegionName": regionName, "Filters": filters}
+
+    def getEntryPath(self, key):
+        """Return the path of the file that holds the entry for the key."""
+        keyString = json.dumps(key, sort_keys=True)
+        return os.path.join(self.cacheDir, hashlib.sha1(keyString.encode('utf-8')).hexdigest() + ".jsonl")
+
+    def fingerprint(self, sourceFiles):
+        """Return the mtime and size of each of the files an entry was built from."""
+        retDict = {}
+        for aFile in sourceFiles:
+            try:
+                fileStat = os.stat(aFile)
+                retDict[aFile] = [fileStat.st_mtime, fileStat.st_size]
+            except OSError:
+                retDict[aFile] = None
+
+        return retDict
+
+    def read(self, key, sourceFiles):
+        """Return an iterator over the cached instances for the key, or None if there isn't a usable entry."""
+        if self.refresh or not self.ttl or self.ttl <= 0:
+            return None
+
+        entryPath = self.getEntryPath(key)
+        try:
+            entryFile = open(entryPath)
+        except IOError:
+            return None
+
+        try:
+            header = json.loads(entryFile.readline())
+        except ValueError:
+            header = None
+
+        if not self.isUsable(header, key, sourceFiles):
+            entryFile.close()
+            return None
+
+        return self.iterEntry(entryFile)
+
+    def isUsable(self, header, key, sourceFiles):
+        """Check that an entry's header is for this key, is fresh and that its source files haven't changed."""
+        if not header or header.get("Version") != CACHE_FORMAT_VERSION:
+            return False
+
+        if header.get("Key") != json.loads(json.dumps(key)):
+            return False
+
+        if time.time() - header.get("CreatedAt", 0) > self.ttl:
+            return False
+
+        return header.get("Sources") == json.loads(json.dumps(self.fingerprint(sourceFiles)))
+
+    def iterEntry(self, entryFile):
+        """Yield the instances in an entry one line at a time."""
+        try:
+            for aLine in entryFile:
+                if aLine.strip():
+                    yield json.loads(aLine)
+        finally:
+            entryFile.close()
+
+    def write(self, key, sourceFingerprint, instances):
+        """Yield the instances passed in while writing them to the entry for the key.
+
+        sourceFingerprint is what fingerprint returned for the source files before the instances were read from
+        them, so a change while they are being read makes the entry stale.  The entry is written to a temporary
+        file and only moved into place once all the instances have been gone through, so an entry that is only
+        partly written is never used.  Not being able to write it isn't a reason to fail the lookup, so the
+        instances keep coming either way.
+        """
+        header = {"Version": CACHE_FORMAT_VERSION, "Key": key, "CreatedAt": time.time(), "Sources": sourceFingerprint}
+
+        entryFile = None
+        tmpPath = None
+        try:
+            if not os.path.isdir(self.cacheDir):
+                os.makedirs(self.cacheDir)
+            fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir, prefix=".entry.")
+            entryFile = os.fdopen(fd, 'w')
+            entryFile.write(json.dumps(header) + "\n")
+        except (IOError, OSError) as e:
+            entryFile = self.abandon(entryFile, tmpPath, e)
+
+        completed = False
+        try:
+            for anInstance in instances:
+                if entryFile:
+                    try:
+                        entryFile.write(json.dumps(anInstance) + "\n")
+                    except (IOError, OSError) as e:
+                        entryFile = self.abandon(entryFile, tmpPath, e)
+                yield anInstance
+            completed = True
+        finally:
+            if entryFile:
+                if completed:
+                    try:
+                        entryFile.close()
+                        os.rename(tmpPath, self.getEntryPath(key))
+                    except (IOError, OSError) as e:
+                        self.abandon(entryFile, tmpPath, e)
+                else:
+                    self.discard(entryFile, tmpPath)
+
+    def abandon(self, entryFile, tmpPath, error):
+        """Say that the entry couldn't be written and get rid of what there is of it."""
+        sys.stderr.write("WARNING: could not write the instanceinfo cache in {}: {}\n".format(self.cacheDir, error))
+        try:
+            return self.discard(entryFile, tmpPath)
+        except (IOError, OSError):
+            return None
+
+    def discard(self, entryFile, tmpPath):
+        """Close and remove an entry that is not going to be finished."""
+        if entryFile:
+            entryFile.close()
+        if tmpPath and os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+        return None
+
+    def clear(self):
+        """Remove all the entries in the cache directory."""
+        if not os.path.isdir(self.cacheDir):
+            return
+
+        for aFile in os.listdir(self.cacheDir):
+            if aFile.endswith(".jsonl"):
+                os.remove(os.path.join(self.cacheDir, aFile))
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -38,11 +38,16 @@
 # =============================================================================
 
 import sys
-import logging
 import os
 from os.path import expanduser
-import argparse
-import subprocess
+from collections import OrderedDict
+# this runs at the start of most of the shell scripts, so only what is needed
+# to print a cached environment is imported here.  Reading the settings and
+# env files imports the rest when it is needed (see importResolveModules)
+try:
+    from envcache import ResolvedEnvCache, getFileFingerprint
+except ImportError:
+    from scripts.envcache import ResolvedEnvCache, getFileFingerprint
 # ==============================================================================
 """
 process_dc_env.py process the arguments and passes them back to put them in the
@@ -54,25 +59,97 @@ __copyright__ = "Copyright 2016, devops.center"
 __credits__ = ["Bob Lozano", "Gregg Jensen"]
 __license__ = "GPL"
 __status__ = "Development"
+
+# the modules that are only needed to resolve the environment from the files
+logging = None
+subprocess = None
+dcsettings = None
+envfile = None
+envlayers = None
+workspaceindex = None
+envexplain = None
+
+# the options that dcEnvCheckArgs knows, with the name of what each one sets
+# and if it takes a value, for getting them without argparse
+QUICK_OPTIONS = {"-a": ("appName", True), "--appName": ("appName", True),
+                 "-e": ("env", True), "--env": ("env", True),
+                 "-w": ("workspaceName", True),
+                 "--workspaceName": ("workspaceName", True),
+                 "-i": ("initialCreate", False),
+                 "--initialCreate": ("initialCreate", False),
+                 "-g": ("generateEnvFiles", False),
+                 "--generateEnvFiles": ("generateEnvFiles", False),
+                 "--noEnvCache": ("noEnvCache", False),
+                 "--envs": ("envs", True), "--runAs": ("runAs", True),
+                 "--explain": ("explain", True), "--diff": ("diff", True),
+                 "--forCustomer": ("forCustomer", True)}
+QUICK_LONG_OPTIONS = [anOption for anOption in QUICK_OPTIONS
+                      if anOption.startswith("--")] + ["--help"]
+
+# the keys from the ~/.dcConfig/settings file that are put in the environment
+SETTINGS_KEYS = ["CUSTOMER_NAME", "PROFILE", "REGION", "USER_NAME",
+                 "dcCOMMON_SHARED_DIR"]
 # ==============================================================================
 
 
+def importResolveModules():
+    """Import the modules that resolving the environment needs."""
+    global logging, subprocess, dcsettings, envfile, envlayers, workspaceindex
+    global envexplain
+    if envfile is None:
+        import logging
+        import subprocess
+        try:
+            import dcsettings
+            import envfile
+            import envlayers
+            import workspaceindex
+            import envexplain
+        except ImportError:
+            from scripts import dcsettings
+            from scripts import envfile
+            from scripts import envlayers
+            from scripts import workspaceindex
+            from scripts import envexplain
+
+
 class Process_dc_Env:
     """Process reading in the environment file."""
 
     def __init__(self, envList, generateEnvFiles=0, forCustomer=None):
         """Constructor for process_dc_env class."""
+        importResolveModules()
         self.envList = envList
         self.baseDir = ""
         self.baseAppName = ""
         self.dcBaseConfig = ""
         self.baseAppUtilsDir = ""
         self.forCustomer = forCustomer
+        # the files and directories the environment is resolved from, with
+        # their fingerprint taken when they were read, for the env cache
+        self.sourceFiles = OrderedDict()
+        # the variables from the environment the env file used, and their
+        # values, as they are part of what was resolved too
+        self.environmentUsed = {}
+        # set when the environment could only be partly resolved, so it
+        # isn't cached
+        self.partlyResolved = False
         if generateEnvFiles:
             self.generateEnvFiles = True
         else:
             self.generateEnvFiles = False
 
+    def isCacheable(self):
+        """Return if what was resolved can be cached."""
+        # when bash sourced an env file it could have used anything in the
+        # environment (${VAR:-default}, $(command), ~), so there is no way
+        # to tell when the entry would be stale
+        return not self.partlyResolved and self.environmentUsed is not None
+
+    def recordSourceFile(self, aPath):
+        """Keep the fingerprint of a file the environment is resolved from."""
+        self.sourceFiles[aPath] = getFileFingerprint(aPath)
+
     def getdcUtilsDirectory(self):
         """Read the utils directory."""
         # read the ~/.dcConfig/settings
@@ -85,15 +162,10 @@ class Process_dc_Env:
                   "development and where dcUtils is installed.")
             sys.exit(1)
 
-        if os.path.isfile(baseSettingsDir + "/settings"):
-            # get the base directory from the settings file
-            with open(baseSettingsDir + "/settings") as f:
-                lines = [line.rstrip('\n') for line in f]
-            for item in lines:
-                if "dcUTILS" in item:
-                    lineArray = item.split('=')
-                    dcUtilsDir = lineArray[1]
-                    return(dcUtilsDir)
+        # get the utils directory from the settings file
+        dcUtilsDir = dcsettings.getSettingsValue("dcUTILS")
+        if dcUtilsDir:
+            return(dcUtilsDir)
 
         # otherwise return current dir
         # this works for the scripts executed from the  dcUtils directory.
@@ -102,6 +174,62 @@ class Process_dc_Env:
 
     def process_dc_env(self):
         """Process the environment files."""
+        self.resolveSharedLayers()
+
+        # ---------------------------------------------------------------------
+        # Need to find what dcEnv files that are in the directory.  We need to
+        # get the possible appNames if there is more than one.  And then get
+        # any environment (ie, dev, staging, prod, local) files if there are
+        # more than one. If it doesn't exist exit and instruct the user to run
+        # deployenv.sh
+        # ---------------------------------------------------------------------
+        if not self.generateEnvFiles:
+            self.getEnvFile()
+
+            # -----------------------------------------------------------------
+            # check for the DEFAULT_APP_NAME. If not given set it to the
+            # appname from the input.  If the --appName is not given then
+            # check the # one from the env and make sure it is not the
+            # __DEFAULT__ one.
+            # -----------------------------------------------------------------
+            # if self.envList["dcDEFAULT_APP_NAME"] == "__DEFAULT__":
+            #    print ("The dcDEFAULT_APP_NAME environment variable has not "
+            #            +
+            #           "been set and has not been made available. This " +
+            #           "should be identified when running deployenv.sh by " +
+            #           "utilizing the option: --appName appname")
+            #    sys.exit(1)
+
+        return self.envList
+
+    def resolveEnvs(self, envNames, runAsNames=None):
+        """Resolve several envs, and local run as each of runAsNames."""
+        # ---------------------------------------------------------------------
+        # the base directory, app name, app utils and settings are the same for
+        # every env so they are resolved once, and each env's file is read on
+        # top of a copy of them.  An env run as someone is put together from
+        # its env files the way deployenv.sh --run-as would, as there isn't a
+        # generated file for it.  These are keyed local:<run-as>
+        # ---------------------------------------------------------------------
+        self.resolveSharedLayers()
+
+        resolvedEnvs = OrderedDict()
+        for anEnv in envNames:
+            anEnvList = dict(self.envList)
+            anEnvList["ENV"] = anEnv
+            self.getEnvFile(anEnvList)
+            resolvedEnvs[anEnv] = anEnvList
+
+        for runAs in runAsNames or []:
+            anEnvList = dict(self.envList)
+            anEnvList["ENV"] = "local"
+            self.getRunAsEnv(runAs, anEnvList)
+            resolvedEnvs["local:" + runAs] = anEnvList
+
+        return resolvedEnvs
+
+    def resolveSharedLayers(self):
+        """Resolve what is the same for every env of the app."""
         # ---------------------------------------------------------------------
         # lets check to see if dcUtils has been set already if not then we are
         #  probably the first time through and it hasn't been set in the
@@ -139,55 +267,21 @@ class Process_dc_Env:
         # go read the ~/.dcConfig/settings file for any variables we need from
         # there.  Like the customer name
         # ---------------------------------------------------------------------
+        self.recordSourceFile(expanduser("~") + "/.dcConfig/settings")
         getSettings(self.envList)
 
-        # ---------------------------------------------------------------------
-        # Need to find what dcEnv files that are in the directory.  We need to
-        # get the possible appNames if there is more than one.  And then get
-        # any environment (ie, dev, staging, prod, local) files if there are
-        # more than one. If it doesn't exist exit and instruct the user to run
-        # deployenv.sh
-        # ---------------------------------------------------------------------
-        if not self.generateEnvFiles:
-            self.getEnvFile()
-
-            # -----------------------------------------------------------------
-            # check for the DEFAULT_APP_NAME. If not given set it to the
-            # appname from the input.  If the --appName is not given then
-            # check the # one from the env and make sure it is not the
-            # __DEFAULT__ one.
-            # -----------------------------------------------------------------
-            # if self.envList["dcDEFAULT_APP_NAME"] == "__DEFAULT__":
-            #    print ("The dcDEFAULT_APP_NAME environment variable has not "
-            #            +
-            #           "been set and has not been made available. This " +
-            #           "should be identified when running deployenv.sh by " +
-            #           "utilizing the option: --appName appname")
-            #    sys.exit(1)
-
-        return self.envList
-
     def getBaseDir(self):
         """Get the base directory."""
+        self.recordSourceFile(self.dcBaseConfig)
         if os.path.exists(self.dcBaseConfig):
             if "WORKSPACE_NAME" in self.envList:
-                # open the dcConfig/baseDirectory and read it in directly
-                # as we are looking for the alternate workspace name
-                with open(self.dcBaseConfig) as f:
-                    lines = [line.rstrip('\n') for line in f]
-
-                flagFound = 0
-                itemToLookFor = "_" + self.envList["WORKSPACE_NAME"] + \
-                                "_BASE_CUSTOMER_DIR="
-                for line in lines:
-                    if itemToLookFor in line:
-                        key, value = line.split('=', 1)
-                        self.baseDir = value
-                        self.envList["BASE_CUSTOMER_DIR"] = self.baseDir
-                        flagFound = 1
-                        break
-
-                if not flagFound:
+                # we are looking for the alternate workspace name
+                baseDir = dcsettings.getWorkspaceBaseDir(
+                    self.envList["WORKSPACE_NAME"])
+                if baseDir is not None:
+                    self.baseDir = baseDir
+                    self.envList["BASE_CUSTOMER_DIR"] = self.baseDir
+                else:
                     print("Could not find a directory for the given " +
                           "--workspaceName value in the " +
                           "$HOME/.dcConfig/baseDirectory. \nHave you run " +
@@ -195,20 +289,11 @@ class Process_dc_Env:
                           "an alternate base directory?")
                     sys.exit(1)
             else:
-                with open(self.dcBaseConfig) as f:
-                    lines = [line.rstrip('\n') for line in f]
-                workspaceName = ''
-                for item in lines:
-                    if "CURRENT_WORKSPACE" in item:
-                        lineArray = item.split('=')
-                        workspaceName = '_' + lineArray[1] + \
-                                        '_BASE_CUSTOMER_DIR'
-
-                    if workspaceName in item:
-                        anotherLineArray = item.split('=')
-                        self.baseDir = anotherLineArray[1]
-                        self.envList["BASE_CUSTOMER_DIR"] = self.baseDir
-                        return
+                # the current workspace is the one to use
+                baseDir = dcsettings.getWorkspaceBaseDir()
+                if baseDir is not None:
+                    self.baseDir = baseDir
+                    self.envList["BASE_CUSTOMER_DIR"] = self.baseDir
         else:
             print("ERROR: can not determine the base directory as it "
                   "does not appear that you have run manageApp.py to "
@@ -218,7 +303,9 @@ class Process_dc_Env:
 
     def getBaseAppName(self):
         """Get the base name for the application."""
-        subDirs = next(os.walk(self.baseDir))[1]
+        # the directory's mtime changes when an app is added or removed
+        self.recordSourceFile(self.baseDir)
+        subDirs = workspaceindex.getAppNames(self.baseDir)
 
         if len(subDirs) == 0:
             print("The base directory defined in "
@@ -247,14 +334,9 @@ class Process_dc_Env:
     def handleMultipleDirectories(self, subDirs):
         """Handle the situation when there are multiple apps."""
         if "CUSTOMER_APP_NAME" in self.envList:
-            foundFlag = 0
-            for dir in subDirs:
-                if dir == self.envList["CUSTOMER_APP_NAME"]:
-                    self.baseAppName = self.envList["CUSTOMER_APP_NAME"]
-                    foundFlag = 1
-                    break
-
-            if not foundFlag:
+            if self.envList["CUSTOMER_APP_NAME"] in subDirs:
+                self.baseAppName = self.envList["CUSTOMER_APP_NAME"]
+            else:
                 print("The appName you provided: " +
                       self.envList["CUSTOMER_APP_NAME"] + " was not found " +
                       "in the base directory: " + self.baseDir)
@@ -273,6 +355,7 @@ class Process_dc_Env:
         """Get the appliation utils."""
         appDir = self.baseDir + "/" + self.baseAppName
         subDirMapFile = appDir + "/" + ".dcDirMap.cnf"
+        self.recordSourceFile(subDirMapFile)
         if os.path.exists(subDirMapFile):
             with open(subDirMapFile) as f:
                 lines = [line.rstrip('\n') for line in f]
@@ -299,12 +382,17 @@ class Process_dc_Env:
 
         return retBaseAppUtils
 
-    def getEnvFile(self):
+    def getEnvFile(self, anEnvList=None):
         """Get the Environment file."""
+        # the env is read into self.envList unless another list is given
+        if anEnvList is None:
+            anEnvList = self.envList
+
         # check for a dcEnv-${CUSTOMER_APP_NAME}-*.sh file
         envDirToFind = self.baseAppUtilsDir + \
             "/environments/.generatedEnvFiles"
-        envFiles = next(os.walk(envDirToFind))[2]
+        self.recordSourceFile(envDirToFind)
+        envFiles = workspaceindex.getGeneratedEnvFiles(self.baseAppUtilsDir)
 
         # if one doesn't exist instruct the user to run deployenv.sh with that
         # app name and try this again and then exit
@@ -316,24 +404,15 @@ class Process_dc_Env:
                   "deployenv.sh with the appName")
             sys.exit(1)
 
-        # there is at least a pair there, so now go through the list and
-        # look for the application specific env files.  If there, there
-        # will be two one each one for .env and .sh and the one we want
-        # is the .sh
-        flagFound = 0
-        for file in envFiles:
-            envFileName = "dcEnv-" + self.baseAppName + "-" + \
-                self.envList["ENV"] + ".env"
-            shEnvFileName = "dcEnv-" + self.baseAppName + "-" + \
-                self.envList["ENV"] + ".sh"
-
-            if shEnvFileName in file:
-                # found the one needed
-                flagFound = 1
-                theEnvFileNameToSource = file
-                break
-
-        if not flagFound:
+        # there is at least a pair there, so now look for the application
+        # specific env files.  If there, there will be two one each one for
+        # .env and .sh and the one we want is the .sh
+        envFileName = "dcEnv-" + self.baseAppName + "-" + \
+            anEnvList["ENV"] + ".env"
+        shEnvFileName = "dcEnv-" + self.baseAppName + "-" + \
+            anEnvList["ENV"] + ".sh"
+
+        if shEnvFileName not in envFiles:
             # if there is more than one file (ie, different ENVs) then display
             # the list and ask for the user to select one.
             print("There are multiple sets of environment files with that " +
@@ -344,66 +423,99 @@ class Process_dc_Env:
                   " Re-run this script and give the appropriate option to " +
                   "\ndesiginate the env (usually --env) and provide the " +
                   "environment string. \nThe env files found are:")
-            for filename in envFiles:
+            for filename in sorted(envFiles):
                 if "dcEnv-" in filename:
                     print(filename)
 
             sys.exit(1)
         else:
-            # source the .sh env file into the environment as it has the export
-            # variables and that will set the environment
-            fileToSource = envDirToFind + "/" + theEnvFileNameToSource
-            command = '/usr/bin/env bash -c "source ' + fileToSource + \
-                      ' && env"'
+            # evaluate the .sh env file as it has the export variables and
+            # that will set the environment.  If it has anything in it that
+            # needs bash then it is sourced by bash instead
+            fileToSource = envDirToFind + "/" + shEnvFileName
+            self.recordSourceFile(fileToSource)
+            self.recordSourceFile(envDirToFind + "/" + envFileName)
 
             try:
-                tmpOutput = subprocess.check_output(command,
-                                                    stderr=subprocess.STDOUT,
-                                                    shell=True)
+                sourcedEnv = self.evaluateEnvFile(fileToSource)
 
-                theWholeEnv = tmpOutput.split('\n')
                 # -------------------------------------------------------------
-                # now go through the whole environment and only get the ones
-                # that are in the envFile that we sourced
-                # how this happens is that the sourcing command above spits
-                # out the entire environment at that time.  So that will have a
-                # bunch of extra  variables that we don't need.  What we need
-                # are the keys from the file, so we will read through the file
-                # and pull the keys and then match up the sourced value to the
-                # needed key
+                # now only get the ones that are in the envFile, the .sh file
+                # is the same keys with an export in front of each one
                 # -------------------------------------------------------------
                 theEnvFileToRead = envDirToFind + "/" + envFileName
-                with open(theEnvFileToRead) as f:
-                    lines = [line.rstrip('\n') for line in f]
-
-                for line in lines:
-                    needKey, needValue = line.split('=', 1)
-                    for envVar in theWholeEnv:
-                        if needKey in envVar:
-                            lookKey, lookValue = envVar.split('=', 1)
-                            self.envList[needKey] = lookValue
+                for needKey in envfile.readEnvFileKeys(theEnvFileToRead):
+                    if needKey in sourcedEnv:
+                        anEnvList[needKey] = sourcedEnv[needKey]
             except subprocess.CalledProcessError:
+                self.partlyResolved = True
                 logging.exception("There was an issue with sourcing " +
                                   fileToSource)
 
+    def evaluateEnvFile(self, fileToSource):
+        """Return what an env file sets, having bash source it if needed."""
+        try:
+            (sourcedEnv, environmentUsed) = \
+                envfile.evaluateEnvFile(fileToSource)
+            if self.environmentUsed is not None:
+                self.environmentUsed.update(environmentUsed)
+        except ValueError:
+            sourcedEnv = envfile.sourceEnvFile(fileToSource)
+            # bash could have used anything in the environment
+            self.environmentUsed = None
+
+        return sourcedEnv
+
+    def getRunAsEnv(self, runAs, anEnvList):
+        """Put the local env run as runAs together into anEnvList."""
+        try:
+            layerFiles = envlayers.getLayerFiles(
+                self.envList["dcUTILS"], self.baseAppUtilsDir, "local", runAs)
+            for name, aPath in layerFiles:
+                if aPath:
+                    self.recordSourceFile(aPath)
+            merged = envlayers.mergeLayers(
+                envlayers.getLayers(layerFiles, anEnvList, "local"),
+                self.baseAppName)
+        except IOError as e:
+            print("Can not put together the local env to run as " + runAs +
+                  ": " + str(e))
+            sys.exit(1)
+
+        # the merged lines are evaluated as the generated .sh file would be
+        sourcedEnv = None
+        try:
+            evaluator = envfile.EnvFileEvaluator(
+                envlayers.renderShText(merged))
+            sourcedEnv = evaluator.evaluate()
+            if self.environmentUsed is not None:
+                self.environmentUsed.update(evaluator.referenced)
+        except ValueError:
+            import tempfile
+            (fd, shFile) = tempfile.mkstemp(suffix=".sh")
+            try:
+                with os.fdopen(fd, 'w') as shFileHandle:
+                    shFileHandle.write(envlayers.renderShText(merged))
+                sourcedEnv = self.evaluateEnvFile(shFile)
+            except subprocess.CalledProcessError:
+                self.partlyResolved = True
+                logging.exception("There was an issue with sourcing the " +
+                                  "local env run as " + runAs)
+            finally:
+                os.remove(shFile)
+
+        for needKey in merged:
+            if sourcedEnv and needKey in sourcedEnv:
+                anEnvList[needKey] = sourcedEnv[needKey]
+
 
 def getSettings(anEnvList):
     """Read the ~/.dcConfig/settings file."""
-    baseSettingsFile = expanduser("~") + "/.dcConfig/settings"
-    with open(baseSettingsFile, 'r') as f:
-        lines = [line.rstrip('\n') for line in f]
-
-    for aLine in lines:
-        if "CUSTOMER_NAME=" in aLine:
-            anEnvList["CUSTOMER_NAME"] = aLine.split("=")[1]
-        if "PROFILE=" in aLine:
-            anEnvList["PROFILE"] = aLine.split("=")[1]
-        if "REGION=" in aLine:
-            anEnvList["REGION"] = aLine.split("=")[1]
-        if "USER_NAME=" in aLine:
-            anEnvList["USER_NAME"] = aLine.split("=")[1]
-        if "dcCOMMON_SHARED_DIR=" in aLine:
-            anEnvList["dcCOMMON_SHARED_DIR"] = aLine.split("=")[1]
+    importResolveModules()
+    settings = dcsettings.getSettings()
+    for key in SETTINGS_KEYS:
+        if key in settings:
+            anEnvList[key] = settings[key]
 
 
 def pythonGetEnv(initialCreate=False, forCustomer=None):
@@ -424,38 +536,246 @@ def pythonGetEnv(initialCreate=False, forCustomer=None):
     return returnEnvList
 
 
+def pythonGetEnvs(envNames, runAsNames=None, forCustomer=None):
+    """Process several envs, keyed by env, when called from a python script.
+
+    The local env run as each of runAsNames is keyed local:<run-as>.
+    """
+    envList = dcEnvCheckArgs()
+
+    if forCustomer is None:
+        if "FOR_CUSTOMER" in envList:
+            forCustomer = envList["FOR_CUSTOMER"]
+
+    anEnv = Process_dc_Env(envList, forCustomer=forCustomer)
+    return anEnv.resolveEnvs(envNames, runAsNames)
+
+
+def parseEnvSpec(anEnvSpec):
+    """Return the env and run-as name in an ENV or ENV:RUNAS argument."""
+    (env, separator, runAs) = anEnvSpec.partition(":")
+    env = env or "local"
+    if runAs and env != "local":
+        print("Only the local env can be run as someone else, not " +
+              anEnvSpec)
+        sys.exit(1)
+
+    return (env, runAs or None)
+
+
+def getResolvedEnvs(envList, envSpecs, forCustomer=None, noEnvCache=False):
+    """Return each of the ENV or ENV:RUNAS envs, using the env cache.
+
+    The ones that aren't cached are resolved together and cached for the
+    next time, and for the shell scripts using the same env.
+    """
+    includeFileName = os.path.abspath(os.path.dirname(sys.argv[0]) +
+                                      '/shellfunctions.incl')
+    envCache = ResolvedEnvCache(refresh=noEnvCache)
+    resolvedEnvs = OrderedDict()
+    cacheKeys = {}
+    for anEnvSpec in envSpecs:
+        (env, runAs) = parseEnvSpec(anEnvSpec)
+        specEnvList = dict(envList)
+        specEnvList["ENV"] = env
+        if runAs:
+            # so it isn't the entry of the shell scripts' local env
+            specEnvList["RUN_AS"] = runAs
+        cacheKeys[anEnvSpec] = envCache.createKey(specEnvList)
+        entry = envCache.read(cacheKeys[anEnvSpec])
+        if entry:
+            resolvedEnvs[anEnvSpec] = entry["EnvList"]
+
+    missingSpecs = [anEnvSpec for anEnvSpec in envSpecs
+                    if anEnvSpec not in resolvedEnvs]
+    if missingSpecs:
+        envNames = []
+        runAsNames = []
+        for anEnvSpec in missingSpecs:
+            (env, runAs) = parseEnvSpec(anEnvSpec)
+            if runAs:
+                runAsNames.append(runAs)
+            else:
+                envNames.append(env)
+
+        anEnv = Process_dc_Env(dict(envList), forCustomer=forCustomer)
+        resolved = anEnv.resolveEnvs(envNames, runAsNames)
+        anEnv.recordSourceFile(includeFileName)
+        for anEnvSpec in missingSpecs:
+            (env, runAs) = parseEnvSpec(anEnvSpec)
+            returnEnvList = resolved["local:" + runAs if runAs else env]
+            resolvedEnvs[anEnvSpec] = returnEnvList
+            if anEnv.isCacheable():
+                envCache.write(cacheKeys[anEnvSpec], anEnv.sourceFiles,
+                               returnEnvList, anEnv.environmentUsed,
+                               createShellOutput(returnEnvList,
+                                                 includeFileName))
+
+    return resolvedEnvs
+
+
+def explainEnv(envList, anEnvSpec, forCustomer=None, noEnvCache=False):
+    """Return the lines explaining where each value in an env comes from."""
+    importResolveModules()
+    resolvedEnv = getResolvedEnvs(envList, [anEnvSpec], forCustomer,
+                                  noEnvCache)[anEnvSpec]
+    (env, runAs) = parseEnvSpec(anEnvSpec)
+
+    # the app utils directory is worked out as getBaseAppUtils does
+    appUtilsDir = resolvedEnv["BASE_CUSTOMER_DIR"] + "/" + \
+        resolvedEnv["CUSTOMER_APP_NAME"] + "/" + \
+        resolvedEnv["CUSTOMER_APP_UTILS"]
+    if forCustomer:
+        appUtilsDir += "/" + forCustomer
+
+    try:
+        layerFiles = envlayers.getLayerFiles(resolvedEnv["dcUTILS"],
+                                             appUtilsDir, env, runAs)
+        keyHistory = envlayers.getKeyHistory(
+            envlayers.getLayers(layerFiles, resolvedEnv, env))
+    except IOError as e:
+        print("Can not read the env files for " + anEnvSpec + ": " + str(e))
+        sys.exit(1)
+
+    return envexplain.explainEnv(resolvedEnv, keyHistory)
+
+
+def diffEnvs(envList, firstSpec, secondSpec, forCustomer=None,
+             noEnvCache=False):
+    """Return the lines showing the differences between two envs."""
+    importResolveModules()
+    resolvedEnvs = getResolvedEnvs(envList, [firstSpec, secondSpec],
+                                   forCustomer, noEnvCache)
+    return envexplain.diffEnvs(firstSpec, resolvedEnvs[firstSpec],
+                               secondSpec, resolvedEnvs[secondSpec])
+
+
 def shellGetEnv():
     """Process env when called via a shell script."""
-    (envList, initialCreate, generateEnvFiles) = dcEnvCheckArgs(type=1)
+    (envList, args) = dcEnvCheckArgs(type=1)
+    initialCreate = args["initialCreate"]
+    generateEnvFiles = args["generateEnvFiles"]
+    noEnvCache = args["noEnvCache"]
+    envNames = splitNames(args["envs"])
+    runAsNames = splitNames(args["runAs"])
 
     customerNameToSpecialize = None
     if "FOR_CUSTOMER" in envList:
         customerNameToSpecialize = envList["FOR_CUSTOMER"]
 
+    if envNames or runAsNames:
+        # more than one env can't be put in the shell's environment, so they
+        # are printed as json for the tools that compare or render them
+        import json
+        anEnv = Process_dc_Env(envList, forCustomer=customerNameToSpecialize)
+        print(json.dumps(anEnv.resolveEnvs(envNames, runAsNames), indent=4))
+        return
+
+    if args["explain"]:
+        print("\n".join(explainEnv(envList, args["explain"],
+                                   customerNameToSpecialize, noEnvCache)))
+        return
+
+    if args["diff"]:
+        diffSpecs = args["diff"].split(",")
+        if len(diffSpecs) != 2:
+            print("--diff takes two envs separated by a comma, ie local,dev")
+            sys.exit(1)
+        print("\n".join(diffEnvs(envList, diffSpecs[0].strip(),
+                                 diffSpecs[1].strip(),
+                                 customerNameToSpecialize, noEnvCache)))
+        return
+
+    includeFileName = os.path.abspath(os.path.dirname(sys.argv[0]) +
+                                      '/shellfunctions.incl')
     if initialCreate:
-        returnEnvList = envList
-    else:
-        anEnv = Process_dc_Env(envList, generateEnvFiles,
-                               forCustomer=customerNameToSpecialize)
-        returnEnvList = anEnv.process_dc_env()
+        print(createShellOutput(envList, includeFileName))
+        return
+
+    # the env files are about to be written when generating them, so the
+    # cache is only used when they are being read.  The entry has the whole
+    # output in it, shellfunctions.incl included, so it is just printed
+    envCache = None
+    if not generateEnvFiles:
+        envCache = ResolvedEnvCache(refresh=noEnvCache)
+        cacheKey = envCache.createKey(envList)
+        entry = envCache.read(cacheKey)
+        if entry:
+            print(entry["Output"])
+            return
+
+    anEnv = Process_dc_Env(envList, generateEnvFiles,
+                           forCustomer=customerNameToSpecialize)
+    returnEnvList = anEnv.process_dc_env()
+    anEnv.recordSourceFile(includeFileName)
+    returnStr = createShellOutput(returnEnvList, includeFileName)
+    if envCache and anEnv.isCacheable():
+        envCache.write(cacheKey, anEnv.sourceFiles, returnEnvList,
+                       anEnv.environmentUsed, returnStr)
 
+    print(returnStr)
+
+
+def createShellOutput(returnEnvList, includeFileName):
+    """Return the export line and the shell functions to be eval'd."""
     returnStr = "export"
-    for key, value in returnEnvList.iteritems():
+    for key, value in returnEnvList.items():
         if '\"' in value or '\'' in value:
             returnStr += " " + key + '=' + value
         else:
             returnStr += " " + key + '="' + value + '"'
 
-    curDir = os.path.dirname(sys.argv[0])
-    with open(curDir + '/shellfunctions.incl', 'r') as includeFile:
+    with open(includeFileName, 'r') as includeFile:
         data = includeFile.read()
 
     returnStr += " ; {}".format(data)
-    print(returnStr)
+    return returnStr
+
+
+def quickCheckArgs(argv):
+    """Get the options without argparse, or None if it is needed for them."""
+    values = {"appName": None, "env": "local", "workspaceName": None,
+              "initialCreate": False, "generateEnvFiles": False,
+              "noEnvCache": False, "forCustomer": None, "envs": None,
+              "runAs": None, "explain": None, "diff": None}
+    index = 0
+    while index < len(argv):
+        anArg = argv[index]
+        index += 1
+        if not anArg.startswith("-") or anArg == "-":
+            continue
+
+        if anArg.startswith("--"):
+            option, equals, value = anArg.partition("=")
+        else:
+            option, equals, value = anArg, '', ''
+
+        if option in QUICK_OPTIONS:
+            name, takesValue = QUICK_OPTIONS[option]
+            if not takesValue:
+                if equals:
+                    return None
+                values[name] = True
+            elif equals:
+                values[name] = value
+            elif index < len(argv) and not argv[index].startswith("-"):
+                values[name] = argv[index]
+                index += 1
+            else:
+                return None
+        elif anArg == "--" or anArg[:2] in QUICK_OPTIONS or \
+                anArg[:2] == "-h" or \
+                any(aLong.startswith(option) for aLong in QUICK_LONG_OPTIONS):
+            # -aVALUE, an abbreviated option, -- and help are left to argparse
+            return None
 
+    return values
+
+
+def parseArgs():
+    """Get the options from the arguments with argparse."""
+    import argparse
 
-def dcEnvCheckArgs(type=0):
-    """Check the arguments passed into this script."""
     parser = argparse.ArgumentParser(
         description='The core argument processing is handled by a separate '
         'process (process_dc_env.py) and is called by this script.  This core '
@@ -509,6 +829,37 @@ def dcEnvCheckArgs(type=0):
                         action="store_true",
                         help=argparse.SUPPRESS,
                         required=False)
+    parser.add_argument('--noEnvCache',
+                        help='Resolve the environment from the settings and '
+                        'env files rather than using the one that was cached '
+                        'the last time for the same arguments. The cache is '
+                        'updated with what is resolved.',
+                        action="store_true",
+                        required=False)
+    parser.add_argument('--envs',
+                        help='A comma separated list of envs (ie, '
+                        'local,dev,staging,prod) to resolve together in one '
+                        'pass. They are printed as json keyed by env rather '
+                        'than put in the environment. DEFAULT: none',
+                        required=False)
+    parser.add_argument('--runAs',
+                        help='A comma separated list of the alternate names '
+                        'that deployenv.sh --run-as takes. The local env run '
+                        'as each one is printed with the --envs ones, keyed '
+                        'local:<runAs>. DEFAULT: none',
+                        required=False)
+    parser.add_argument('--explain',
+                        help='Print each key in the env given (ie, local, '
+                        'dev or local:<runAs>) with the env file that set '
+                        'its value and the ones it overrode, rather than '
+                        'putting it in the environment. DEFAULT: none',
+                        required=False)
+    parser.add_argument('--diff',
+                        help='Print the differences between two envs '
+                        'separated by a comma (ie, local,dev or '
+                        'local:<runAs>,local) rather than putting one in the '
+                        'environment. DEFAULT: none',
+                        required=False)
     parser.add_argument('--forCustomer',
                         # help='This is used only'
                         # 'when creating a dcAuthorization instance.',
@@ -521,23 +872,41 @@ def dcEnvCheckArgs(type=0):
     except SystemExit:
         sys.exit(1)
 
+    return vars(args)
+
+
+def splitNames(aValue):
+    """Return the names in a comma separated option value as a list."""
+    if not aValue:
+        return []
+    return [aName.strip() for aName in aValue.split(",") if aName.strip()]
+
+
+def dcEnvCheckArgs(type=0):
+    """Check the arguments passed into this script."""
+    # argparse takes a noticeable part of the start up time, so it is only used
+    # when the arguments aren't just the options given in the usual way
+    args = quickCheckArgs(sys.argv[1:])
+    if args is None:
+        args = parseArgs()
+
     returnList = {}
 
-    if args.appName:
-        returnList["CUSTOMER_APP_NAME"] = args.appName
+    if args["appName"]:
+        returnList["CUSTOMER_APP_NAME"] = args["appName"]
 
-    if args.env:
-        returnList["ENV"] = args.env
+    if args["env"]:
+        returnList["ENV"] = args["env"]
 
-    if args.workspaceName:
-        returnList["WORKSPACE_NAME_ORIGINAL"] = args.workspaceName
-        returnList["WORKSPACE_NAME"] = args.workspaceName.upper()
+    if args["workspaceName"]:
+        returnList["WORKSPACE_NAME_ORIGINAL"] = args["workspaceName"]
+        returnList["WORKSPACE_NAME"] = args["workspaceName"].upper()
 
-    if args.forCustomer:
-        returnList["FOR_CUSTOMER"] = args.forCustomer
+    if args["forCustomer"]:
+        returnList["FOR_CUSTOMER"] = args["forCustomer"]
     # if we get here then the return the necessary arguments
     if type:
-        return (returnList, args.initialCreate, args.generateEnvFiles)
+        return (returnList, args)
     else:
         return (returnList)
 
@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+"""
+Docstring for sshsessions.py. This script manages a pool of shared ssh
+connections (ssh ControlMaster/ControlPersist sessions) to the instances that
+InstanceInfo finds, so that paws, pawscp and fleetexec.py can reuse a connection
+that is already logged in instead of doing the ssh handshake, twice when there
+is a jump server in the way, for every command and copy.
+
+There is one session for each destination login, host and port and the jump
+server it is reached through.  The control sockets are kept in
+~/.dcConfig/ssh-sessions along with a small json file for each one that says
+which instance and session it is for.
+
+    sshsessions.py -c list                    show the sessions and if they are still up
+    sshsessions.py -c warm -t Env=dev         start the sessions for the instances found
+    sshsessions.py -c teardown [-t Env=dev]   stop the sessions (all of them without filters)
+    sshsessions.py -c config -t Env=dev       print the ssh config lines that use the sessions
+
+With -b the instances are the ones in the json that instanceinfo.py -sc batch
+printed, from a file or - for stdin, rather than being looked up again.  That
+is how paws and pawscp add the session lines to the ssh config they already
+got from instanceinfo.py.
+"""
+
+import os
+import sys
+import argparse
+import json
+import glob
+import signal
+import hashlib
+import subprocess
+import threading
+from collections import namedtuple, OrderedDict
+from multiprocessing.pool import ThreadPool
+from os.path import expanduser
+from instanceinfo import parseRegionString, parseTagString
+
+# ==============================================================================
+__version__ = "0.1"
+
+__copyright__ = "Copyright 2017, devops.center"
+__credits__ = ["Bob Lozano", "Gregg Jensen"]
+__license__ = ' \
+   # Copyright 2014-2017 devops.center llc                                    \
+   #                                                                          \
+   # Licensed under the Apache License, Version 2.0 (the "License");          \
+   # you may not use this file except in compliance with the License.         \
+   # You may obtain a copy of the License at                                  \
+   #                                                                          \
+   #   http://www.apache.org/licenses/LICENSE-2.0                             \
+   #                                                                          \
+   # Unless required by applicable law or agreed to in writing, software      \
+   # distributed under the License is distributed on an "AS IS" BASIS,        \
+   # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. \
+   # See the License for the specific language governing permissions and      \
+   # limitations under the License.                                           \
+   # '
+__status__ = "Development"
+
+DEFAULT_CONTROL_DIR = "~/.dcConfig/ssh-sessions"
+
+# the number of seconds a session is kept open after the last command or copy that used it has finished
+DEFAULT_CONTROL_PERSIST = 600
+
+# the number of seconds ssh waits for the connection to a host to be made
+DEFAULT_CONNECT_TIMEOUT = 10
+
+# the number of sessions that are started or stopped at the same time
+DEFAULT_MAX_PARALLEL = 32
+
+# ==============================================================================
+
+SessionInfo = namedtuple('SessionInfo', 'InstanceName, Session, ControlPath, Active')
+
+
+def getFirstKey(keyList):
+    """Return the first key path in a list of them, or the key itself if it isn't a list."""
+    if isinstance(keyList, list):
+        return keyList[0] if keyList else ''
+
+    return keyList or ''
+
+
+def createJumpServerCommand(connectParts, sshOptions=None):
+    """Return the ProxyCommand that goes through the jump server for an instance, or None if it doesn't have one.
+
+    sshOptions are put on the jump server's ssh command line as they are, so they can't have spaces in them.
+    """
+    if not connectParts.get("JumpServerHost"):
+        return None
+
+    proxyCommand = "ssh"
+    if sshOptions:
+        proxyCommand += " " + " ".join(sshOptions)
+    jumpServerKey = getFirstKey(connectParts.get("JumpServerKey"))
+    if jumpServerKey:
+        proxyCommand += " -i \"" + jumpServerKey + "\""
+    proxyCommand += " -W %h:%p -p " + str(connectParts["JumpServerPort"] or 22) + " " + \
+                    connectParts["JumpServerLogin"] + "@" + connectParts["JumpServerHost"]
+
+    return proxyCommand
+
+
+def createSSHCommand(connectParts, command=None, connectTimeout=DEFAULT_CONNECT_TIMEOUT, extraOptions=None,
+                     proxyOptions=None):
+    """Return the ssh command line, as a list, that runs the command on an instance.
+
+    proxyOptions are the options for the ssh to the jump server, if the instance is behind one.
+    """
+    sshCommand = ["ssh", "-o", "BatchMode=yes", "-o", "ConnectTimeout=" + str(connectTimeout)]
+    if extraOptions:
+        sshCommand += extraOptions
+
+    destKey = getFirstKey(connectParts.get("DestKey"))
+    if destKey:
+        sshCommand += ["-i", destKey]
+
+    sshCommand += ["-p", str(connectParts.get("DestSSHPort") or 22)]
+
+    jumpServerCommand = createJumpServerCommand(connectParts, proxyOptions)
+    if jumpServerCommand:
+        sshCommand += ["-o", "ProxyCommand=" + jumpServerCommand]
+
+    sshCommand.append((connectParts.get("DestLogin") or "ubuntu") + "@" + connectParts["DestHost"])
+    if command:
+        sshCommand.append(command)
+
+    return sshCommand
+
+
+def startProcessTimer(process, timeout, timedOut):
+    """Start a timer that stops the process, and anything it started, if it is still running after the timeout."""
+    def stopProcess():
+        timedOut.append(True)
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            # it finished just as the time ran out
+            pass
+
+    timer = threading.Timer(timeout, stopProcess)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+def runQuietly(command, timeout):
+    """Run a command with no input or output and return its exit code, or None if it didn't finish in time."""
+    devNull = open(os.devnull, 'r+')
+    try:
+        # its own process group so that the ProxyCommand is stopped along with it
+        process = subprocess.Popen(command, stdin=devNull, stdout=devNull, stderr=devNull, preexec_fn=os.setsid)
+    except OSError:
+        devNull.close()
+        return None
+
+    timedOut = []
+    timer = startProcessTimer(process, timeout, timedOut)
+    try:
+        exitCode = process.wait()
+    finally:
+        timer.cancel()
+        devNull.close()
+
+    return None if timedOut else exitCode
+
+
+class SSHSessionPool:
+
+    def __init__(self, controlDir=None, persist=DEFAULT_CONTROL_PERSIST, connectTimeout=DEFAULT_CONNECT_TIMEOUT):
+        """Construct an instance of the SSHSessionPool class."""
+        self.controlDir = expanduser(controlDir or DEFAULT_CONTROL_DIR)
+        self.persist = persist
+        self.connectTimeout = connectTimeout
+
+    def getSessionKey(self, connectParts):
+        """Return the string that identifies the session for an instance: its login, host and port and jump server."""
+        sessionKey = "{}@{}:{}".format(connectParts.get("DestLogin") or "ubuntu", connectParts["DestHost"],
+                                       connectParts.get("DestSSHPort") or 22)
+        if connectParts.get("JumpServerHost"):
+            sessionKey += " via {}@{}:{}".format(connectParts["JumpServerLogin"], connectParts["JumpServerHost"],
+                                                 connectParts.get("JumpServerPort") or 22)
+
+        return sessionKey
+
+    def getControlPath(self, connectParts):
+        """Return the path of the control socket for an instance's session."""
+        # the key is hashed so the path stays under the length that a unix socket path can be
+        sessionHash = hashlib.sha1(self.getSessionKey(connectParts).encode('utf-8')).hexdigest()[:20]
+        return os.path.join(self.controlDir, sessionHash + ".sock")
+
+    def getSSHOptions(self, connectParts):
+        """Return the ssh options that use the instance's session if it is up, without starting a new one."""
+        return ["-o", "ControlMaster=no", "-o", "ControlPath=" + self.getControlPath(connectParts)]
+
+    def getConfigLines(self, instanceName, connectParts):
+        """Return the lines for an ssh config Host entry that use the session, starting it if it isn't up."""
+        self.recordSession(instanceName, connectParts)
+        return [" ControlMaster auto",
+                " ControlPath \"" + self.getControlPath(connectParts) + "\"",
+                " ControlPersist " + str(self.persist)]
+
+    def recordSession(self, instanceName, connectParts):
+        """Write down which instance and session a control socket is for, so they can be listed."""
+        controlPath = self.getControlPath(connectParts)
+        sessionFilePath = controlPath[:-len(".sock")] + ".json"
+        if os.path.exists(sessionFilePath):
+            # the control path is made from the session so what is written down for it doesn't change
+            return
+
+        if not os.path.isdir(self.controlDir):
+            # the control sockets give access to the instances so only the user gets to see them, it is created that
+            # way so there is no time when it is open to anyone else
+            os.makedirs(self.controlDir, 0o700)
+
+        with open(sessionFilePath, 'w') as sessionFile:
+            json.dump({"InstanceName": instanceName, "Session": self.getSessionKey(connectParts),
+                       "ControlPath": controlPath}, sessionFile)
+
+    def isActive(self, controlPath):
+        """Check if there is a session up and listening on the control socket."""
+        if not os.path.exists(controlPath):
+            return False
+
+        # the host isn't used since the control path is given, but ssh still needs one
+        return runQuietly(["ssh", "-O", "check", "-o", "ControlPath=" + controlPath, "session"],
+                          self.connectTimeout) == 0
+
+    def warm(self, instanceName, connectParts):
+        """Start the session for an instance if it isn't already up and return if it is up."""
+        controlPath = self.getControlPath(connectParts)
+        if self.isActive(controlPath):
+            return True
+
+        self.recordSession(instanceName, connectParts)
+        # -f puts the master in the background once it has logged in, and it stays there for the persist time
+        masterOptions = ["-M", "-N", "-f", "-o", "ControlPath=" + controlPath,
+                         "-o", "ControlPersist=" + str(self.persist)]
+        exitCode = runQuietly(createSSHCommand(connectParts, None, self.connectTimeout, masterOptions),
+                              self.connectTimeout * 2)
+        return exitCode == 0
+
+    def teardown(self, controlPath):
+        """Stop the session on a control socket and forget about it."""
+        if os.path.exists(controlPath):
+            runQuietly(["ssh", "-O", "exit", "-o", "ControlPath=" + controlPath, "session"], self.connectTimeout)
+
+        sessionFile = controlPath[:-len(".sock")] + ".json"
+        if os.path.exists(sessionFile):
+            os.remove(sessionFile)
+
+    def listSessions(self):
+        """Return the sessions that have been started, with whether each of them is still up."""
+        retList = []
+        for sessionFile in sorted(glob.glob(os.path.join(self.controlDir, "*.json"))):
+            try:
+                with open(sessionFile) as aFile:
+                    session = json.load(aFile)
+            except (IOError, ValueError):
+                continue
+
+            retList.append(SessionInfo(InstanceName=session.get("InstanceName"), Session=session.get("Session"),
+                                       ControlPath=session.get("ControlPath"),
+                                       Active=self.isActive(session.get("ControlPath", ""))))
+
+        return sorted(retList, key=lambda aSession: aSession.InstanceName)
+
+
+def runForEach(function, items, maxParallel=DEFAULT_MAX_PARALLEL):
+    """Call the function for each of the items at the same time, up to maxParallel at once, and return the results."""
+    if not items:
+        return []
+
+    pool = ThreadPool(min(maxParallel, len(items)))
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def readBatchConnectParts(batchFile):
+    """Return the connect parts for each instance in the json that instanceinfo.py -sc batch printed, sorted by name."""
+    if batchFile == "-":
+        batch = json.load(sys.stdin, object_pairs_hook=OrderedDict)
+    else:
+        with open(batchFile) as aFile:
+            batch = json.load(aFile, object_pairs_hook=OrderedDict)
+
+    connectParts = batch.get("connectParts") or {}
+    return OrderedDict((aName, connectParts[aName]) for aName in sorted(connectParts) if connectParts[aName])
+
+
+def checkArgs():
+    """Check the command line arguments."""
+    parser = argparse.ArgumentParser(
+        description=('This script lists, starts (warms) and stops (tears down) the shared ssh sessions to the '
+                     'instances that are used by paws, pawscp and fleetexec.py.'))
+    parser.add_argument('-c', '--command', help='list the sessions, warm or teardown the sessions for the instances '
+                                                'found, or print the ssh config lines that use them',
+                        choices=['list', 'warm', 'teardown', 'config'],
+                        default='list',
+                        required=False)
+    parser.add_argument('-o', '--organization', help='The organization (customer name) that the instances are for',
+                        required=False)
+    parser.add_argument('-r', '--regions', help='A list of regions separated by a space to look for the instances in',
+                        required=False)
+    parser.add_argument('-t', '--tags', help='A list of key=value pairs separated by a space (no space before or after '
+                                             'the equal sign).  This will be used to filter the instances',
+                        required=False)
+    parser.add_argument('-kd', '--keysDirectory', help='This is the path to where the key resides on your system ',
+                        required=False)
+    parser.add_argument('-sd', '--sharedDirectory', help='This is the path to the shared drive on the system this is '
+                                                         'running on.',
+                        required=False)
+    parser.add_argument('--persist', help='The number of seconds a session stays open after it was last used. '
+                                          'DEFAULT: ' + str(DEFAULT_CONTROL_PERSIST),
+                        type=int, default=DEFAULT_CONTROL_PERSIST,
+                        required=False)
+    parser.add_argument('--noDaemon', help='Do not ask the inventory daemon (instanceinfod.py) for the instances even '
+                                           'if it is running.',
+                        action="store_true",
+                        required=False)
+    parser.add_argument('-b', '--batch', help='Use the instances in the json that instanceinfo.py -sc batch printed, '
+                                              'in this file or - for stdin, instead of looking them up.',
+                        required=False)
+    args = parser.parse_args()
+
+    return (args.command, args.organization, parseRegionString(args.regions), parseTagString(args.tags),
+            args.keysDirectory, args.sharedDirectory, args.persist, not args.noDaemon,
+            args.tags is not None or args.batch is not None, args.batch)
+
+
+def main(argv):
+    """Main code goes here."""
+    (command, organization, regions, tagList, keysDir, sharedDir, persist, useDaemon, hasFilters,
+     batchFile) = checkArgs()
+    sessionPool = SSHSessionPool(persist=persist)
+
+    if command == "list" or (command == "teardown" and not hasFilters and not regions):
+        sessions = sessionPool.listSessions()
+        if command == "list":
+            for aSession in sessions:
+                print("{} ({}): {}".format(aSession.InstanceName, aSession.Session,
+                                           "up" if aSession.Active else "down"))
+        else:
+            runForEach(sessionPool.teardown, [aSession.ControlPath for aSession in sessions])
+            print("Stopped {} sessions".format(len(sessions)))
+        return
+
+    if batchFile:
+        connectPartsByName = readBatchConnectParts(batchFile)
+    else:
+        # the instances are looked up the same way that fleetexec.py does it
+        from fleetexec import getConnectPartsForInstances
+        connectPartsByName = getConnectPartsForInstances(organization, regions, keysDir, sharedDir, tagList, useDaemon)
+
+    if command == "config":
+        for instanceName, connectParts in connectPartsByName.items():
+            print("Host " + instanceName)
+            print("\n".join(sessionPool.getConfigLines(instanceName, connectParts)))
+            print("")
+
+    elif command == "warm":
+        names = list(connectPartsByName)
+        results = runForEach(lambda aName: sessionPool.warm(aName, connectPartsByName[aName]), names)
+        for instanceName, isUp in zip(names, results):
+            print("{}: {}".format(instanceName, "up" if isUp else "could not be started"))
+        if not all(results):
+            sys.exit(1)
+
+    elif command == "teardown":
+        controlPaths = [sessionPool.getControlPath(connectParts) for connectParts in connectPartsByName.values()]
+        runForEach(sessionPool.teardown, controlPaths)
+        print("Stopped {} sessions".format(len(controlPaths)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+Docstring for workspaceindex.py. This module lists the directories in a workspace
+that process_dc_env.py looks in: the base directory for the apps in it and each
+app's environments/.generatedEnvFiles for the env files deployenv.sh wrote.
+
+A directory is listed the first time it is asked for and that listing is used
+after that, until the directory's mtime changes (an app or env file was added or
+removed).  The listings are kept in an index file under ~/.dcConfig/cache, keyed
+by the directory's path and mtime, so the process_dc_env.py calls that follow
+each other only stat the base directory and each app utils directory's
+.generatedEnvFiles rather than listing them again.  On a workspace on a network
+drive that saves going back to the drive for every entry, and the files are kept
+in a set so checking for one doesn't go through all of them.
+"""
+
+import os
+import sys
+import json
+from collections import namedtuple
+from os.path import expanduser
+
+# ==============================================================================
+__version__ = "0.1"
+
+__copyright__ = "Copyright 2017, devops.center"
+__credits__ = ["Bob Lozano", "Gregg Jensen"]
+__license__ = ' \
+   # Copyright 2014-2017 devops.center llc                                    \
+   #                                                                          \
+   # Licensed under the Apache License, Version 2.0 (the "License");          \
+   # you may not use this file except in compliance with the License.         \
+   # You may obtain a copy of the License at                                  \
+   #                                                                          \
+   #   http://www.apache.org/licenses/LICENSE-2.0                             \
+   #                                                                          \
+   # Unless required by applicable law or agreed to in writing, software      \
+   # distributed under the License is distributed on an "AS IS" BASIS,        \
+   # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. \
+   # See the License for the specific language governing permissions and      \
+   # limitations under the License.                                           \
+   # '
+__status__ = "Development"
+
+# the sub directories in the order they are listed, and the files as a set
+DirectoryListing = namedtuple("DirectoryListing", ["subDirs", "files"])
+
+# bump this when the layout of the index changes so an old index is just ignored
+INDEX_FORMAT_VERSION = 1
+
+DEFAULT_INDEX_FILE = "~/.dcConfig/cache/workspaceindex.json"
+
+# the listing of each directory along with the directory's mtime and size when it was listed, read from the index
+# file the first time a directory is asked for
+directories = None
+
+# ==============================================================================
+
+
+def scanDirectory(aPath):
+    """Return the listing of a directory, a symlink to a directory is a sub directory as it is for os.walk."""
+    subDirs = []
+    files = set()
+    if hasattr(os, "scandir"):
+        for entry in os.scandir(aPath):
+            if entry.is_dir():
+                subDirs.append(entry.name)
+            else:
+                files.add(entry.name)
+    else:
+        # python 2 doesn't have scandir, so each entry has to be looked at to tell
+        for name in os.listdir(aPath):
+            if os.path.isdir(os.path.join(aPath, name)):
+                subDirs.append(name)
+            else:
+                files.add(name)
+
+    return DirectoryListing(subDirs, files)
+
+
+def toNativeString(aString):
+    """Return a name from the index as a str, json gives back unicode strings on python 2."""
+    if sys.version_info[0] >= 3 or isinstance(aString, str):
+        return aString
+
+    return aString.encode('utf-8')
+
+
+def loadIndex(indexFile=DEFAULT_INDEX_FILE):
+    """Return the listings in the index file, an index that can't be read is just empty."""
+    try:
+        with open(expanduser(indexFile)) as aFile:
+            index = json.load(aFile)
+    except (IOError, ValueError):
+        return {}
+
+    if not isinstance(index, dict) or index.get("Version") != INDEX_FORMAT_VERSION:
+        return {}
+
+    listings = {}
+    for aPath, entry in index.get("Directories", {}).items():
+        listing = DirectoryListing([toNativeString(name) for name in entry["SubDirs"]],
+                                   set(toNativeString(name) for name in entry["Files"]))
+        listings[toNativeString(aPath)] = (tuple(entry["Fingerprint"]), listing)
+
+    return listings
+
+
+def saveIndex(indexFile=DEFAULT_INDEX_FILE):
+    """Write the listings to the index file, not being able to is only a warning as it's listed again next time."""
+    # only needed when the index is written, which isn't when nothing in the workspace has changed
+    import tempfile
+
+    index = {"Version": INDEX_FORMAT_VERSION, "Directories": {}}
+    for aPath, (dirVersion, listing) in directories.items():
+        # a directory that has gone (an app that was removed) would otherwise stay in the index for good
+        if not os.path.isdir(aPath):
+            continue
+        index["Directories"][aPath] = {"Fingerprint": list(dirVersion), "SubDirs": listing.subDirs,
+                                       "Files": sorted(listing.files)}
+
+    indexPath = expanduser(indexFile)
+    indexDir = os.path.dirname(indexPath)
+    tmpPath = None
+    try:
+        if not os.path.isdir(indexDir):
+            os.makedirs(indexDir)
+        # written to a temporary file and moved into place so an index that is only partly written is never read
+        fd, tmpPath = tempfile.mkstemp(dir=indexDir, prefix=".workspaceindex.")
+        with os.fdopen(fd, 'w') as aFile:
+            json.dump(index, aFile)
+        os.rename(tmpPath, indexPath)
+    except (IOError, OSError) as e:
+        sys.stderr.write("WARNING: could not write the workspace index {}: {}\n".format(indexPath, e))
+        if tmpPath and os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+
+def getDirectory(aPath):
+    """Return the listing of a directory, only listing it again when it changes.  One that isn't there is empty."""
+    global directories
+
+    try:
+        dirStat = os.stat(aPath)
+    except OSError:
+        return DirectoryListing([], set())
+    dirVersion = (dirStat.st_mtime, dirStat.st_size)
+
+    if directories is None:
+        directories = loadIndex()
+
+    cached = directories.get(aPath)
+    if cached is None or cached[0] != dirVersion:
+        try:
+            listing = scanDirectory(aPath)
+        except OSError:
+            return DirectoryListing([], set())
+        cached = (dirVersion, listing)
+        directories[aPath] = cached
+        saveIndex()
+
+    return cached[1]
+
+
+def getAppNames(baseDir):
+    """Return the apps in a workspace's base directory, which are the directories in it."""
+    return getDirectory(baseDir).subDirs
+
+
+def getGeneratedEnvFiles(appUtilsDir):
+    """Return the set of files deployenv.sh generated in an app utils directory."""
+    return getDirectory(os.path.join(appUtilsDir, "environments", ".generatedEnvFiles")).files
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# ==============================================================================
+#
+#          FILE: envlayers_test.py
+#
+#         USAGE: envlayers_test.py
+#
+#   DESCRIPTION: Checks how the env files are read and merged: the entries
+#                envlayers.py finds in an env file, what fixUpEnvFile.py
+#                --streaming and generateEnvFiles.py write for them, and that
+#                generateEnvFiles.py writes the same files the cat/sed and
+#                fixUpEnvFile.py chain in deployenv.sh used to.
+#
+#       OPTIONS: ---
+#  REQUIREMENTS: bash, grep and sed for the old deployenv.sh chain
+#          BUGS: ---
+#         NOTES: runs with python -m unittest or pytest, or on its own
+#        AUTHOR: Gregg Jensen (), gjensen@devops.center
+#                Bob Lozano (), bob@devops.center
+#  ORGANIZATION: devops.center
+#       CREATED: 10/18/2017 15:10:00
+#      REVISION:  ---
+#
+# Copyright 2014-2017 devops.center llc
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ==============================================================================
+
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                           "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+import envlayers  # noqa: E402
+# ==============================================================================
+__version__ = "0.1"
+
+__copyright__ = "Copyright 2017, devops.center"
+__credits__ = ["Bob Lozano", "Gregg Jensen"]
+__license__ = "GPL"
+__status__ = "Development"
+
+# the layers of an app with the values that have to be read with care: a quote
+# in the middle of a value, a certificate that goes over more than one line, a
+# quote that is never closed and a line without an =
+DCUTILS_COMMON_ENV = ("# devops.center common\n"
+                      "dcDEFAULT_APP_NAME=__DEFAULT__\n"
+                      "LOG_LEVEL=info\n")
+APP_COMMON_ENV = ("# app common\n"
+                  "\n"
+                  "LOG_LEVEL=debug\n"
+                  "PASSWORD=ab'cd\n"
+                  "dcHOME=/home/dc\n")
+QUOTES_ENV = ('CERT="-----BEGIN CERTIFICATE-----\n'
+              'MIIBszCCAV2gAwIBAgIJAK\n'
+              '-----END CERTIFICATE-----"\n'
+              "OPEN='abc\n"
+              "NOEQUALS\n"
+              "AFTER=1\n"
+              "LOG_LEVEL=warn\n")
+
+# the ones that only have single line values, which the old chain handled
+PLAIN_ENV = ("# dev\n"
+             "LOG_LEVEL=warn\n"
+             "\n"
+             "DB_HOST=db.example.com\n"
+             "PASSWORD=xy'z\n")
+PERSONAL_ENV = ("DB_HOST=localhost\n"
+                "DEBUG=1\n")
+
+# the cat, sed and fixUpEnvFile.py that deployenv.sh put the docker env files
+# together with before generateEnvFiles.py
+OLD_CHAIN = r'''
+dcUTILS=$1; BASE_CUSTOMER_APP_UTILS_DIR=$2; ENV=$3; RUN_AS=$4
+CUSTOMER_APP_NAME=$5; BASE_CUSTOMER_DIR=$6; CUSTOMER_APP_UTILS=$7
+CUSTOMER_APP_WEB=$8; PYTHON=$9; OUT_DIR=${10}
+envDir=${BASE_CUSTOMER_APP_UTILS_DIR}/environments
+
+TEMP_FILE="${OUT_DIR}/.tmp-local.env"
+cp ${dcUTILS}/environments/common.env ${TEMP_FILE}
+echo "BASE_CUSTOMER_DIR=${BASE_CUSTOMER_DIR}"  >> ${TEMP_FILE}
+echo "CUSTOMER_APP_UTILS=${CUSTOMER_APP_UTILS}"  >> ${TEMP_FILE}
+echo "CUSTOMER_APP_WEB=${CUSTOMER_APP_WEB}" >> ${TEMP_FILE}
+echo "CUSTOMER_APP_ENV=${ENV}" >> ${TEMP_FILE}
+if [[ -e ${envDir}/common.env ]]; then
+    cat ${envDir}/common.env >> ${TEMP_FILE}
+fi
+if [[ -e ${envDir}/${ENV}.env ]]; then
+    cat ${envDir}/${ENV}.env >> ${TEMP_FILE}
+fi
+if [[ "${ENV}" == "local" ]]; then
+    if [[ -z ${RUN_AS} ]]; then
+        if [[ -e ${envDir}/personal.env ]]; then
+            cat ${envDir}/personal.env >> ${TEMP_FILE}
+        fi
+    else
+        cat ${envDir}/personal_${RUN_AS}.env >> ${TEMP_FILE}
+    fi
+fi
+
+tmpFile2=${TEMP_FILE}.2
+grep -v '^#' ${TEMP_FILE} | grep -v '^$' > ${tmpFile2}
+if [[ $? -eq 0 ]]; then
+    mv ${tmpFile2} ${TEMP_FILE}
+fi
+${PYTHON} ${dcUTILS}/scripts/fixUpEnvFile.py --inputFile ${TEMP_FILE} \
+    --outputFile ${tmpFile2}
+mv ${tmpFile2} ${TEMP_FILE}
+grep -q "dcDEFAULT_APP_NAME=__DEFAULT__" ${TEMP_FILE}
+if [[ $? -ne 1 ]]; then
+    sed -e "s/dcDEFAULT_APP_NAME=__DEFAULT__/dcDEFAULT_APP_NAME=${CUSTOMER_APP_NAME}/" \
+        ${TEMP_FILE} > ${tmpFile2}
+    mv ${tmpFile2} ${TEMP_FILE}
+fi
+
+mv ${TEMP_FILE} ${OUT_DIR}/dcEnv-${CUSTOMER_APP_NAME}-${ENV}.env
+sed -e 's/^/export /' ${OUT_DIR}/dcEnv-${CUSTOMER_APP_NAME}-${ENV}.env \
+    > ${OUT_DIR}/dcEnv-${CUSTOMER_APP_NAME}-${ENV}.sh
+'''
+# ==============================================================================
+
+
+class EnvLayersTest(unittest.TestCase):
+
+    def setUp(self):
+        """Make a dcUtils and an app utils directory to put the env files in."""
+        self.tmpDir = tempfile.mkdtemp(prefix="envlayers_test.")
+        self.dcUtilsDir = os.path.join(self.tmpDir, "dcUtils")
+        self.appUtilsDir = os.path.join(self.tmpDir, "myapp", "myapp-utils")
+        # the old chain runs fixUpEnvFile.py from $dcUTILS/scripts
+        os.makedirs(os.path.join(self.dcUtilsDir, "environments"))
+        os.symlink(os.path.abspath(SCRIPTS_DIR),
+                   os.path.join(self.dcUtilsDir, "scripts"))
+        os.makedirs(os.path.join(self.appUtilsDir, "environments",
+                                 ".generatedEnvFiles"))
+        self.writeFile(os.path.join(self.dcUtilsDir, "environments",
+                                    "common.env"), DCUTILS_COMMON_ENV)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def writeFile(self, aPath, text):
+        with open(aPath, 'wb') as aFile:
+            aFile.write(text.encode('utf-8'))
+        return aPath
+
+    def readFile(self, aPath):
+        with open(aPath, 'rb') as aFile:
+            return aFile.read().decode('utf-8')
+
+    def writeEnvFile(self, name, text):
+        return self.writeFile(os.path.join(self.appUtilsDir, "environments",
+                                           name), text)
+
+    def runScript(self, scriptName, *args):
+        """Run one of the scripts and return what it wrote to stderr."""
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(SCRIPTS_DIR, scriptName)] +
+            list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (out, err) = process.communicate()
+        self.assertEqual(process.returncode, 0, err)
+        return err.decode('utf-8')
+
+    def generateDockerFiles(self, env, runAs=None):
+        """Run generateEnvFiles.py the way deployenv.sh does for docker."""
+        args = ["--type", "docker", "--env", env, "--appName", "myapp",
+                "--appUtilsDir", self.appUtilsDir,
+                "--dcUtils", self.dcUtilsDir,
+                "--baseCustomerDir", self.tmpDir,
+                "--appUtils", "myapp-utils", "--appWeb", "myapp-web"]
+        if runAs:
+            args += ["--runAs", runAs]
+        err = self.runScript("generateEnvFiles.py", *args)
+
+        baseName = os.path.join(self.appUtilsDir, "environments",
+                                ".generatedEnvFiles", "dcEnv-myapp-" + env)
+        return (self.readFile(baseName + ".env"),
+                self.readFile(baseName + ".sh"), err)
+
+    def runOldChain(self, env, runAs=None):
+        """Put the docker env files together the way deployenv.sh used to."""
+        outDir = os.path.join(self.tmpDir, "old")
+        os.mkdir(outDir)
+        subprocess.check_call(
+            ["bash", "-c", OLD_CHAIN, "oldChain", self.dcUtilsDir,
+             self.appUtilsDir, env, runAs or "", "myapp", self.tmpDir,
+             "myapp-utils", "myapp-web", sys.executable, outDir])
+
+        baseName = os.path.join(outDir, "dcEnv-myapp-" + env)
+        return (self.readFile(baseName + ".env"),
+                self.readFile(baseName + ".sh"))
+
+    def test_findQuoteState(self):
+        self.assertIsNone(envlayers.findQuoteState('abc"', '"'))
+        self.assertEqual(envlayers.findQuoteState('abc', '"'), '"')
+        # only the quote the value started with closes it
+        self.assertEqual(envlayers.findQuoteState("ab\"c", "'"), "'")
+        self.assertIsNone(envlayers.findQuoteState("ab'c", "'"))
+        # a backslash only escapes in double quotes
+        self.assertEqual(envlayers.findQuoteState('ab\\"c', '"'), '"')
+        self.assertIsNone(envlayers.findQuoteState("ab\\'", "'"))
+
+    def test_iterLayerEntries(self):
+        aPath = self.writeEnvFile("dev.env", APP_COMMON_ENV + QUOTES_ENV)
+        with open(aPath, 'rb') as layerFile:
+            entries = [(key, length) for key, offset, length
+                       in envlayers.iterLayerEntries(layerFile, aPath)]
+
+        self.assertEqual(entries, [
+            ("LOG_LEVEL", len("LOG_LEVEL=debug\n")),
+            ("PASSWORD", len("PASSWORD=ab'cd\n")),
+            ("dcHOME", len("dcHOME=/home/dc\n")),
+            ("CERT", len(QUOTES_ENV.split("OPEN=")[0])),
+            ("OPEN", len("OPEN='abc\n")),
+            ("AFTER", len("AFTER=1\n")),
+            ("LOG_LEVEL", len("LOG_LEVEL=warn\n"))])
+
+    def test_streamingFixUp(self):
+        inputFile = self.writeFile(os.path.join(self.tmpDir, "in.env"),
+                                   DCUTILS_COMMON_ENV + APP_COMMON_ENV +
+                                   QUOTES_ENV)
+        outputFile = os.path.join(self.tmpDir, "out.env")
+        err = self.runScript("fixUpEnvFile.py", "--streaming",
+                             "--inputFile", inputFile,
+                             "--outputFile", outputFile)
+
+        self.assertEqual(self.readFile(outputFile), (
+            "dcHOME=/home/dc\n"
+            "dcDEFAULT_APP_NAME=__DEFAULT__\n"
+            "LOG_LEVEL=warn\n"
+            "PASSWORD=ab'cd\n"
+            'CERT="-----BEGIN CERTIFICATE-----\n'
+            "MIIBszCCAV2gAwIBAgIJAK\n"
+            '-----END CERTIFICATE-----"\n'
+            "OPEN='abc\n"
+            "AFTER=1\n"))
+        self.assertIn("the quote in the value of OPEN on line 12", err)
+        self.assertIn("line 13 is not KEY=VALUE", err)
+
+    def test_streamingFixUpWithoutDcHome(self):
+        inputFile = self.writeFile(os.path.join(self.tmpDir, "in.env"),
+                                   "B=2\nA=1\nB=3")
+        outputFile = os.path.join(self.tmpDir, "out.env")
+        self.runScript("fixUpEnvFile.py", "--streaming",
+                       "--inputFile", inputFile, "--outputFile", outputFile)
+
+        self.assertEqual(self.readFile(outputFile), "B=3\nA=1\n")
+
+    def test_generateDockerFiles(self):
+        self.writeEnvFile("common.env", APP_COMMON_ENV)
+        self.writeEnvFile("dev.env", QUOTES_ENV)
+        (envText, shText, err) = self.generateDockerFiles("dev")
+
+        entries = [
+            "dcHOME=/home/dc\n",
+            "dcDEFAULT_APP_NAME=myapp\n",
+            "LOG_LEVEL=warn\n",
+            "BASE_CUSTOMER_DIR=" + self.tmpDir + "\n",
+            "CUSTOMER_APP_UTILS=myapp-utils\n",
+            "CUSTOMER_APP_WEB=myapp-web\n",
+            "CUSTOMER_APP_ENV=dev\n",
+            "PASSWORD=ab'cd\n",
+            'CERT="-----BEGIN CERTIFICATE-----\n'
+            "MIIBszCCAV2gAwIBAgIJAK\n"
+            '-----END CERTIFICATE-----"\n',
+            "OPEN='abc\n",
+            "AFTER=1\n"]
+        self.assertEqual(envText, "".join(entries))
+        # the lines of a value that goes over more than one line aren't
+        # exported on their own
+        self.assertEqual(shText, "".join("export " + anEntry
+                                         for anEntry in entries))
+        self.assertIn("the quote in the value of OPEN on line 4", err)
+        self.assertIn("line 5 is not KEY=VALUE", err)
+
+    def test_generateDockerFilesWithoutDcHome(self):
+        self.writeEnvFile("dev.env", PLAIN_ENV)
+        (envText, shText, err) = self.generateDockerFiles("dev")
+
+        self.assertTrue(envText.startswith("dcDEFAULT_APP_NAME=myapp\n"))
+        self.assertNotIn("dcHOME", envText)
+
+    def test_sameAsOldChainForDev(self):
+        self.writeEnvFile("common.env", APP_COMMON_ENV)
+        self.writeEnvFile("dev.env", PLAIN_ENV)
+
+        self.assertEqual(self.generateDockerFiles("dev")[:2],
+                         self.runOldChain("dev"))
+
+    def test_sameAsOldChainForLocal(self):
+        self.writeEnvFile("common.env", APP_COMMON_ENV)
+        self.writeEnvFile("local.env", PLAIN_ENV)
+        self.writeEnvFile("personal.env", PERSONAL_ENV)
+
+        self.assertEqual(self.generateDockerFiles("local")[:2],
+                         self.runOldChain("local"))
+
+    def test_sameAsOldChainForLocalRunAs(self):
+        self.writeEnvFile("common.env", APP_COMMON_ENV)
+        self.writeEnvFile("local.env", PLAIN_ENV)
+        self.writeEnvFile("personal.env", PERSONAL_ENV)
+        self.writeEnvFile("personal_qa.env", "DEBUG=0\nQA=1\n")
+
+        self.assertEqual(self.generateDockerFiles("local", "qa")[:2],
+                         self.runOldChain("local", "qa"))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4